@@ -0,0 +1,30 @@
+"""
+Random distributions shared by the synthetic benchmark data
+"""
+
+import bisect
+import random
+from itertools import accumulate
+from typing import Callable, Sequence
+
+# rank r is picked with weight 1 / r ** 0.5, which gives the power law in-degrees (exponent 3)
+# of a preferential attachment graph: a long tail of popular users rather than a single hub
+POPULARITY_EXPONENT = 0.5
+
+
+def zipf_sampler(rng: random.Random, population: Sequence[int],
+                 exponent: float = POPULARITY_EXPONENT) -> Callable[[], int]:
+    """
+    Get a function that picks members of the population with Zipf distributed popularity.
+    Popularity ranks are shuffled, so the most popular members are not the lowest ids
+    """
+
+    ranked = list(population)
+    rng.shuffle(ranked)
+    cumulative = list(accumulate(1 / rank ** exponent for rank in range(1, len(ranked) + 1)))
+    total = cumulative[-1] if cumulative else 0
+
+    def sample() -> int:
+        return ranked[min(bisect.bisect_right(cumulative, rng.random() * total), len(ranked) - 1)]
+
+    return sample
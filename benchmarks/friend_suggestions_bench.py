@@ -0,0 +1,71 @@
+"""
+Benchmark friend suggestions on a synthetic friends graph
+
+Usage: python -m benchmarks.friend_suggestions_bench [--users 100000] [--edges 1000000] [--seed 7]
+"""
+
+import argparse
+import random
+import time
+
+from benchmarks.distributions import zipf_sampler
+from services.friend_suggestions import FriendGraph
+
+
+def synthetic_edges(users: int, edges: int, seed: int) -> list[tuple[int, int]]:
+    """
+    Generate distinct (follower_id, followed_id) pairs. Followers are uniform and the users
+    they follow have Zipf distributed popularity
+    """
+
+    rng = random.Random(seed)
+    popular = zipf_sampler(rng, range(users))
+    pairs = set()
+    while len(pairs) < edges:
+        follower_id = rng.randrange(users)
+        followed_id = popular()
+        if follower_id != followed_id:
+            pairs.add((follower_id, followed_id))
+    return list(pairs)
+
+
+def timed(label: str, fn, repeat: int = 1) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed:.3f}s total, {elapsed / repeat * 1000:.3f}ms each")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--edges", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--queries", type=int, default=10_000)
+    args = parser.parse_args()
+
+    edges = synthetic_edges(users=args.users, edges=args.edges, seed=args.seed)
+    rng = random.Random(args.seed)
+    sample = [rng.randrange(args.users) for _ in range(args.queries)]
+
+    graph = FriendGraph(cache_size=args.queries)
+    timed(f"load {len(edges)} edges", lambda: graph.load(edges))
+
+    queries = iter(sample * 3)
+    timed("suggestions, cold cache", lambda: graph.suggestions(next(queries)), repeat=args.queries)
+    timed("suggestions, warm cache", lambda: graph.suggestions(next(queries)), repeat=args.queries)
+
+    updates = rng.sample(edges, args.queries)
+
+    def churn() -> None:
+        for follower_id, followed_id in updates:
+            graph.remove_edge(follower_id=follower_id, followed_id=followed_id)
+            graph.add_edge(follower_id=follower_id, followed_id=followed_id)
+
+    timed(f"remove + re-add {len(updates)} edges", churn)
+    timed("suggestions after churn", lambda: graph.suggestions(next(queries)), repeat=args.queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Generate a large synthetic dataset directly into the database for benchmarks and load tests
+
+Usage: python -m benchmarks.generate_dataset [--users 1000000] [--xp-rows 50000000]
+       [--friends 10000000] [--units 500] [--lessons 10000] [--questions 100000]
+       [--signs 2000] [--seed 7] [--chunk-size 5000]
+
+The same seed against the same starting database always produces the same rows. New ids
+start after the largest id already in each table, so the dataset can be added to a database
+that was seeded from testing_data.json. Rows are written with the chunked executemany
+INSERTs of init_database.py, and the totals, streaks, friend counts, search index and sign
+usage index are recomputed from them at the end. Every generated user's password is
+"signable", and the first generated user is an admin. Activity is skewed the way real usage is: a few users earn most of the xp and
+have most of the friends, and xp comes in streaks of consecutive days.
+"""
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from typing import Iterable, Iterator
+
+from passlib.hash import bcrypt
+from sqlalchemy import func, update
+from sqlmodel import Session, SQLModel, select
+
+from benchmarks.distributions import zipf_sampler
+from database import create_database, engine
+from entities.database_entities import (
+    CameraQuestions,
+    CameraQuestionsInLesson,
+    FillInTheBlankQuestions,
+    FillInTheBlankQuestionsInLesson,
+    Friends,
+    LessonType,
+    Lessons,
+    LessonsInUnit,
+    MatchingQuestions,
+    MatchingQuestionsInLesson,
+    MultipleChoiceQuestions,
+    MultipleChoiceQuestionsInLesson,
+    Signs,
+    Units,
+    UserXP,
+    Users,
+    WatchToLearnQuestions,
+    WatchToLearnQuestionsInLesson,
+)
+from init_database import DEFAULT_PASSWORD, SEED_CHUNK_SIZE, refresh_derived_data, seed_table
+
+
+TODAY = date(2025, 1, 1) # fixed so a seed always generates the same days
+HISTORY_DAYS = 730
+LESSON_XP_AMOUNT = 10
+
+question_links = {
+    WatchToLearnQuestions: WatchToLearnQuestionsInLesson,
+    CameraQuestions: CameraQuestionsInLesson,
+    MultipleChoiceQuestions: MultipleChoiceQuestionsInLesson,
+    FillInTheBlankQuestions: FillInTheBlankQuestionsInLesson,
+    MatchingQuestions: MatchingQuestionsInLesson,
+}
+
+
+def next_id(session: Session, column) -> int:
+    return (session.exec(select(func.max(column))).one() or 0) + 1
+
+
+def skewed(rng: random.Random, mean: float, limit: int) -> int:
+    """
+    A count with the given mean and a long tail, capped at limit
+    """
+
+    if mean <= 0:
+        return 0
+    return min(limit, int(rng.expovariate(1 / mean) * rng.paretovariate(3) * 2 / 3))
+
+
+def users(rng: random.Random, first_id: int, count: int, lessons: int) -> Iterator[dict]:
+    for user_id in range(first_id, first_id + count):
+        yield {
+            "user_id": user_id,
+            "username": f"learner{user_id}",
+            "email": f"learner{user_id}@example.com",
+            "first_name": rng.choice(["Alex", "Sam", "Jordan", "Riley", "Casey", "Morgan", "Taylor", "Jamie"]),
+            "last_name": rng.choice(["Lee", "Garcia", "Nguyen", "Smith", "Kim", "Patel", "Brown", "Lopez"]),
+            "password": "", # replaced with the shared hash
+            "created_at": TODAY - timedelta(days=rng.randrange(HISTORY_DAYS)),
+            "unit_progress": rng.randrange(max(1, lessons // 20)),
+            "lesson_index": rng.randrange(1, 21),
+            "is_admin": user_id == first_id,
+        }
+
+
+def user_xp(rng: random.Random, first_user: int, user_count: int, rows: int) -> Iterator[dict]:
+    """
+    About rows (user_id, day, xp) rows, in streaks of consecutive days
+    """
+
+    mean = rows / user_count if user_count else 0
+    for user_id in range(first_user, first_user + user_count):
+        days = skewed(rng, mean, HISTORY_DAYS)
+        day = TODAY - timedelta(days=rng.randrange(days, HISTORY_DAYS + 1)) if days else TODAY
+        seen = set()
+        while len(seen) < days:
+            for _ in range(min(days - len(seen), 1 + int(rng.expovariate(1 / 6)))):
+                if day not in seen and day <= TODAY:
+                    seen.add(day)
+                    yield {"user_id": user_id, "day": day, "xp": LESSON_XP_AMOUNT * rng.randint(1, 5)}
+                day += timedelta(days=1)
+            day += timedelta(days=rng.randint(1, 5))
+            if day > TODAY:
+                day = TODAY - timedelta(days=rng.randrange(HISTORY_DAYS))
+
+
+def friends(rng: random.Random, first_user: int, user_count: int, edges: int) -> Iterator[dict]:
+    """
+    About edges distinct (follower_id, followed_id) pairs. Who is followed has Zipf
+    distributed popularity
+    """
+
+    mean = edges / user_count if user_count else 0
+    popular = zipf_sampler(rng, range(first_user, first_user + user_count))
+    for follower_id in range(first_user, first_user + user_count):
+        followed = set()
+        for _ in range(skewed(rng, mean, user_count - 1)):
+            followed_id = popular()
+            if followed_id != follower_id:
+                followed.add(followed_id)
+        for followed_id in sorted(followed):
+            yield {"follower_id": follower_id, "followed_id": followed_id}
+
+
+def signs(first_sign: int, count: int) -> list[str]:
+    return [f"sign{number:06d}" for number in range(first_sign, first_sign + count)]
+
+
+def units(first_id: int, count: int) -> Iterator[dict]:
+    for unit_id in range(first_id, first_id + count):
+        yield {"unit_id": unit_id, "title": f"Unit {unit_id}", "description": f"Generated unit {unit_id}"}
+
+
+def lessons(rng: random.Random, first_id: int, count: int) -> Iterator[dict]:
+    lesson_types = list(LessonType)
+    for lesson_id in range(first_id, first_id + count):
+        yield {"lesson_id": lesson_id, "title": f"Lesson {lesson_id}", "lesson_type": rng.choice(lesson_types)}
+
+
+def lessons_in_units(first_unit: int, unit_count: int, first_lesson: int, lesson_count: int) -> Iterator[dict]:
+    """
+    Split the lessons into consecutive runs, one run per unit
+    """
+
+    for offset in range(lesson_count):
+        unit_offset = offset * unit_count // lesson_count
+        first_in_unit = -(-unit_offset * lesson_count // unit_count)
+        yield {
+            "unit_id": first_unit + unit_offset,
+            "lesson_id": first_lesson + offset,
+            "lesson_index": offset - first_in_unit + 1,
+        }
+
+
+def questions(rng: random.Random, model: type[SQLModel], first_id: int, count: int, sign_names: list[str]) -> Iterator[dict]:
+    for question_id in range(first_id, first_id + count):
+        row = {"question_id": question_id, "question_type": model.model_fields["question_type"].default}
+        if model in (WatchToLearnQuestions, CameraQuestions):
+            sign = rng.choice(sign_names)
+            row.update(text=f"Sign {sign}", sign=sign, starting_position=rng.choice(sign_names),
+                       num_hands=rng.randint(1, 2), motion=rng.random() < 0.3)
+        elif model is MultipleChoiceQuestions:
+            options = rng.sample(sign_names, 4)
+            row.update(text="Which one is this sign?", option_1=options[0], option_2=options[1],
+                       option_3=options[2], option_4=options[3], answer=rng.choice(options))
+        elif model is FillInTheBlankQuestions:
+            answer = rng.choice(sign_names)
+            row.update(text="What is this sign?", image_path=f"images/{answer}.png", answer=answer)
+        else:
+            row.update(text="Match the signs", pairs="." + ".".join(rng.sample(sign_names, 4)) + ".")
+        yield row
+
+
+def question_links_rows(rng: random.Random, first_question: int, count: int, first_lesson: int,
+                        lesson_count: int) -> Iterator[dict]:
+    """
+    Put every question in one to three lessons
+    """
+
+    for question_id in range(first_question, first_question + count):
+        for lesson_id in sorted(set(first_lesson + rng.randrange(lesson_count) for _ in range(rng.randint(1, 3)))):
+            yield {"lesson_id": lesson_id, "question_id": question_id}
+
+
+def count_lessons_and_questions(session: Session, first_unit: int, first_lesson: int) -> None:
+    """
+    Set lesson_count on the generated units and question_count on the generated lessons,
+    which the admin routes keep up to date but bulk inserts do not
+    """
+
+    lesson_count = select(func.count(LessonsInUnit.lesson_id)) \
+        .where(LessonsInUnit.unit_id == Units.unit_id) \
+        .scalar_subquery()
+    session.exec(update(Units).where(Units.unit_id >= first_unit).values(lesson_count=lesson_count))
+
+    question_count = sum(
+        select(func.count(link_model.question_id)).where(link_model.lesson_id == Lessons.lesson_id).scalar_subquery()
+        for link_model in question_links.values()
+    )
+    session.exec(update(Lessons).where(Lessons.lesson_id >= first_lesson).values(question_count=question_count))
+    session.commit()
+
+
+def timed_write(session: Session, model: type[SQLModel], rows: Iterable[dict], password_hash: str,
+                chunk_size: int) -> None:
+    started = time.perf_counter()
+    written = seed_table(session, model, rows, password_hash, chunk_size, replace=False)
+    elapsed = time.perf_counter() - started
+    print(f"{model.__tablename__}: {written} rows in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} rows/sec)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset into the database")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--xp-rows", type=int, default=50_000_000)
+    parser.add_argument("--friends", type=int, default=10_000_000)
+    parser.add_argument("--units", type=int, default=500)
+    parser.add_argument("--lessons", type=int, default=10_000)
+    parser.add_argument("--questions", type=int, default=100_000, help="split evenly across the five question types")
+    parser.add_argument("--signs", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.signs < 4:
+        parser.error("--signs must be at least 4")
+    if args.lessons and args.lessons < args.units:
+        parser.error("--lessons must be at least --units")
+
+    create_database()
+    started = time.perf_counter()
+    password_hash = bcrypt.hash(DEFAULT_PASSWORD)
+
+    with Session(engine) as session:
+        first_user = next_id(session, Users.user_id)
+        first_unit = next_id(session, Units.unit_id)
+        first_lesson = next_id(session, Lessons.lesson_id)
+        first_questions = {model: next_id(session, model.question_id) for model in question_links}
+        sign_names = signs(session.exec(select(func.count(Signs.sign))).one(), args.signs)
+
+        # a separate stream per table, so changing one size does not change the others
+        streams = {name: random.Random(f"{args.seed}-{name}") for name in
+                   ["users", "xp", "friends", "lessons", "questions", "links"]}
+
+        def write(model, rows):
+            timed_write(session, model, rows, password_hash, args.chunk_size)
+
+        write(Users, users(streams["users"], first_user, args.users, args.lessons))
+        write(UserXP, user_xp(streams["xp"], first_user, args.users, args.xp_rows))
+        write(Friends, friends(streams["friends"], first_user, args.users, args.friends))
+
+        write(Signs, ({"sign": sign, "image_path": f"images/{sign}.png"} for sign in sign_names))
+        write(Units, units(first_unit, args.units))
+        write(Lessons, lessons(streams["lessons"], first_lesson, args.lessons))
+        if args.units and args.lessons:
+            write(LessonsInUnit, lessons_in_units(first_unit, args.units, first_lesson, args.lessons))
+
+        for position, (model, link_model) in enumerate(question_links.items()):
+            count = args.questions // 5 + (position < args.questions % 5)
+            write(model, questions(streams["questions"], model, first_questions[model], count, sign_names))
+            if args.lessons:
+                write(link_model, question_links_rows(streams["links"], first_questions[model], count,
+                                                      first_lesson, args.lessons))
+
+        refresh_started = time.perf_counter()
+        count_lessons_and_questions(session, first_unit, first_lesson)
+        refresh_derived_data(session, seeded={name: None for name in ["users", "xp", "friends", "signs", "lessons"]})
+        print(f"recomputed totals, streaks, counts and indexes in {time.perf_counter() - refresh_started:.1f}s")
+
+    print(f"generated the dataset in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
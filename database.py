@@ -1,9 +1,11 @@
 import os
-from typing import List, Optional
+from typing import Iterable, List, Optional
 
-from datetime import date
+from datetime import date, timedelta
 from typing import List, Optional
-from sqlalchemy import func, text
+from sqlalchemy import bindparam, case, delete, func, insert, inspect, or_, text, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.schema import CreateColumn
 from sqlmodel import (
     Session, 
     SQLModel,
@@ -23,9 +25,14 @@ from entities.lesson_entities import (
     UpdateLessonInUnit,
     UpdateQuestionInLesson,
     UpdateSign, 
+    UpdateUnitLessons,
 )
 
-from entities.user_entities import ProgressUpdate, XpResponse, UserRegistration, UserUpdate
+from entities.user_entities import FriendOutcome, ProgressUpdate, XpResponse, UserRegistration, UserUpdate
+from services import question_search, sign_usage
+from services.sign_vocabulary import sign_vocabulary
+from services.streaks import active_streak, advance_streak
+from services.token_versions import token_versions
 from entities.database_entities import (
     QuestionType,
     UserXP,
@@ -34,6 +41,7 @@ from entities.database_entities import (
     Units,
     Lessons,
     LessonsInUnit,
+    RecognizersInLessons,
 
     CameraQuestions,
     CameraQuestionsInLesson,
@@ -69,8 +77,111 @@ engine = create_engine(
 )
 
 
+def _backfill_streaks(conn) -> None:
+    """
+    Compute every user's current and longest streak from their xp history
+    """
+
+    user_xp = UserXP.__table__
+    users = Users.__table__
+
+    history = conn.execution_options(stream_results=True, yield_per=10_000).execute(
+        select(user_xp.c.user_id, user_xp.c.day).order_by(user_xp.c.user_id, user_xp.c.day)
+    )
+
+    streaks = {}
+    for user_id, day in history:
+        current, longest, last_day = streaks.get(user_id, (0, 0, None))
+        streaks[user_id] = (*advance_streak(current, longest, last_day, day), day)
+
+    if streaks:
+        conn.execute(
+            update(users)
+            .where(users.c.user_id == bindparam("b_user_id"))
+            .values(current_streak=bindparam("b_current"), longest_streak=bindparam("b_longest")),
+            [{"b_user_id": user_id, "b_current": current, "b_longest": longest}
+             for user_id, (current, longest, _) in streaks.items()],
+        )
+
+
+# Columns added to existing tables after they were first created, mapped to the
+# statement (or function of a connection) that fills them in for rows that already exist
+column_backfills = {
+    ("users", "total_xp"): """
+        UPDATE users SET total_xp = (
+            SELECT COALESCE(SUM(user_xp.xp), 0) FROM user_xp WHERE user_xp.user_id = users.user_id
+        )
+    """,
+    ("users", "last_xp_day"): """
+        UPDATE users SET last_xp_day = (
+            SELECT MAX(user_xp.day) FROM user_xp WHERE user_xp.user_id = users.user_id
+        )
+    """,
+    ("users", "current_streak"): _backfill_streaks, # also fills longest_streak
+    ("users", "follower_count"): """
+        UPDATE users SET follower_count = (
+            SELECT COUNT(*) FROM friends WHERE friends.followed_id = users.user_id
+        )
+    """,
+    ("users", "following_count"): """
+        UPDATE users SET following_count = (
+            SELECT COUNT(*) FROM friends WHERE friends.follower_id = users.user_id
+        )
+    """,
+}
+
+
 def create_database():
     SQLModel.metadata.create_all(engine)
+    _upgrade_schema()
+    question_search.create_search_index(engine)
+    sign_usage.create_sign_usage_index(engine)
+
+
+def _upgrade_schema():
+    """
+    create_all only creates missing tables. Add the columns and indexes introduced 
+    after an existing table was created, and backfill the new columns
+    """
+
+    inspector = inspect(engine)
+
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            added_columns = [column for column in table.columns if column.name not in existing_columns]
+
+            for column in added_columns:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column)}"))
+
+            # backfill once every new column exists, since a backfill may fill several columns
+            for column in added_columns:
+                backfill = column_backfills.get((table.name, column.name))
+                if callable(backfill):
+                    backfill(conn)
+                elif backfill:
+                    conn.execute(text(backfill))
+
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+
+
+def _column_ddl(column) -> str:
+    """
+    Column definition for ALTER TABLE ADD COLUMN. Python-side scalar defaults are
+    included so NOT NULL columns can be added to tables that already have rows
+    """
+
+    ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar and default.arg is not None:
+        to_literal = column.type.literal_processor(dialect=engine.dialect)
+        ddl += f" DEFAULT {to_literal(default.arg)}"
+
+    return ddl
 
 
 def get_session():
@@ -216,6 +327,27 @@ def reset_password(session: Session, username: str, password: str) -> Users:
         return user
 
 
+def set_admin(session: Session, user_id: int, is_admin: bool) -> Users:
+    """
+    Promote a user to admin or demote them. A change invalidates every access token the
+    user was issued before it
+
+    :raises EntityNotFoundException: No such User id
+    """
+
+    user = get_user_by_id(session, user_id)
+    if user.is_admin != is_admin:
+        user.is_admin = is_admin
+        user.token_version += 1
+        session.add(user)
+        session.commit()
+        session.refresh(user)
+
+        token_versions.set(user.user_id, user.token_version)
+
+    return user
+
+
 def get_authenticated_user(session: Session, username: str) -> Users:
     # Query the database to see if there is any user with the provided username
     user = session.exec(select(Users).where(Users.username == username)).first()
@@ -225,63 +357,266 @@ def get_authenticated_user(session: Session, username: str) -> Users:
     return user
 
 
-def search_for_new_friends(user_id: int, search_query: str, session: Session) -> List[Users]:
-    searched_friends = session.exec(select(Users).where(Users.username.startswith(search_query))).all()
-    return searched_friends
+def search_for_new_friends(user_id: int, search_query: str, session: Session,
+                           limit: int = 20, cursor: Optional[str] = None) -> List[tuple]:
+    """
+    Find users whose username starts with a given prefix, leaving out the user and their existing friends
+
+    Prefix matching is done as a username range so the username index is used, and
+    results are paged by username
+
+    :param search_query: The username prefix
+    :param limit: The maximum number of users to return
+    :param cursor: The last username of the previous page
+    :return: (user_id, username, first_name, last_name) rows in username order
+    """
+
+    friend_ids = select(Friends.follower_id).where(Friends.followed_id == user_id)
+
+    query = select(Users.user_id, Users.username, Users.first_name, Users.last_name) \
+    .where(Users.username >= search_query) \
+    .where(Users.user_id != user_id) \
+    .where(Users.user_id.not_in(friend_ids)) \
+    .order_by(Users.username) \
+    .limit(limit)
+
+    upper_bound = _prefix_upper_bound(search_query)
+    if upper_bound is not None:
+        query = query.where(Users.username < upper_bound)
+    if cursor is not None:
+        query = query.where(Users.username > cursor)
+
+    return session.exec(query).all()
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """
+    Get the smallest string greater than every string starting with prefix, or None if there is none
+    """
+
+    prefix = prefix.rstrip(chr(0x10FFFF))
+    if not prefix:
+        return None
+
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
 def add_friend(user_id: int, new_friend_id: int, session: Session ) -> Users:
-    user = get_user_by_id(session, user_id)
-    # curr_friends = get_followers_by_id(session, user_id)
-    
+    """
+    Add a friend to a user. Adding an existing friend again does nothing
+
+    :raises EntityNotFoundException: No such User id or friend id
+    """
+
     if new_friend_id == user_id:
         raise ValueError("You cannot add yourself as a friend")
-    
-    new = Friends(
-        follower_id=new_friend_id,
-        followed_id=user_id    
-    )    
-    session.add(new)
-    
-    try:
-        session.commit()
-        # session.refresh(new)
-    except Exception as e:
-        session.rollback()  # Roll back the transaction
-        print("Commit failed:", e) #Faling here, not adding new user to database
-        return user
-    return user
+
+    outcomes = update_friends(session=session, user_id=user_id, add_ids=[new_friend_id])
+    if outcomes[new_friend_id] == FriendOutcome.NOT_FOUND:
+        raise EntityNotFoundException(entity_name="User", entity_id=new_friend_id)
+
+    return get_user_by_id(session, user_id)
 
 
 def delete_friend(user_id: int, old_friend_id: int, session: Session ) -> Users:
         removed_friend = get_user_by_id(session, old_friend_id)
         remove_friend = session.exec(select(Friends).where(Friends.followed_id == user_id).where(Friends.follower_id == old_friend_id)).first()
+        if remove_friend is None:
+            raise UnrelatedEntitiesException(first_name="User", first_id=user_id,
+                                             second_name="Friend", second_id=old_friend_id)
+
         session.delete(remove_friend)
+        _adjust_friend_counts(session=session, followed_id=user_id, follower_ids=[old_friend_id], delta=-1)
         session.commit()
         return removed_friend
 
 
-def get_followers_by_id(session: Session, user_id: int) -> List[Users]:
+def update_friends(session: Session, user_id: int, add_ids: List[int] = (),
+                   remove_ids: List[int] = ()) -> dict[int, FriendOutcome]:
+    """
+    Add and remove many friends of a user in one transaction. Adding an existing friend
+    or removing a non-friend does nothing, so repeating a request is safe
+
+    :param add_ids: Ids of the users to add as friends
+    :param remove_ids: Ids of the friends to remove
+    :raises EntityNotFoundException: No such User id
+    :raises InvalidRequestExcpetion: An id is both added and removed
+    :return: The outcome for every requested id
+    """
+
+    get_user_by_id(session, user_id)
+
+    add_ids, remove_ids = set(add_ids), set(remove_ids)
+    if add_ids & remove_ids:
+        raise InvalidRequestExcpetion(entity_name="Friends", msg="A user cannot be both added and removed")
+
+    requested = add_ids | remove_ids
+    outcomes = {friend_id: FriendOutcome.INVALID for friend_id in requested if friend_id == user_id}
+    requested -= outcomes.keys()
+
+    # one query each to validate the ids and find which are already friends
+    existing_ids = set(session.exec(select(Users.user_id).where(Users.user_id.in_(requested))).all()) \
+        if requested else set()
+    friend_ids = set(session.exec(
+        select(Friends.follower_id)
+        .where(Friends.followed_id == user_id)
+        .where(Friends.follower_id.in_(existing_ids))
+    ).all()) if existing_ids else set()
+
+    outcomes.update({friend_id: FriendOutcome.NOT_FOUND for friend_id in requested - existing_ids})
+
+    to_add = sorted((add_ids & existing_ids) - friend_ids)
+    to_remove = sorted(remove_ids & friend_ids)
+    outcomes.update({friend_id: FriendOutcome.ALREADY_FRIENDS for friend_id in add_ids & friend_ids})
+    outcomes.update({friend_id: FriendOutcome.NOT_FRIENDS for friend_id in (remove_ids & existing_ids) - friend_ids})
+
+    added = _insert_friends(session=session, user_id=user_id, follower_ids=to_add)
+    removed = _delete_friends(session=session, user_id=user_id, follower_ids=to_remove)
+
+    # rows added or removed by a concurrent request between the check and the write
+    outcomes.update({friend_id: FriendOutcome.ALREADY_FRIENDS for friend_id in set(to_add) - set(added)})
+    outcomes.update({friend_id: FriendOutcome.NOT_FRIENDS for friend_id in set(to_remove) - set(removed)})
+    outcomes.update({friend_id: FriendOutcome.ADDED for friend_id in added})
+    outcomes.update({friend_id: FriendOutcome.REMOVED for friend_id in removed})
+
+    _adjust_friend_counts(session=session, followed_id=user_id, follower_ids=added, delta=1)
+    _adjust_friend_counts(session=session, followed_id=user_id, follower_ids=removed, delta=-1)
+    session.commit()
+
+    return outcomes
+
+
+def _insert_friends(session: Session, user_id: int, follower_ids: List[int]) -> List[int]:
     """
-    Get a all followers of a given User from the database by user id
+    Insert friends rows in a single statement, skipping rows that already exist. Does not commit
+
+    :return: The follower ids that were inserted
+    """
+
+    if not follower_ids:
+        return []
+
+    friends = Friends.__table__
+    dialect = session.get_bind().dialect
+    rows = [{"follower_id": follower_id, "followed_id": user_id} for follower_id in follower_ids]
+
+    if dialect.name == "mysql":
+        insert = mysql.insert(friends).prefix_with("IGNORE")
+    else:
+        insert = (postgresql.insert if dialect.name == "postgresql" else sqlite.insert)(friends) \
+        .on_conflict_do_nothing(index_elements=[friends.c.follower_id, friends.c.followed_id])
+
+    insert = insert.values(rows)
+
+    if dialect.insert_returning:
+        return session.exec(insert.returning(friends.c.follower_id)).scalars().all()
+
+    # without RETURNING the rows checked beforehand are assumed to have been inserted
+    session.exec(insert)
+    return list(follower_ids)
+
+
+def _delete_friends(session: Session, user_id: int, follower_ids: List[int]) -> List[int]:
+    """
+    Delete friends rows in a single statement. Does not commit
+
+    :return: The follower ids that were deleted
+    """
+
+    if not follower_ids:
+        return []
+
+    friends = Friends.__table__
+    delete_friends = delete(friends) \
+    .where(friends.c.followed_id == user_id) \
+    .where(friends.c.follower_id.in_(follower_ids))
+
+    if session.get_bind().dialect.delete_returning:
+        return session.exec(delete_friends.returning(friends.c.follower_id)).scalars().all()
+
+    session.exec(delete_friends)
+    return list(follower_ids)
+
+
+def _adjust_friend_counts(session: Session, followed_id: int, follower_ids: List[int], delta: int) -> None:
+    """
+    Keep the denormalized follower/following counts in step with friends rows of one followed
+    user being added (delta=1) or removed (delta=-1). Does not commit
+    """
+
+    if not follower_ids:
+        return
+
+    session.exec(
+        update(Users)
+        .where(Users.user_id == followed_id)
+        .values(follower_count=Users.follower_count + delta * len(follower_ids))
+    )
+    session.exec(
+        update(Users)
+        .where(Users.user_id.in_(follower_ids))
+        .values(following_count=Users.following_count + delta)
+    )
+
+
+def get_followers_by_id(session: Session, user_id: int, limit: int = 50, after: Optional[int] = None) -> List[tuple]:
+    """
+    Get a page of the followers of a given User, ordered by user id
 
     :param user_id: The id of the requested User
-    :return: A list of all Users following the given User
+    :param limit: The maximum number of followers to return
+    :param after: The last follower id of the previous page
+    :return: (user_id, username, first_name, last_name) rows of Users following the given User
     """
 
-     # Select follower ids
-    get_follower_ids = select(Friends.follower_id).where(Friends.followed_id == user_id)
+    query = select(Users.user_id, Users.username, Users.first_name, Users.last_name) \
+    .join(Friends, Friends.follower_id == Users.user_id) \
+    .where(Friends.followed_id == user_id) \
+    .order_by(Friends.follower_id) \
+    .limit(limit)
 
-    # Fetch follower ids
-    follower_ids = [follower_id for (follower_id) in session.exec(get_follower_ids)]
+    if after is not None:
+        query = query.where(Friends.follower_id > after)
 
-    # Select followers based on follower ids
-    get_followers = select(Users).where(Users.user_id.in_(follower_ids))
+    return session.exec(query).all()
 
-    # Fetch followers
-    followers = session.exec(get_followers).all()
-    
-    return followers
+
+def get_friend_ids(session: Session, user_id: int) -> List[int]:
+    """
+    Get the ids of a user's friends (the users following them)
+    """
+
+    return session.exec(select(Friends.follower_id).where(Friends.followed_id == user_id)).all()
+
+
+def get_user_summaries(session: Session, user_ids: List[int]) -> dict[int, tuple]:
+    """
+    Get the public profile fields of a set of users in a single query
+
+    :return: A map of user id to (user_id, username, first_name, last_name). Unknown ids are left out
+    """
+
+    if not user_ids:
+        return {}
+
+    rows = session.exec(
+        select(Users.user_id, Users.username, Users.first_name, Users.last_name).where(Users.user_id.in_(user_ids))
+    ).all()
+    return {row[0]: tuple(row) for row in rows}
+
+
+def get_usernames(session: Session, user_ids: List[int]) -> dict[int, str]:
+    """
+    Get the usernames of a set of users in a single query
+
+    :return: A map of user id to username. Unknown ids are left out
+    """
+
+    if not user_ids:
+        return {}
+
+    rows = session.exec(select(Users.user_id, Users.username).where(Users.user_id.in_(user_ids))).all()
+    return {user_id: username for user_id, username in rows}
 
 
 def update_user_progress(session: Session, user: Users, details: ProgressUpdate) -> bool:
@@ -319,60 +654,166 @@ def get_user_xp(session: Session, user: Users) -> XpResponse:
 
     user = get_user_by_id(session=session, user_id=user.user_id)
     
-    daily_xp_q = select(UserXP).where(UserXP.user_id == user.user_id).where(UserXP.day == date.today())
-    daily_xp = session.exec(daily_xp_q).all()
-
-    if daily_xp:
-        daily_xp_amt = daily_xp[0].xp
-    else:
-        daily_xp_amt = 0
-
-    total_xp_q = select(UserXP.xp).where(UserXP.user_id == user.user_id)
-    total_xp = sum(session.exec(total_xp_q).all())
+    daily_xp = session.exec(
+        select(UserXP.xp).where(UserXP.user_id == user.user_id).where(UserXP.day == date.today())
+    ).first()
 
     return XpResponse(
         user_id=user.user_id,
-        daily_xp=daily_xp_amt,
-        total_xp=total_xp,
+        daily_xp=daily_xp or 0,
+        total_xp=user.total_xp,
+        current_streak=active_streak(user.current_streak, user.last_xp_day, date.today()),
+        longest_streak=user.longest_streak,
     )
 
 
 def update_user_xp(session: Session, user: Users, amount: int) -> XpResponse:
     """
     Update a user's daily xp. Respond with the current daily xp total and all-time total
+
+    Both rows are incremented in the database rather than read, modified and written back,
+    so concurrent updates for the same user are never lost
     """
 
-    # make sure user exists
-    user = get_user_by_id(session=session, user_id=user.user_id)
+    today = date.today()
+    dialect = session.get_bind().dialect
 
-    daily_xp_q = select(UserXP).where(UserXP.user_id == user.user_id).where(UserXP.day == date.today())
-    daily_xp = session.exec(daily_xp_q).all()
+    # the user row is locked first, which also serializes the daily upsert for this user
+    total_xp, current_streak, longest_streak = _add_user_xp_totals(
+        session=session, user_id=user.user_id, day=today, amount=amount
+    )
 
-    if daily_xp:
-        daily_xp[0].xp += amount
-        amount = daily_xp[0].xp
-        session.add(daily_xp[0])
-        session.commit()
-        session.refresh(daily_xp[0])
-    else:
-        user.days_logged += 1
-        todays_xp = UserXP(
-            user_id=user.user_id,
-            xp=amount,
-        )
-        session.add(user)
-        session.add(todays_xp)
-        session.commit()
-        session.refresh(user)
+    daily_xp_upsert = _xp_upsert(session).values(user_id=user.user_id, day=today, xp=amount)
 
+    if dialect.insert_returning:
+        daily_xp = session.exec(daily_xp_upsert.returning(UserXP.__table__.c.xp)).scalar_one()
+    else:
+        session.exec(daily_xp_upsert)
+        daily_xp = session.exec(
+            select(UserXP.xp).where(UserXP.user_id == user.user_id).where(UserXP.day == today)
+        ).one()
 
-    total_xp_q = select(UserXP.xp).where(UserXP.user_id == user.user_id)
-    total_xp = sum(session.exec(total_xp_q).all())
+    session.commit()
 
     return XpResponse(
         user_id=user.user_id,
-        daily_xp=amount,
+        daily_xp=daily_xp,
         total_xp=total_xp,
+        current_streak=current_streak,
+        longest_streak=longest_streak,
+    )
+
+
+def add_xp_batch(session: Session, increments: dict[tuple[int, date], int]) -> None:
+    """
+    Apply many xp increments at once with one batched upsert into user_xp and one
+    batched update of the users' running totals. Does not commit
+
+    :param increments: xp to add, keyed by (user_id, day)
+    """
+
+    if not increments:
+        return
+
+    # days are applied in order so days_logged counts each new day exactly once
+    ordered = sorted(increments.items(), key=lambda item: (item[0][1], item[0][0]))
+
+    session.exec(
+        _xp_upsert(session),
+        params=[{"user_id": user_id, "day": day, "xp": amount} for (user_id, day), amount in ordered],
+    )
+    session.exec(
+        _user_xp_totals_update(),
+        params=[_user_xp_totals_params(user_id=user_id, day=day, amount=amount) for (user_id, day), amount in ordered],
+    )
+
+
+def _add_user_xp_totals(session: Session, user_id: int, day: date, amount: int) -> tuple[int, int, int]:
+    """
+    Add to a user's running xp total, counting the day as logged and advancing the user's
+    streak if it is the user's first xp that day. Does not commit
+
+    :return: The user's new total xp, current streak and longest streak
+    :raises EntityNotFoundException: No such User id
+    """
+
+    users = Users.__table__
+    user_update = _user_xp_totals_update()
+    params = _user_xp_totals_params(user_id=user_id, day=day, amount=amount)
+    totals = select(users.c.total_xp, users.c.current_streak, users.c.longest_streak) \
+    .where(users.c.user_id == user_id)
+
+    if session.get_bind().dialect.update_returning:
+        row = session.exec(
+            user_update.returning(users.c.total_xp, users.c.current_streak, users.c.longest_streak),
+            params=params,
+        ).one_or_none()
+    else:
+        result = session.exec(user_update, params=params)
+        row = None if result.rowcount == 0 else session.exec(totals).one()
+
+    if row is None:
+        raise EntityNotFoundException(entity_name="User", entity_id=user_id)
+
+    return tuple(row)
+
+
+def _user_xp_totals_params(user_id: int, day: date, amount: int) -> dict:
+    return {"b_user_id": user_id, "b_day": day, "b_yesterday": day - timedelta(days=1), "b_amount": amount}
+
+
+def _user_xp_totals_update():
+    """
+    UPDATE of a user's running xp totals and streak, bound by b_user_id, b_day, b_yesterday and b_amount
+    """
+
+    users = Users.__table__
+    day = bindparam("b_day", type_=users.c.last_xp_day.type)
+    yesterday = bindparam("b_yesterday", type_=users.c.last_xp_day.type)
+
+    is_new_day = or_(users.c.last_xp_day.is_(None), users.c.last_xp_day < day)
+    current_streak = case(
+        (users.c.last_xp_day >= day, users.c.current_streak),
+        (users.c.last_xp_day == yesterday, users.c.current_streak + 1),
+        else_=1,
+    )
+    longest_streak = case(
+        (current_streak > users.c.longest_streak, current_streak),
+        else_=users.c.longest_streak,
+    )
+
+    # MySQL evaluates SET assignments left to right against the already updated values,
+    # so every assignment below may only depend on columns assigned after it
+    return update(users) \
+    .where(users.c.user_id == bindparam("b_user_id")) \
+    .ordered_values(
+        (users.c.total_xp, users.c.total_xp + bindparam("b_amount")),
+        (users.c.days_logged, users.c.days_logged + case((is_new_day, 1), else_=0)),
+        (users.c.longest_streak, longest_streak),
+        (users.c.current_streak, current_streak),
+        # a late batch for an earlier day, e.g. flushed by another worker, never moves it back
+        (users.c.last_xp_day, case((is_new_day, day), else_=users.c.last_xp_day)),
+    )
+
+
+def _xp_upsert(session: Session):
+    """
+    INSERT into user_xp that adds to the existing xp when the (user_id, day) row already exists
+    """
+
+    dialect = session.get_bind().dialect.name
+
+    user_xp = UserXP.__table__
+
+    if dialect == "mysql":
+        upsert = mysql.insert(user_xp)
+        return upsert.on_duplicate_key_update(xp=user_xp.c.xp + upsert.inserted.xp)
+
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    upsert = insert(user_xp)
+    return upsert.on_conflict_do_update(
+        index_elements=[user_xp.c.user_id, user_xp.c.day],
+        set_={"xp": user_xp.c.xp + upsert.excluded.xp},
     )
 
 
@@ -456,13 +897,11 @@ def delete_unit(session: Session, unit_id: int) -> Units:
 
     unit = get_unit_by_id(session=session, unit_id=unit_id)
 
-    query = select(LessonsInUnit).where(LessonsInUnit.unit_id == unit_id)
-    unit_lessons = session.exec(query).all()
-
-    for ul in unit_lessons:
-        session.delete(ul)
+    session.exec(delete(LessonsInUnit).where(LessonsInUnit.unit_id == unit_id))
+    session.exec(delete(Units).where(Units.unit_id == unit_id))
 
-    session.delete(unit)
+    # the row is gone, keep the loaded copy to return
+    session.expunge(unit)
     session.commit()
 
     return unit
@@ -525,6 +964,66 @@ def remove_lesson_from_unit(session: Session, details: UpdateLessonInUnit) -> Le
 
 
 
+def set_unit_lessons(session: Session, unit_id: int, details: UpdateUnitLessons) -> tuple[Units, List[LessonsInUnit]]:
+    """
+    Replace the lessons of a unit with an ordered list of lessons, numbered from 1. Only the
+    indices that change are written, with one statement per kind of change, in one transaction
+
+    :return: The unit and its lessons in order
+    :raises EntityNotFoundException: The unit or one of the lessons does not exist
+    :raises InvalidRequestExcpetion: A lesson is listed more than once
+    """
+
+    unit = get_unit_by_id(session=session, unit_id=unit_id)
+
+    lesson_ids = details.lesson_ids
+    if len(set(lesson_ids)) != len(lesson_ids):
+        raise InvalidRequestExcpetion(entity_name="Lessons", msg="A lesson can only appear once in a unit")
+
+    if lesson_ids:
+        found = set(session.exec(select(Lessons.lesson_id).where(Lessons.lesson_id.in_(lesson_ids))).all())
+        missing = [lesson_id for lesson_id in lesson_ids if lesson_id not in found]
+        if missing:
+            raise EntityNotFoundException(entity_name="Lessons", entity_id=missing[0])
+
+    current = dict(session.exec(
+        select(LessonsInUnit.lesson_index, LessonsInUnit.lesson_id).where(LessonsInUnit.unit_id == unit_id)
+    ).all())
+    wanted = {index: lesson_id for index, lesson_id in enumerate(lesson_ids, start=1)}
+
+    to_delete = [index for index in current if index not in wanted]
+    to_update = [{"index": index, "lesson": lesson_id} for index, lesson_id in wanted.items()
+                 if index in current and current[index] != lesson_id]
+    to_insert = [{"unit_id": unit_id, "lesson_id": lesson_id, "lesson_index": index}
+                 for index, lesson_id in wanted.items() if index not in current]
+
+    links = LessonsInUnit.__table__
+    if to_delete:
+        session.exec(delete(LessonsInUnit)
+                     .where(LessonsInUnit.unit_id == unit_id)
+                     .where(LessonsInUnit.lesson_index.in_(to_delete)))
+    if to_update:
+        session.exec(
+            update(links)
+            .where(links.c.unit_id == unit_id)
+            .where(links.c.lesson_index == bindparam("index"))
+            .values(lesson_id=bindparam("lesson")),
+            params=to_update,
+        )
+    if to_insert:
+        session.exec(insert(links), params=to_insert)
+
+    unit.lesson_count = len(lesson_ids)
+    session.add(unit)
+    session.commit()
+    session.refresh(unit)
+
+    lessons = [LessonsInUnit(unit_id=unit_id, lesson_id=lesson_id, lesson_index=index)
+               for index, lesson_id in wanted.items()]
+    return unit, lessons
+
+
+
 ##                   ##
 ##      Lessons      ##
 ##                   ##
@@ -617,15 +1116,23 @@ def delete_lesson(session: Session, lesson_id: int) -> Lessons:
     
     lesson = get_lesson_by_id(session=session, lesson_id=lesson_id)
 
-    # remove all questions from the lesson
-    for link_table in question_tables.values():        
-        query = select(link_table).where(link_table.lesson_id == lesson_id)
-        lesson_questions = session.exec(query).all()
+    # remove the lesson from its units and all questions and recognizers from the lesson
+    unit_ids = session.exec(select(LessonsInUnit.unit_id).where(LessonsInUnit.lesson_id == lesson_id)).all()
+    session.exec(delete(LessonsInUnit).where(LessonsInUnit.lesson_id == lesson_id))
+    session.exec(delete(RecognizersInLessons).where(RecognizersInLessons.lesson_id == lesson_id))
+    for link_table in question_tables.values():
+        session.exec(delete(link_table).where(link_table.lesson_id == lesson_id))
+
+    session.exec(delete(Lessons).where(Lessons.lesson_id == lesson_id))
 
-        for lq in lesson_questions:
-            session.delete(lq)
+    if unit_ids:
+        lesson_count = select(func.count(LessonsInUnit.lesson_id)) \
+            .where(LessonsInUnit.unit_id == Units.unit_id) \
+            .scalar_subquery()
+        session.exec(update(Units).where(Units.unit_id.in_(set(unit_ids))).values(lesson_count=lesson_count))
 
-    session.delete(lesson)
+    # the row is gone, keep the loaded copy to return
+    session.expunge(lesson)
     session.commit()
 
     return lesson
@@ -798,37 +1305,40 @@ def get_question(session: Session, question_type: QuestionType, question_id: int
     raise EntityNotFoundException(entity_name=question_type.name, entity_id=question_id)
  
 
-def get_questions_by_sign(session: Session, question_type: QuestionType, sign: str) -> List[SQLModel]:
+def get_questions_by_sign(session: Session, question_type: QuestionType, sign: str,
+                          offset: int = 0, limit: int = 20) -> List[SQLModel]:
     """
-    Get a list of questions by type based on their answers
-    
+    Get a page of the questions of a type that use a sign, ordered by question id
+
+    :param offset: The number of questions to skip
+    :param limit: The maximum number of questions to return
     """
 
     search_table = None
-    _filter = None
 
     match question_type:
         case QuestionType.CAMERA:
             search_table = CameraQuestions
-            _filter = CameraQuestions.sign == sign
         case QuestionType.MULTIPLE_CHOICE:
             search_table = MultipleChoiceQuestions
-            _filter = MultipleChoiceQuestions.answer == sign
+        case QuestionType.MATCHING:
+            search_table = MatchingQuestions
         case QuestionType.FILL_IN_THE_BLANK:
             search_table = FillInTheBlankQuestions
-            _filter = FillInTheBlankQuestions.answer == sign
         case QuestionType.WATCH_TO_LEARN:
             search_table = WatchToLearnQuestions
-            _filter = WatchToLearnQuestions.sign == sign
-        case _:
-            raise InvalidRequestExcpetion(entity_name="Question Type", 
-                                          msg=f"Question Type [{question_type}] is unsupported for this route")
 
-    
-    question_query = select(search_table).where(_filter)
-    questions = session.exec(question_query).all()
+    question_ids = [
+        question_id for _, question_id in 
+        sign_usage.find_usage(session=session, sign=sign, question_type=question_type, offset=offset, limit=limit)
+    ]
+    if not question_ids:
+        return []
 
-    return questions
+    question_query = select(search_table).where(search_table.question_id.in_(question_ids)) \
+    .order_by(search_table.question_id)
+
+    return session.exec(question_query).all()
 
 
 def add_watch_question(session: Session, details: AddWatchQuestion) -> WatchToLearnQuestions:
@@ -851,6 +1361,9 @@ def add_watch_question(session: Session, details: AddWatchQuestion) -> WatchToLe
         motion=details.motion
     )
     session.add(new_q)
+    session.flush()
+    question_search.index_new_questions(session=session, questions=[new_q])
+    sign_usage.index_questions(session=session, questions=[new_q])
     session.commit()
     session.refresh(new_q)
 
@@ -876,6 +1389,9 @@ def add_camera_question(session: Session, details: AddCameraQuestion) -> CameraQ
         motion=details.motion
     )
     session.add(new_q)
+    session.flush()
+    question_search.index_new_questions(session=session, questions=[new_q])
+    sign_usage.index_questions(session=session, questions=[new_q])
     session.commit()
     session.refresh(new_q)
 
@@ -902,6 +1418,9 @@ def add_mc_question(session: Session, details: AddMultipleChoicQuestion) -> Mult
         answer=details.answer
     )
     session.add(new_q)
+    session.flush()
+    question_search.index_new_questions(session=session, questions=[new_q])
+    sign_usage.index_questions(session=session, questions=[new_q])
     session.commit()
     session.refresh(new_q)
 
@@ -926,6 +1445,9 @@ def add_fill_question(session: Session, details: AddFillInTheBlankQuestion) -> F
     )
 
     session.add(new_q)
+    session.flush()
+    question_search.index_new_questions(session=session, questions=[new_q])
+    sign_usage.index_questions(session=session, questions=[new_q])
     session.commit()
     session.refresh(new_q)
 
@@ -944,6 +1466,9 @@ def add_matching_question(session: Session, details: AddMatchingQuestion) -> Mat
     )
 
     session.add(new_q)
+    session.flush()
+    question_search.index_new_questions(session=session, questions=[new_q])
+    sign_usage.index_questions(session=session, questions=[new_q])
     session.commit()
     session.refresh(new_q)
 
@@ -975,23 +1500,21 @@ def delete_question(session: Session, question_type: QuestionType, question_id:
             table = WatchToLearnQuestions
             link_table = WatchToLearnQuestionsInLesson
 
-    link_query = select(link_table).where(link_table.question_id == question_id)
-    questions_in_lesson = session.exec(link_query).all()
-
-    # remove each foreign key referencing the question
-    # No on-delete cascade will be the death of me...
-    for linked_question in questions_in_lesson:
-        session.delete(linked_question)
-    session.commit()   
-
     question = session.get(table, question_id)
+    if not question:
+        raise EntityNotFoundException(entity_name=question_type.name, entity_id=question_id)
 
-    if question:
-        session.delete(question)
-        session.commit()
-        return question
+    # No on-delete cascade, so remove everything referencing the question first
+    session.exec(delete(link_table).where(link_table.question_id == question_id))
+    question_search.remove_questions(session=session, question_type=question_type, question_ids=[question_id])
+    sign_usage.remove_questions(session=session, question_type=question_type, question_ids=[question_id])
+    session.exec(delete(table).where(table.question_id == question_id))
 
-    raise EntityNotFoundException(entity_name=question_type.name, entity_id=question_id)
+    # the row is gone, keep the loaded copy to return
+    session.expunge(question)
+    session.commit()
+
+    return question
 
 
 def count_questions(session: Session, lessons: list[Lessons]) -> None:
@@ -1061,7 +1584,21 @@ def ans_decode(data: str):
 
 def get_sign(session: Session, sign: str) -> Signs:
     """
-    Retrieve a sign from the database
+    Retrieve a sign, from the sign vocabulary when it is there and from the database otherwise
+    """
+
+    image_path = sign_vocabulary.image_path(sign)
+    if image_path is not None:
+        return Signs(sign=sign, image_path=image_path)
+
+    sign_ = _get_sign_row(session=session, sign=sign)
+    sign_vocabulary.put(sign_.sign, sign_.image_path)
+    return sign_
+
+
+def _get_sign_row(session: Session, sign: str) -> Signs:
+    """
+    Retrieve a sign from the database, e.g. to change it
     """
 
     sign_ = session.get(Signs, sign)
@@ -1082,8 +1619,11 @@ def create_sign(session: Session, new_sign: CreateSign) -> Signs:
 
     sign = Signs(**new_sign.model_dump())
     session.add(sign)
+    question_search.index_sign(session=session, sign=sign.sign)
     session.commit()
     session.refresh(sign)
+
+    sign_vocabulary.put(sign.sign, sign.image_path)
     return sign
 
 
@@ -1092,27 +1632,36 @@ def update_sign(session: Session, details: UpdateSign) -> Signs:
     Update the image path of a sign
     """
 
-    sign = get_sign(session=session, sign=details.sign_key)
+    sign = _get_sign_row(session=session, sign=details.sign_key)
 
     sign.image_path = details.image_path
     session.add(sign)
     session.commit()
     session.refresh(sign)
 
+    sign_vocabulary.put(sign.sign, sign.image_path)
     return sign
 
 
 def delete_sign(session: Session, sign: str) -> Signs:
     """
-    TODO Fix :)
-
     Delete a sign from the database
+
+    :raises InvalidRequestExcpetion: The sign is still used by a question
     """
 
-    sign = get_sign(session=session, sign=sign)
+    sign = _get_sign_row(session=session, sign=sign)
+
+    usage_count = sign_usage.count_usage(session=session, sign=sign.sign)
+    if usage_count:
+        raise InvalidRequestExcpetion(entity_name="Signs",
+                                      msg=f"Sign [{sign.sign}] is used by {usage_count} questions")
+
     session.delete(sign)
+    question_search.remove_sign(session=session, sign=sign.sign)
     session.commit()
 
+    sign_vocabulary.remove(sign.sign)
     return sign
 
 
@@ -1121,11 +1670,34 @@ def _check_signs(session: Session, signs: List[str]) -> bool:
     Check if all signs in a list are present in the db
     """
 
-    for sign in signs:
-        _sign = session.get(Signs, sign)
-        if not _sign:
-            raise EntityNotFoundException(
+    missing = find_missing_signs(session=session, signs=signs)
+    if missing:
+        raise EntityNotFoundException(
             entity_name="Signs",
-            entity_id=sign
+            entity_id=sorted(missing)[0]
         )
-        
+
+    return True
+
+
+def find_missing_signs(session: Session, signs: Iterable[str]) -> set[str]:
+    """
+    Find which of a collection of signs are not in the db, with one IN query per 1000 signs.
+    Signs in the sign vocabulary are checked too, since another worker may have deleted them,
+    and the vocabulary is corrected from the result
+    """
+
+    requested = sorted({sign for sign in signs if sign is not None})
+    found = set()
+
+    for start in range(0, len(requested), 1000):
+        chunk = requested[start:start + 1000]
+        for sign, image_path in session.exec(select(Signs.sign, Signs.image_path).where(Signs.sign.in_(chunk))):
+            sign_vocabulary.put(sign, image_path)
+            found.add(sign)
+
+    missing = set(requested) - found
+    for sign in missing:
+        sign_vocabulary.remove(sign)
+
+    return missing
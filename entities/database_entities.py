@@ -1,6 +1,7 @@
 from datetime import date, datetime
 import enum
 from typing import Optional, List
+from sqlalchemy import Index, UniqueConstraint
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -14,6 +15,17 @@ class LessonType(enum.IntEnum):
     TEST = 2
 
 
+class ActivityType(enum.IntEnum):
+    LESSON_COMPLETED = 0
+    XP_MILESTONE = 1
+
+
+class EmailStatus(enum.IntEnum):
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+
 class QuestionType(enum.IntEnum):
     CAMERA = 0
     MULTIPLE_CHOICE = 1
@@ -35,6 +47,7 @@ class Friends(SQLModel, table=True):
     :link: Users
     """
     __tablename__ = "friends"
+    __table_args__ = (Index("ix_friends_followed_follower", "followed_id", "follower_id"),)
     
     follower_id: Optional[int] = Field(default=None, primary_key=True, foreign_key="users.user_id")
     followed_id: Optional[int] = Field(default=None, primary_key=True, foreign_key="users.user_id")
@@ -159,9 +172,18 @@ class Users(SQLModel, table=True):
     unit_progress: int = Field(default=0)
     lesson_index: int = Field(default=0)
     days_logged: int = Field(default=0)
+    total_xp: int = Field(default=0) # running sum of user_xp.xp
+    last_xp_day: Optional[date] = Field(default=None)
+    current_streak: int = Field(default=0) # consecutive days with xp, ending on last_xp_day
+    longest_streak: int = Field(default=0)
+
+    # social, kept in step with the friends table
+    follower_count: int = Field(default=0)
+    following_count: int = Field(default=0)
 
     # permissions
     is_admin: bool = Field(default=False)
+    token_version: int = Field(default=0) # bumped to invalidate access tokens issued before a permissions change
 
     followers: List["Users"] = Relationship(
         back_populates="following",
@@ -399,5 +421,117 @@ class UserXP(SQLModel, table=True):
     xp: int = Field(default=0)
 
 
+class SearchDocuments(SQLModel, table=True):
+    """
+    Searchable text of a sign or question, kept in sync as admins edit content.
+    A dialect-specific full-text index is built over body
+    """
+
+    __tablename__ = "search_documents"
+    __table_args__ = (UniqueConstraint("doc_type", "ref"),)
+
+    doc_id: Optional[int] = Field(default=None, primary_key=True)
+    doc_type: str # "SIGN" or a QuestionType name
+    ref: str # sign or question id
+    body: str
+
+
+class SignUsage(SQLModel, table=True):
+    """
+    A sign used by a question, in any of its sign columns or matching pairs. Kept in sync as
+    questions are added and deleted. Looked up by sign, and by question when it is deleted
+    """
+
+    __tablename__ = "sign_usage"
+    __table_args__ = (Index("ix_sign_usage_question", "question_type", "question_id"),)
+
+    sign: str = Field(primary_key=True)
+    question_type: QuestionType = Field(primary_key=True)
+    question_id: int = Field(primary_key=True)
+
+
+class ActivityFeed(SQLModel, table=True):
+    """
+    An event done by a User, copied into the feed of every User who has them as a friend.
+    Feeds are read newest first by (owner_id, feed_id)
+    """
+
+    __tablename__ = "activity_feed"
+    __table_args__ = (Index("ix_activity_feed_owner_feed", "owner_id", "feed_id"),)
+
+    feed_id: Optional[int] = Field(default=None, primary_key=True)
+    owner_id: int = Field(foreign_key="users.user_id") # the user whose feed this is
+    actor_id: int = Field(foreign_key="users.user_id") # the user who did it
+    activity_type: ActivityType
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    unit_id: Optional[int] = Field(default=None) # LESSON_COMPLETED
+    lesson_index: Optional[int] = Field(default=None) # LESSON_COMPLETED
+    xp: Optional[int] = Field(default=None) # XP_MILESTONE
+
+
+class AdminAuditLog(SQLModel, table=True):
+    """
+    A change made by an admin. Rows are only ever appended, and are read by time range
+    """
+
+    __tablename__ = "admin_audit_log"
+    __table_args__ = (Index("ix_admin_audit_log_created_at", "created_at"),)
+
+    audit_id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime
+    user_id: int = Field(foreign_key="users.user_id") # the admin who made the change
+    action: str # create, update, delete or import
+    entity_type: str
+    entity_id: Optional[str] = Field(default=None)
+    details: Optional[str] = Field(default=None) # JSON
+
+
+class OutboundEmails(SQLModel, table=True):
+    """
+    An email waiting to be sent, or the record of one that was sent or given up on.
+    Due emails are found by (status, next_attempt_at)
+    """
+
+    __tablename__ = "outbound_emails"
+    __table_args__ = (Index("ix_outbound_emails_status_next_attempt", "status", "next_attempt_at"),)
+
+    email_id: Optional[int] = Field(default=None, primary_key=True)
+    recipient: str
+    subject: str
+    body: str
+
+    status: EmailStatus = Field(default=EmailStatus.PENDING)
+    attempts: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.now)
+    next_attempt_at: datetime = Field(default_factory=datetime.now)
+    sent_at: Optional[datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+    claim_token: Optional[str] = Field(default=None) # set by the worker process sending it
+
+
+class RecoveryOtps(SQLModel, table=True):
+    """
+    A user's pending one time password for account recovery, stored as a hash
+    """
+
+    __tablename__ = "recovery_otps"
+    __table_args__ = (Index("ix_recovery_otps_expires_at", "expires_at"),)
+
+    username: str = Field(primary_key=True)
+    digest: str
+    attempts: int = Field(default=0)
+    expires_at: datetime
+
+
+class PasswordResetTokens(SQLModel, table=True):
+    """
+    A reset token handed out for a verified one time password, stored as a hash
+    """
 
+    __tablename__ = "password_reset_tokens"
+    __table_args__ = (Index("ix_password_reset_tokens_expires_at", "expires_at"),)
 
+    digest: str = Field(primary_key=True)
+    username: str
+    expires_at: datetime
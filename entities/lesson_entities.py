@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from sqlmodel import SQLModel
 
-from typing import List, Union
+from typing import List, Optional, Union
 
 from entities.resource_entities import Metadata
 from entities.database_entities import LessonType, QuestionType
@@ -220,6 +220,14 @@ class UpdateLessonInUnit(BaseModel):
     lesson_index: int
 
 
+class UpdateUnitLessons(BaseModel):
+    """
+    The full ordered list of lessons in a unit
+    """
+
+    lesson_ids: List[int]
+
+
 class CreateSign(BaseModel):
     """
     API Reuest format for creating a Sign
@@ -259,6 +267,15 @@ class LessonInUnitResponse(BaseModel):
     details: LessonInUnitModel
     
 
+class UnitLessonsResponse(BaseModel):
+    """
+    API Response for a reordered unit
+    """
+
+    unit: UnitModel
+    lessons: List[LessonInUnitModel]
+
+
 class LessonResponse(BaseModel):
     """
     API Response for a single lesson
@@ -341,6 +358,17 @@ class AnswerResponse(BaseModel):
     is_correct: bool
 
 
+class SearchResult(BaseModel):
+    """
+    A sign or question matching a search. ref is the sign itself or the question id
+    """
+
+    doc_type: str
+    ref: str
+    text: str
+    score: float
+
+
 class SignResponse(BaseModel):
     """
     API Response for a Sign
@@ -385,3 +413,61 @@ class QuestionCollection(BaseModel):
                           FillInTheBlankQuestionResponse,
                           WatchToLearnQuestionResponse
                           ]]
+
+
+class SignUsageModel(BaseModel):
+    """
+    A question that uses a sign
+    """
+
+    question_type: QuestionType
+    question_id: int
+
+
+class SignUsageCollection(BaseModel):
+    """
+    API Response for a page of the questions that use a sign
+    """
+
+    meta: Metadata
+    sign: str
+    usages: List[SignUsageModel]
+
+
+class SearchCollection(BaseModel):
+    """
+    API Response for a page of search results, best matches first
+    """
+
+    meta: Metadata
+    results: List[SearchResult]
+
+
+class ImportedQuestion(BaseModel):
+    """
+    API definition of a question created by a bulk import
+    """
+
+    line: int
+    question_type: QuestionType
+    question_id: int
+    lesson_id: Optional[int] = None
+
+
+class QuestionImportError(BaseModel):
+    """
+    API definition of a row rejected by a bulk question import
+    """
+
+    line: int
+    error: str
+
+
+class QuestionImportResponse(BaseModel):
+    """
+    API response for a bulk question import
+    """
+
+    meta: Metadata
+    questions: list[ImportedQuestion]
+    errors: list[QuestionImportError]
@@ -1,4 +1,5 @@
 from datetime import date, datetime
+from typing import Any, Optional
 
 from pydantic import BaseModel
 from sqlmodel import SQLModel
@@ -11,3 +12,34 @@ class Metadata(BaseModel):
 
     count: int
 
+
+class MessageResponse(BaseModel):
+    """
+    API response for a request that only reports what was done
+    """
+
+    msg: str
+
+
+class AuditEventModel(BaseModel):
+    """
+    API definition of a change made by an admin
+    """
+
+    audit_id: int
+    created_at: datetime
+    user_id: int
+    action: str
+    entity_type: str
+    entity_id: Optional[str] = None
+    details: dict[str, Any]
+
+
+class AuditLogResponse(BaseModel):
+    """
+    API response for a page of the admin audit log, newest first
+    """
+
+    meta: Metadata
+    events: list[AuditEventModel]
+    next_cursor: Optional[int] = None
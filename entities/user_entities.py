@@ -1,6 +1,7 @@
 from datetime import  datetime, date
+import enum
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sqlmodel import SQLModel
 from typing import Optional
 
@@ -10,6 +11,15 @@ from entities.resource_entities import Metadata
 ##      Models      ##
 ##                  ##
 
+class FriendOutcome(str, enum.Enum):
+    ADDED = "added"
+    ALREADY_FRIENDS = "already_friends"
+    REMOVED = "removed"
+    NOT_FRIENDS = "not_friends"
+    NOT_FOUND = "not_found"
+    INVALID = "invalid"
+
+
 class UserRegistration(SQLModel):
     """Request model to register new user."""
 
@@ -20,11 +30,50 @@ class UserRegistration(SQLModel):
     password: str
 
 
+class UserImportError(BaseModel):
+    """
+    API definition of a row rejected by a bulk user import
+    """
+
+    line: int
+    username: Optional[str] = None
+    error: str
+
+
+class UserImportResponse(BaseModel):
+    """
+    API response for a bulk user import
+    """
+
+    created: int
+    errors: list[UserImportError]
+    seconds: float
+    users_per_second: float
+
+
 class PasswordUpdate(SQLModel):
     """Request model to update password"""
 
     username: str
     password: str
+    reset_token: str
+
+
+class OtpVerification(BaseModel):
+    """
+    API definition of a one time password entered by a User recovering their account
+    """
+
+    otp: str
+
+
+class ResetTokenResponse(BaseModel):
+    """
+    API response for a verified one time password. The token is needed to reset the password
+    """
+
+    reset_token: str
+    expires_in: int
 
 
 class UserModel(SQLModel):
@@ -40,6 +89,27 @@ class UserModel(SQLModel):
     unit_progress: int
     lesson_index: int
     days_logged: int
+    follower_count: int = 0
+    following_count: int = 0
+
+
+class UserSummaryModel(SQLModel):
+    """
+    API definition of the public profile of a User
+    """
+
+    user_id: int
+    username: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+
+
+class FriendSuggestionModel(UserSummaryModel):
+    """
+    API definition of a suggested friend and the number of friends they share with the user
+    """
+
+    mutual_friends: int
 
 
 class FriendModel(SQLModel):
@@ -79,6 +149,19 @@ class XpResponse(BaseModel):
     user_id: int
     daily_xp: int
     total_xp: int
+    current_streak: int = 0
+    longest_streak: int = 0
+
+
+class StreakResponse(BaseModel):
+    """
+    API Response for a user's daily xp streak
+    """
+
+    user_id: int
+    current_streak: int
+    longest_streak: int
+    last_active_day: Optional[date]
 
 
 class DateResponse(BaseModel):
@@ -89,6 +172,63 @@ class DateResponse(BaseModel):
     dates: list[date]
 
 
+class LeaderboardEntry(BaseModel):
+    """
+    A user's place on a leaderboard
+    """
+
+    rank: int
+    user_id: int
+    username: str
+    xp: int
+
+
+class LeaderboardResponse(BaseModel):
+    """
+    API response for a page of a leaderboard
+    """
+
+    meta: Metadata
+    period: str
+    entries: list[LeaderboardEntry]
+
+
+class LeaderboardPositionResponse(BaseModel):
+    """
+    API response for a user's position on a leaderboard. rank is None when the user has no xp for the period
+    """
+
+    period: str
+    user_id: int
+    rank: Optional[int]
+    xp: int
+
+
+class ActivityModel(BaseModel):
+    """
+    API definition of an event in a User's friend activity feed
+    """
+
+    feed_id: int
+    actor_id: int
+    actor_username: str
+    activity_type: str
+    created_at: datetime
+    unit_id: Optional[int] = None
+    lesson_index: Optional[int] = None
+    xp: Optional[int] = None
+
+
+class ActivityFeedResponse(BaseModel):
+    """
+    API response for a page of a User's friend activity feed, newest first
+    """
+
+    meta: Metadata
+    activities: list[ActivityModel]
+    next_cursor: Optional[int] = None
+
+
 class PermissionsResponse(BaseModel):
     """
     API response for a user's permissions level
@@ -97,6 +237,32 @@ class PermissionsResponse(BaseModel):
     is_admin: bool
 
 
+class AdminUpdate(BaseModel):
+    """
+    API definition of a change to a user's permissions level
+    """
+
+    is_admin: bool
+
+
+class RateLimitCounts(BaseModel):
+    """
+    Allowed and rejected request counts for a single rate limiter
+    """
+
+    allowed: int
+    rejected_by_ip: int
+    rejected_by_username: int
+
+
+class RateLimitMetricsResponse(BaseModel):
+    """
+    API response for the rate limiter counters of the serving worker
+    """
+
+    limiters: dict[str, RateLimitCounts]
+
+
 class UserUpdate(SQLModel):
     """
     
@@ -117,13 +283,60 @@ class ProgressUpdate(BaseModel):
     lesson_index: Optional[int] = None
 
 
+class BulkFriendsUpdate(BaseModel):
+    """
+    API definition of friends to add to and remove from a User in one request
+    """
+
+    add: list[int] = Field(default=[], max_length=500)
+    remove: list[int] = Field(default=[], max_length=500)
+
+
+class FriendOutcomeModel(BaseModel):
+    """
+    API definition of what happened to one of the ids in a bulk friends request
+    """
+
+    friend_id: int
+    outcome: FriendOutcome
+
+
+class BulkFriendsResponse(BaseModel):
+    """
+    API response for a bulk friends request, with an outcome for every requested id
+    """
+
+    meta: Metadata
+    results: list[FriendOutcomeModel]
+
+
 class FollowersResponse(BaseModel):
     """
-    API response for all followers of a User
+    API response for a page of the followers of a User. next_cursor is None on the last page
     """
 
     meta: Metadata
-    followers: list[UserModel]
+    followers: list[UserSummaryModel]
+    next_cursor: Optional[int] = None
+
+
+class UserSearchResponse(BaseModel):
+    """
+    API response for a page of users found by username. next_cursor is None on the last page
+    """
+
+    meta: Metadata
+    users: list[UserSummaryModel]
+    next_cursor: Optional[str]
+
+
+class FriendSuggestionsResponse(BaseModel):
+    """
+    API response for the users a User may know, most mutual friends first
+    """
+
+    meta: Metadata
+    suggestions: list[FriendSuggestionModel]
 
 
 class FollowingResponse(BaseModel):
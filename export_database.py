@@ -0,0 +1,141 @@
+"""
+Export the database to a snapshot that init_database.py can seed from
+
+Usage: python export_database.py [path] [--chunk-size 5000]
+
+The format follows the path: .json writes the testing_data.json layout, .jsonl writes one
+row per line, and a trailing .gz compresses either. Each table is read in primary key order
+a chunk at a time, every chunk continuing after the last key of the one before, through a
+server-side cursor where the database has one, and rows are written as they are read, so
+memory stays flat however large the database is. Every table is read in one transaction so
+the snapshot is consistent. Passwords are left out, init_database.py sets its own. The file
+is written under a temporary name and renamed once complete.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from typing import IO, Iterator
+
+from sqlalchemy import Connection, select, tuple_
+from sqlmodel import SQLModel
+
+from database import engine
+from entities.database_entities import Users
+from services.seed_data import row_key, seed_tables, to_json
+
+
+EXPORT_CHUNK_SIZE = 5000
+EXCLUDED_COLUMNS = {Users: {"password"}}
+
+
+def table_rows(conn: Connection, model: type[SQLModel], chunk_size: int) -> Iterator[dict]:
+    """
+    Read a table in primary key order, one keyset chunk at a time
+    """
+
+    table = model.__table__
+    key = list(table.primary_key.columns)
+    last = None
+
+    while True:
+        query = select(table).order_by(*key).limit(chunk_size)
+        if last is not None:
+            query = query.where(tuple_(*key) > tuple_(*last))
+
+        count = 0
+        for row in conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query).mappings():
+            count += 1
+            last = [row[column.name] for column in key]
+            yield row
+
+        if count < chunk_size:
+            return
+
+
+def snapshot_row(model: type[SQLModel], row) -> tuple[str, dict]:
+    """
+    The key and contents of a row in the snapshot
+    """
+
+    data = to_json(model, row)
+    key = row_key(model, data)
+    for name in EXCLUDED_COLUMNS.get(model, ()):
+        del data[name]
+    return key, data
+
+
+def write_json(out: IO[str], conn: Connection, chunk_size: int) -> dict[str, int]:
+    report = {}
+    out.write("{")
+    for position, (name, model) in enumerate(seed_tables.items()):
+        out.write(f'{"," if position else ""}\n{json.dumps(name)}: {{')
+        count = 0
+        for row in table_rows(conn, model, chunk_size):
+            key, data = snapshot_row(model, row)
+            out.write(f'{"," if count else ""}\n  {json.dumps(key)}: {json.dumps(data)}')
+            count += 1
+        out.write("\n}")
+        report[name] = count
+    out.write("\n}\n")
+    return report
+
+
+def write_jsonl(out: IO[str], conn: Connection, chunk_size: int) -> dict[str, int]:
+    report = {}
+    for name, model in seed_tables.items():
+        count = 0
+        for row in table_rows(conn, model, chunk_size):
+            key, data = snapshot_row(model, row)
+            out.write(json.dumps({"section": name, "key": key, "row": data}) + "\n")
+            count += 1
+        report[name] = count
+    return report
+
+
+def open_output(path: str, compressed: bool) -> IO[str]:
+    if compressed:
+        # the default level 9 is several times slower for a slightly smaller file
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    return open(path, "w", encoding="utf-8")
+
+
+def export(path: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> dict[str, int]:
+    """
+    Write a snapshot of the seedable tables to path
+
+    :return: section name -> rows written
+    """
+
+    compressed = path.endswith(".gz")
+    writer = write_jsonl if ".jsonl" in path else write_json
+    partial = f"{path}.partial"
+
+    with engine.connect() as conn:
+        if engine.dialect.name != "sqlite":
+            # sqlite transactions already read a single snapshot
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin(), open_output(partial, compressed) as out:
+            report = writer(out, conn, chunk_size)
+
+    os.replace(partial, path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the database to a snapshot that init_database.py can seed from")
+    parser.add_argument("path", nargs="?", default="snapshot.json.gz", help=".json or .jsonl, optionally .gz")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = export(args.path, chunk_size=args.chunk_size)
+    seconds = time.perf_counter() - started
+
+    for name, written in report.items():
+        print(f"{name}: {written} rows")
+
+    total = sum(report.values())
+    print(f"exported {total} rows in {seconds:.2f}s ({total / seconds if seconds else 0:.0f} rows/sec)")
@@ -0,0 +1,41 @@
+"""
+Register users in bulk from a CSV or JSONL file
+
+Usage: python import_users.py students.csv [--format csv|jsonl] [--chunk-size 500] [--workers 8]
+"""
+
+import argparse
+import logging
+
+from database import create_database, engine
+from services.import_rows import read_rows
+from services.user_import import USER_IMPORT_CHUNK_SIZE, USER_IMPORT_WORKERS, import_users, password_hasher
+
+
+logging.getLogger('passlib').setLevel(logging.ERROR)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Register users in bulk from a CSV or JSONL file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="defaults to csv for .csv files and jsonl otherwise")
+    parser.add_argument("--chunk-size", type=int, default=USER_IMPORT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=USER_IMPORT_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    file_format = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+
+    create_database()
+    password_hasher.start(workers=args.workers)
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as stream:
+            report = import_users(engine=engine, rows=read_rows(stream, file_format), chunk_size=args.chunk_size)
+    finally:
+        password_hasher.stop()
+
+    for error in report.errors:
+        print(f"line {error.line}: {error.username or ''} {error.error}")
+    print(f"created {report.created} users in {report.seconds:.1f}s "
+          f"({report.users_per_second:.1f} users/sec), {len(report.errors)} rows rejected")
@@ -1,242 +1,192 @@
-import json
-import os
-from datetime import date
+"""
+Seed a database from testing_data.json, or from a snapshot in the same layout
+
+Usage: python init_database.py [path] [--chunk-size 5000] [--replace]
+
+path can also be a snapshot from export_database.py: .json, .jsonl, or either gzipped.
+
+The file is streamed rather than loaded whole, and rows are written with one executemany
+INSERT per chunk, table by table in dependency order. Sections that appear in the file
+before the tables they reference are spooled to a temporary file until those tables are
+written. Rows that already exist are skipped, or overwritten with --replace, so seeding can
+be run again safely. Every seeded user gets the password "signable".
+"""
+
 import argparse
+import gzip
+import json
 import logging
+import tempfile
+import time
+from itertools import islice
+from typing import IO, Iterable
 
-from sqlmodel import Session
 from passlib.hash import bcrypt
+from sqlalchemy import insert, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlmodel import Session, SQLModel
 
-from database import *
-from entities.database_entities import (
-    Users,
-    Friends,
-    Units,
-    Lessons,
-    LessonsInUnit,
-    
-    CameraQuestionsInLesson,
-    CameraQuestions,
-
-    MatchingQuestionsInLesson,
-    MatchingQuestions,
-
-    MultipleChoiceQuestionsInLesson,
-    MultipleChoiceQuestions,
-    
-    FillInTheBlankQuestionsInLesson,
-    FillInTheBlankQuestions,
-    
-    WatchToLearnQuestionsInLesson,
-    WatchToLearnQuestions,
-    
-    Signs,
-)
+from database import column_backfills, create_database, engine
+from entities.database_entities import Users
+from services import question_search, sign_usage
+from services.seed_data import from_json, read_jsonl_sections, read_sections, seed_tables
 
 
 logging.getLogger('passlib').setLevel(logging.ERROR)
 
-with open("signable/testing_data.json", "r") as json_file:
-    DATA = json.load(json_file)
+DEFAULT_PASSWORD = "signable" # default password for default users
+SEED_CHUNK_SIZE = 5000
 
 
-create_database()
+def seed_statement(model: type[SQLModel], replace: bool):
+    """
+    INSERT that skips rows whose key already exists, or overwrites them if replace
+    """
 
-## PARSE JSON TABLE REPRESNTATIONS HERE
-## - EACH CLASS NEEDS TO BE PARSED (they are not all present right now)
-with Session(engine) as session:
-    users = [
-        Users(
-            **{
-                **user_data,
-                "created_at": date.fromisoformat(user_data["created_at"]),
-                "password": bcrypt.hash("signable") # default password for default users
-            }
-        )
-        for user_data in DATA["users"].values()
-    ]
-
-    xp = [
-        UserXP(
-            **{
-                **xp_data,
-                "day": date.fromisoformat(xp_data["day"])
-            }
-        )
-        for xp_data in DATA["xp"].values()
-    ]
-
-    friends = [
-        Friends(
-            **{
-                **friend_data
-            }
-        )
-        for friend_data in DATA["friends"].values()
-    ]
-
-    units = [
-        Units(
-            **{
-                **unit_data
-            }
-        )
-        for unit_data in DATA["units"].values()
-    ]
-
-    lessons = [
-        Lessons(
-            **{
-                **lesson_data
-            }
-        ) 
-        for lesson_data in DATA["lessons"].values()
-    ]
-
-    lesson_unit_map = [
-        LessonsInUnit(
-            **{
-                **lesson_unit_map_data
-            }
-        )
-        for lesson_unit_map_data in DATA["lessons_in_unit"].values()
-    ]
-
-    signs = [
-        Signs(
-            **{
-                **sign_data
-            }
-        )
-        for sign_data in DATA["signs"].values()
-    ]
-
-    camera_questions = [
-        CameraQuestions(
-            **{
-                **camera_question_data
-            }
-        )
-        for camera_question_data in DATA["camera_questions"].values()
-    ]
-
-    camera_questions_map = [
-        CameraQuestionsInLesson(
-            **{
-                **camera_questions_map_data
-            }
-        )
-        for camera_questions_map_data in DATA["camera_questions_in_lesson"].values()
-    ]
-
-    multiple_choice_questions = [
-        MultipleChoiceQuestions(
-            **{
-                **multiple_choice_question_data
-            }
-        )
-        for multiple_choice_question_data in DATA["multiple_choice_questions"].values()
-    ]
-
-    multiple_choice_questions_map = [
-        MultipleChoiceQuestionsInLesson(
-            **{
-                **multiple_choice_questions_map_data
-            }
-        )
-        for multiple_choice_questions_map_data in DATA["multiple_choice_questions_in_lesson"].values()
-    ]
-
-    matching_questions = [
-        MatchingQuestions(
-            **{
-                **matching_question_data
-            }
-        )
-        for matching_question_data in DATA["matching_questions"].values()
-    ]
-
-    matching_questions_map = [
-        MatchingQuestionsInLesson(
-            **{
-                **matching_question_map_data
-            }
-        )
-        for matching_question_map_data in DATA["matching_questions_in_lesson"].values()
-    ]
-
-    fill_in_the_blank_questions = [
-       FillInTheBlankQuestions(
-           **{
-               **fill_in_the_blank_question_data
-           }
-       )
-       for fill_in_the_blank_question_data in DATA["fill_in_the_blank_questions"].values()
-    ]
-
-    fill_in_the_blank_questions_map = [
-       FillInTheBlankQuestionsInLesson(
-           **{
-               **fill_in_the_blank_questions_map_data
-           }
-       )
-       for fill_in_the_blank_questions_map_data in DATA["fill_in_the_blank_questions_in_lesson"].values()
-    ]
-
-    watch_to_learn_questions = [
-        WatchToLearnQuestions(
-            **{
-                **watch_to_learn_data
-            }
-        )
-        for watch_to_learn_data in DATA["watch_to_learn_questions"].values()
-    ]
-
-    watch_to_learn_questions_map = [
-        WatchToLearnQuestionsInLesson(
-            **{
-                **watch_to_learn_map_data
-            }
+    table = model.__table__
+    dialect = engine.dialect.name
+
+    if dialect == "mysql":
+        statement = mysql.insert(table)
+        if not replace:
+            return statement.prefix_with("IGNORE")
+        return statement.on_duplicate_key_update(
+            {column.name: statement.inserted[column.name] for column in table.columns if not column.primary_key}
         )
-        for watch_to_learn_map_data in DATA["watch_to_learn_questions_in_lesson"].values()
-    ]
-
-    table_data = [[Users, users],
-                  [UserXP, xp],
-                  [Friends, friends],
-                  [Units, units],
-                  [Lessons, lessons],
-                  [LessonsInUnit, lesson_unit_map],
-                  [Signs, signs],
-
-                  [CameraQuestions, camera_questions],
-                  [CameraQuestionsInLesson, camera_questions_map],
-
-                  [MatchingQuestions, matching_questions],
-                  [MatchingQuestionsInLesson, matching_questions_map],
-
-                  [MultipleChoiceQuestions, multiple_choice_questions],
-                  [MultipleChoiceQuestionsInLesson, multiple_choice_questions_map],
-
-                  [FillInTheBlankQuestions, fill_in_the_blank_questions],
-                  [FillInTheBlankQuestionsInLesson, fill_in_the_blank_questions_map],
-
-                  [WatchToLearnQuestions, watch_to_learn_questions],
-                  [WatchToLearnQuestionsInLesson, watch_to_learn_questions_map],
-                 ]
-
-
-
-    for table, rows in table_data:
-        if not os.environ.get("PROD", False):
-            session.add_all(rows)
-        else:
-            for row in rows:
-                row = row.__dict__
-                row.pop('_sa_instance_state', None)
-                session.exec(table.__table__
-                             .insert()
-                             .prefix_with('IGNORE')
-                             .values(row))
+
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql.insert if dialect == "postgresql" else sqlite.insert)(table)
+        updates = {column.name: statement.excluded[column.name] for column in table.columns if not column.primary_key}
+        if not replace or not updates:
+            return statement.on_conflict_do_nothing()
+        return statement.on_conflict_do_update(index_elements=list(table.primary_key.columns), set_=updates)
+
+    return insert(table)
+
+
+def seed_table(session: Session, model: type[SQLModel], rows: Iterable[dict], password_hash: str,
+               chunk_size: int, replace: bool) -> int:
+    """
+    Write the rows of one section, a chunk per executemany and transaction
+
+    :return: The number of rows written or skipped
+    """
+
+    statement = seed_statement(model, replace)
+    rows = iter(rows)
+    written = 0
+
+    while chunk := [from_json(model, row) for row in islice(rows, chunk_size)]:
+        if model is Users:
+            for row in chunk:
+                row["password"] = password_hash
+
+        session.exec(statement, params=chunk)
         session.commit()
+        written += len(chunk)
+
+    return written
+
+
+def seed(stream, chunk_size: int = SEED_CHUNK_SIZE, replace: bool = False,
+         jsonl: bool = False) -> dict[str, tuple[int, float]]:
+    """
+    Seed the database from a file in the testing_data.json layout
+
+    :param jsonl: The file is a JSON lines snapshot instead
+
+    :return: section name -> (rows written or skipped, seconds)
+    """
+
+    # hashing is deliberately slow, so every seeded user shares one hash
+    password_hash = bcrypt.hash(DEFAULT_PASSWORD)
+    order = list(seed_tables)
+    spooled: dict[str, IO] = {}
+    report: dict[str, tuple[int, float]] = {}
+
+    def write(name: str, rows: Iterable[dict]) -> None:
+        started = time.perf_counter()
+        written = seed_table(session, seed_tables[name], rows, password_hash, chunk_size, replace)
+        report[name] = (written, time.perf_counter() - started)
+
+    def spooled_rows(spool) -> Iterable[dict]:
+        spool.seek(0)
+        return (json.loads(line) for line in spool)
+
+    def write_ready() -> None:
+        # write spooled sections as soon as every table before them is written
+        for name in order:
+            if name in spooled:
+                write(name, spooled_rows(spooled[name]))
+                spooled.pop(name).close()
+            elif name not in report:
+                return
+
+    with Session(engine) as session:
+        sections = read_jsonl_sections(stream) if jsonl else read_sections(stream)
+        for name, rows in sections:
+            if name not in seed_tables:
+                print(f"skipping unknown section {name}")
+                continue
+
+            if all(earlier in report for earlier in order[:order.index(name)]):
+                write(name, (row for _, row in rows))
+                write_ready()
+            else:
+                spool = spooled[name] = tempfile.TemporaryFile("w+", encoding="utf-8")
+                for _, row in rows:
+                    spool.write(json.dumps(row) + "\n")
+
+        # the remaining sections depend on tables the file does not have
+        for name in order:
+            if name in spooled:
+                write(name, spooled_rows(spooled[name]))
+                spooled.pop(name).close()
+
+        refresh_derived_data(session, seeded=report)
+
+    return report
+
+
+def refresh_derived_data(session: Session, seeded: dict) -> None:
+    """
+    Recompute what the app keeps derived from the seeded tables: the totals and streaks
+    kept on users, the search index and the sign usage index
+    """
+
+    if seeded.keys() & {"users", "xp", "friends"}:
+        with engine.begin() as conn:
+            for (table, _), backfill in column_backfills.items():
+                if table != "users":
+                    continue
+                if callable(backfill):
+                    backfill(conn)
+                else:
+                    conn.execute(text(backfill))
+
+    if seeded.keys() - {"users", "xp", "friends"}:
+        question_search.rebuild_search_index(session)
+        sign_usage.rebuild_sign_usage(session)
+        session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the database from a file in the testing_data.json layout")
+    parser.add_argument("path", nargs="?", default="signable/testing_data.json")
+    parser.add_argument("--chunk-size", type=int, default=SEED_CHUNK_SIZE)
+    parser.add_argument("--replace", action="store_true", help="overwrite rows that already exist")
+    args = parser.parse_args()
+
+    create_database()
+
+    started = time.perf_counter()
+    opener = gzip.open if args.path.endswith(".gz") else open
+    with opener(args.path, "rt", encoding="utf-8") as stream:
+        report = seed(stream, chunk_size=args.chunk_size, replace=args.replace, jsonl=".jsonl" in args.path)
+    seconds = time.perf_counter() - started
+
+    for name, (written, elapsed) in report.items():
+        print(f"{name}: {written} rows in {elapsed:.2f}s ({written / elapsed if elapsed else 0:.0f} rows/sec)")
 
+    total = sum(written for written, _ in report.values())
+    print(f"seeded {total} rows in {seconds:.2f}s ({total / seconds if seconds else 0:.0f} rows/sec)")
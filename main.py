@@ -9,7 +9,15 @@ from fastapi.responses import JSONResponse, HTMLResponse
 from routers.admin_router import admin_router
 from routers.users_router import users_router
 from routers.lessons_router import lessons_router
-from database import create_database
+from database import create_database, engine
+from services.audit_log import audit_log
+from services.email_queue import email_queue
+from services.friend_suggestions import friend_graph
+from services.leaderboard import leaderboards
+from services.sign_vocabulary import sign_vocabulary
+from services.token_versions import token_versions
+from services.user_import import password_hasher
+from services.xp_buffer import xp_buffer
 from database import (
    EntityNotFoundException,
    UnrelatedEntitiesException,
@@ -21,8 +29,27 @@ from database import (
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_database()
+    leaderboards.start(engine)
+    sign_vocabulary.start(engine)
+    token_versions.start(engine)
+    friend_graph.start(engine)
+    email_queue.start(engine)
+    audit_log.start(engine)
+    if xp_buffer.enabled:
+        xp_buffer.start()
+
     yield
 
+    if xp_buffer.enabled:
+        xp_buffer.stop()
+    leaderboards.stop()
+    sign_vocabulary.stop()
+    token_versions.stop()
+    friend_graph.stop()
+    email_queue.stop()
+    audit_log.stop()
+    password_hasher.stop()
+
 
 app = FastAPI(
   title="Signable",
@@ -3,13 +3,28 @@
 # please first let me know if something here needs to change 
 # thanks! - charlie
 
-from fastapi import APIRouter, Depends
+import io
+import json
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, UploadFile
 from sqlmodel import Session
 
 import database as db
-from routers.users_router import get_current_user
-
-from entities.database_entities import QuestionType, Users
+from routers.users_router import Claims, require_admin
+from services import rate_limit
+from services import question_search
+from services import sign_usage
+from services.audit_log import audit_log, get_events
+from services.leaderboard import leaderboards
+from services.import_rows import read_rows
+from services.question_import import import_questions
+from services.user_import import import_users
+
+from entities.database_entities import QuestionType
+from entities.resource_entities import AuditEventModel, AuditLogResponse, MessageResponse
+from entities.user_entities import AdminUpdate, PermissionsResponse, RateLimitMetricsResponse, UserImportResponse
 from entities.lesson_entities import (
     AddCameraQuestion,
     AddFillInTheBlankQuestion,
@@ -28,14 +43,21 @@ from entities.lesson_entities import (
     MatchingQuestionResponse,
     MultipleChoiceQuestionResponse,
     QuestionCollection,
+    QuestionImportResponse,
     QuestionInLessonResponse,
     QuestionResponse, 
+    SearchCollection,
+    SearchResult,
     SignResponse,
+    SignUsageCollection,
+    SignUsageModel,
+    UnitLessonsResponse,
     UnitModel,
     UnitResponse,
     UpdateLessonInUnit,
     UpdateQuestionInLesson,
     UpdateSign,
+    UpdateUnitLessons,
     WatchToLearnQuestionResponse,
 )
 
@@ -43,17 +65,8 @@ from entities.lesson_entities import (
 admin_router = APIRouter(prefix="/admin", tags=["Admin"])
 
 
-def _check_is_admin(user: Users) -> None:
-    """
-    Check user permissions
-    """
-
-    if not user.is_admin:
-        raise db.PermissionsException()
-
-
 @admin_router.get(path="/sign/{sign}", response_model=SignResponse)
-def get_sign(sign: str, user: Users = Depends(get_current_user), 
+def get_sign(sign: str, admin: Claims = Depends(require_admin), 
              session: Session = Depends(db.get_session)) -> SignResponse:
     """
     Retrieve a provided sign
@@ -62,16 +75,35 @@ def get_sign(sign: str, user: Users = Depends(get_current_user),
     :return: A SignResponse containing the specified sign
     """
     
-    _check_is_admin(user=user)
-
     return SignResponse(
         msg="retrieved sign",
         sign=db.get_sign(session=session, sign=sign)
     )
 
 
+@admin_router.get(path="/sign/{sign}/usage", response_model=SignUsageCollection)
+def get_sign_usage(sign: str, question_type: Optional[QuestionType] = None, offset: int = 0, limit: int = 20,
+                   admin: Claims = Depends(require_admin),
+                   session: Session = Depends(db.get_session)) -> SignUsageCollection:
+    """
+    Find the questions of every type that use a sign, e.g. before deleting it
+
+    :param question_type: Only return questions of this type \n
+    :param offset: The number of questions to skip \n
+    :param limit: The maximum number of questions to return \n
+    :return: A SignUsageCollection of question types and ids, ordered by type and id
+    """
+
+    rows = sign_usage.find_usage(session=session, sign=sign, question_type=question_type,
+                                 offset=offset, limit=min(limit, 100))
+    usages = [SignUsageModel(question_type=question_type_, question_id=question_id) for question_type_, question_id in rows]
+
+    meta = {"count": len(usages)}
+    return SignUsageCollection(meta=meta, sign=sign, usages=usages)
+
+
 @admin_router.post(path="/sign/", response_model=SignResponse)
-def add_sign(new_sign: CreateSign, user: Users = Depends(get_current_user), 
+def add_sign(new_sign: CreateSign, admin: Claims = Depends(require_admin), 
              session: Session = Depends(db.get_session)) -> SignResponse:
     """
     Create a new sign
@@ -79,16 +111,17 @@ def add_sign(new_sign: CreateSign, user: Users = Depends(get_current_user),
     :param new_sign: The identifier of sign to be created \n
     :return: A SignResonse containing the created sign
     """
-    _check_is_admin(user=user)
+    sign = db.create_sign(session=session, new_sign=new_sign)
+    audit_log.record(admin.user_id, "create", "Signs", sign.sign, image_path=sign.image_path)
 
     return SignResponse(
         msg="created sign",
-        sign=db.create_sign(session=session, new_sign=new_sign)
+        sign=sign
     )
 
 
 @admin_router.put(path="/sign/", response_model=SignResponse)
-def update_sign(details: UpdateSign, user: Users = Depends(get_current_user),
+def update_sign(details: UpdateSign, admin: Claims = Depends(require_admin),
                 session: Session = Depends(db.get_session)) -> SignResponse:
     """
     Update the image path of a given sign
@@ -97,31 +130,142 @@ def update_sign(details: UpdateSign, user: Users = Depends(get_current_user),
     :param image_path: The new image path
     :return: A sign response containing the sign and it's updated path
     """
-    _check_is_admin(user=user)
+    sign = db.update_sign(session=session, details=details)
+    audit_log.record(admin.user_id, "update", "Signs", sign.sign, image_path=sign.image_path)
 
     return SignResponse(
         msg="updated sign",
-        sign=db.update_sign(session=session, details=details)
+        sign=sign
     )
 
 
+@admin_router.get(path="/metrics/rate-limits", response_model=RateLimitMetricsResponse)
+def get_rate_limit_metrics(admin: Claims = Depends(require_admin)) -> RateLimitMetricsResponse:
+    """
+    Retrieve the allowed/rejected request counters of the login and recovery rate limiters.
+    Counters are kept per worker process
+
+    :return: A RateLimitMetricsResponse keyed by limiter name
+    """
+
+    return RateLimitMetricsResponse(limiters=rate_limit.metrics.snapshot())
+
+
+@admin_router.get(path="/audit", response_model=AuditLogResponse)
+def get_audit_log(since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 50,
+                  cursor: Optional[int] = None, admin: Claims = Depends(require_admin),
+                  session: Session = Depends(db.get_session)) -> AuditLogResponse:
+    """
+    Get a page of the changes admins have made, newest first. Events take up to a second
+    to be written
+
+    :param since: Only changes made at or after this time \n
+    :param until: Only changes made before this time \n
+    :param limit: The maximum number of events to return \n
+    :param cursor: The next_cursor of the previous page \n
+    """
+
+    limit = max(1, min(limit, 500))
+    rows = get_events(session=session, since=since, until=until, before=cursor, limit=limit)
+
+    events = [
+        AuditEventModel(
+            **event.model_dump(exclude={"details"}),
+            details=json.loads(event.details) if event.details else {},
+        )
+        for event in rows
+    ]
+    next_cursor = events[-1].audit_id if len(events) == limit else None
+
+    meta = {"count": len(events)}
+    return AuditLogResponse(meta=meta, events=events, next_cursor=next_cursor)
+
+
+@admin_router.post(path="/leaderboards/rebuild", response_model=MessageResponse)
+def rebuild_leaderboards(admin: Claims = Depends(require_admin),
+                         session: Session = Depends(db.get_session)) -> MessageResponse:
+    """
+    Rebuild the leaderboards of the serving worker from the database
+    """
+
+    leaderboards.rebuild(session=session)
+    return MessageResponse(msg="rebuilt leaderboards")
+
+
+@admin_router.put(path="/users/{user_id}/admin", response_model=PermissionsResponse)
+def set_user_admin(user_id: int, details: AdminUpdate, admin: Claims = Depends(require_admin),
+                   session: Session = Depends(db.get_session)) -> PermissionsResponse:
+    """
+    Promote a user to admin or demote them. Access tokens the user was issued before the
+    change stop working, so they have to log in again
+
+    :return: The user's new permissions level
+    """
+
+    user = db.set_admin(session=session, user_id=user_id, is_admin=details.is_admin)
+    audit_log.record(admin.user_id, "update", "Users", user_id, is_admin=user.is_admin)
+
+    return PermissionsResponse(is_admin=user.is_admin)
+
+
+@admin_router.post(path="/users/import", response_model=UserImportResponse)
+def import_user_accounts(file: UploadFile, file_format: Optional[Literal["csv", "jsonl"]] = None,
+                         admin: Claims = Depends(require_admin)) -> UserImportResponse:
+    """
+    Register many users from an uploaded file, e.g. the accounts of a whole school.
+    Rows need username, email and password, and may have first_name and last_name
+
+    :param file: A CSV file with a header line or a JSONL file with one user per line \n
+    :param file_format: csv or jsonl. Defaults to csv for .csv files and jsonl otherwise \n
+    :return: The number of users created, the rejected rows and the throughput in users/sec
+    """
+
+    if file_format is None:
+        file_format = "csv" if (file.filename or "").lower().endswith(".csv") else "jsonl"
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    result = import_users(engine=db.engine, rows=read_rows(stream, file_format))
+    audit_log.record(admin.user_id, "import", "Users", filename=file.filename, created=result.created,
+                     errors=len(result.errors))
+
+    return result
+
+
+@admin_router.get(path="/search/", response_model=SearchCollection)
+def search_content(q: str, offset: int = 0, limit: int = 20, admin: Claims = Depends(require_admin),
+                   session: Session = Depends(db.get_session)) -> SearchCollection:
+    """
+    Full-text search across signs and the text, answers and matching pairs of every question type
+
+    :param q: The words to search for. The last word may be partial \n
+    :param offset: The number of results to skip \n
+    :param limit: The maximum number of results to return \n
+    :return: A SearchCollection of matching signs and questions, best matches first
+    """
+
+    rows = question_search.search(session=session, query=q, offset=offset, limit=min(limit, 100))
+    results = [SearchResult(doc_type=doc_type, ref=ref, text=body, score=score) for doc_type, ref, body, score in rows]
+
+    meta = {"count": len(results)}
+    return SearchCollection(meta=meta, results=results)
+
+
 @admin_router.get(path="/question/{question_type}/{sign}", response_model=QuestionCollection)
-def get_questions_by_answer(question_type: QuestionType, sign: str, 
-                            user: Users = Depends(get_current_user),
+def get_questions_by_answer(question_type: QuestionType, sign: str, offset: int = 0, limit: int = 20,
+                            admin: Claims = Depends(require_admin),
                             session: Session = Depends(db.get_session)) -> QuestionCollection:
     """
-    Get a list of questions by type based on the sign they use as their answer
+    Get a page of the questions of a type that use a sign, as an answer, option, starting position or matching pair
     
-    :note: MatchingQuestions are currently unsupported \n
     :param question_type: The type of question to search through \n
-    :param sign: The sign used as an answer by those questions \n
-    :return: A QuestionCollection containing all questions with the given sign as an answer
+    :param sign: The sign used by those questions \n
+    :param offset: The number of questions to skip \n
+    :param limit: The maximum number of questions to return \n
+    :return: A QuestionCollection containing the questions that use the given sign, ordered by id
     """
 
-    _check_is_admin(user=user)
-
-    
-    questions = db.get_questions_by_sign(session=session, question_type=question_type, sign=sign)
+    questions = db.get_questions_by_sign(session=session, question_type=question_type, sign=sign,
+                                         offset=offset, limit=min(limit, 100))
     match question_type:
         case QuestionType.CAMERA:
             question_responses = [CameraQuestionResponse(
@@ -140,6 +284,17 @@ def get_questions_by_answer(question_type: QuestionType, sign: str,
                 question_type=q.question_type,
                 options=[q.option_1, q.option_2, q.option_3, q.option_4]
             ) for q in questions]
+        case QuestionType.MATCHING:
+            question_responses = []
+            for q in questions:
+                options = list(filter(None, q.pairs.split(".")))
+                question_responses.append(MatchingQuestionResponse(
+                    question_id=q.question_id,
+                    text=q.text,
+                    question_type=q.question_type,
+                    image_options=[db.ans_encode(o) for o in options],
+                    text_options=options,
+                ))
         case QuestionType.FILL_IN_THE_BLANK:
             question_responses = [FillInTheBlankQuestionResponse(
                 question_id=q.question_id,
@@ -168,7 +323,7 @@ def get_questions_by_answer(question_type: QuestionType, sign: str,
 
 @admin_router.post(path="/question/watch/", response_model=WatchToLearnQuestionResponse)
 def create_watch_question(details: AddWatchQuestion,
-                          user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> WatchToLearnQuestionResponse:
+                          admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> WatchToLearnQuestionResponse:
 
     """
     Create a new WatchToLearn question
@@ -176,10 +331,8 @@ def create_watch_question(details: AddWatchQuestion,
     :return: A WatchToLearnQuestionResponse contining the details of the newly added questio
     """
 
-    _check_is_admin(user=user)
-
-
     new_q = db.add_watch_question(session=session, details=details)
+    audit_log.record(admin.user_id, "create", new_q.question_type.name, new_q.question_id)
     return WatchToLearnQuestionResponse(
         **new_q.model_dump(), 
     )
@@ -187,17 +340,15 @@ def create_watch_question(details: AddWatchQuestion,
 
 @admin_router.post(path="/question/camera/", response_model=CameraQuestionResponse)
 def create_camera_question(details: AddCameraQuestion,
-                           user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> CameraQuestionResponse:
+                           admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> CameraQuestionResponse:
     """
     Create a new SignToCameraQuestion
     
     :return: a CameraQuestionResponse containing the details of the newly added question
     """
 
-    _check_is_admin(user=user)
-
-
     new_q = db.add_camera_question(session=session, details=details)
+    audit_log.record(admin.user_id, "create", new_q.question_type.name, new_q.question_id)
     return CameraQuestionResponse(
         **new_q.model_dump(),
     )
@@ -205,16 +356,15 @@ def create_camera_question(details: AddCameraQuestion,
 
 @admin_router.post(path="/question/mc/", response_model=MultipleChoiceQuestionResponse)
 def create_mc_question(details: AddMultipleChoicQuestion,
-                           user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> MultipleChoiceQuestionResponse:
+                           admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> MultipleChoiceQuestionResponse:
     """
     Create a new MultipleChoiceQuestion. Multiple choice questions have exatly 4 options
     
     :return: a MultipleChoiceQuestionResponse containing the details of the newly added question
     """
     
-    _check_is_admin(user=user)
-
     new_q = db.add_mc_question(session=session, details=details)
+    audit_log.record(admin.user_id, "create", new_q.question_type.name, new_q.question_id)
     return MultipleChoiceQuestionResponse(
         **details.model_dump(),
         question_type=new_q.question_type,
@@ -225,17 +375,15 @@ def create_mc_question(details: AddMultipleChoicQuestion,
 
 @admin_router.post(path="/question/fill/", response_model=FillInTheBlankQuestionResponse)
 def create_fill_question(details: AddFillInTheBlankQuestion,
-                           user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> FillInTheBlankQuestionResponse:
+                           admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> FillInTheBlankQuestionResponse:
     """
     Create a new FillInTheBlankQuestion
     
     :return: a FillInTheBlankQuestionResponse containing the details of the newly added question
     """
 
-    _check_is_admin(user=user)
-
-
     new_q = db.add_fill_question(session=session, details=details)
+    audit_log.record(admin.user_id, "create", new_q.question_type.name, new_q.question_id)
     return FillInTheBlankQuestionResponse(
         **new_q.model_dump(),
     )
@@ -243,7 +391,7 @@ def create_fill_question(details: AddFillInTheBlankQuestion,
 
 @admin_router.post(path="/question/match/", response_model=MatchingQuestionResponse)
 def create_match_question(details: AddMatchingQuestion,
-                           user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> MatchingQuestionResponse:
+                           admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> MatchingQuestionResponse:
     """
     Create a new MatchingQuesiton. Matching pairs are of the form ".A.B.C.D." etc. \n
     Each item seperted by . represents one pair.
@@ -251,10 +399,8 @@ def create_match_question(details: AddMatchingQuestion,
     :return: a MatchingQuesitonResponse containing the details of the newly added question
     """
     
-    _check_is_admin(user=user)
-
-
     new_q = db.add_matching_question(session=session, details=details)
+    audit_log.record(admin.user_id, "create", new_q.question_type.name, new_q.question_id)
     options = list(filter(None, details.pairs.split(".")))
     return MatchingQuestionResponse(
         **new_q.model_dump(),
@@ -263,19 +409,43 @@ def create_match_question(details: AddMatchingQuestion,
     )
 
 
+@admin_router.post(path="/question/import/", response_model=QuestionImportResponse)
+def import_question_file(file: UploadFile, file_format: Optional[Literal["csv", "jsonl"]] = None,
+                         partial: bool = False, admin: Claims = Depends(require_admin),
+                         session: Session = Depends(db.get_session)) -> QuestionImportResponse:
+    """
+    Create many questions of any type from an uploaded file in one transaction. Each row has a
+    type (watch, camera, mc, fill or match), the fields of that question type and optionally
+    a lesson_id to add the question to
+
+    :param file: A CSV file with a header line or a JSONL file with one question per line \n
+    :param file_format: csv or jsonl. Defaults to csv for .csv files and jsonl otherwise \n
+    :param partial: Import the valid rows even when other rows are invalid \n
+    :return: The created questions and the rejected rows with their line numbers
+    """
+
+    if file_format is None:
+        file_format = "csv" if (file.filename or "").lower().endswith(".csv") else "jsonl"
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    result = import_questions(session=session, rows=read_rows(stream, file_format), partial=partial)
+    audit_log.record(admin.user_id, "import", "Questions", filename=file.filename, created=result.meta.count,
+                     errors=len(result.errors))
+
+    return result
+
+
 @admin_router.delete(path="/question/{question_type}/{question_id}", response_model=QuestionResponse)
 def delete_question(question_type: QuestionType, question_id: int, 
-                    user: Users = Depends(get_current_user), session: Session = Depends(db.get_session)) -> QuestionResponse:
+                    admin: Claims = Depends(require_admin), session: Session = Depends(db.get_session)) -> QuestionResponse:
     """
     Deletes a question of a given type by question id
     
     :return: The generic information of the deleted question
     """
 
-    _check_is_admin(user=user)
-
-
     del_q = db.delete_question(session=session, question_type=question_type, question_id=question_id)
+    audit_log.record(admin.user_id, "delete", question_type.name, question_id)
     return QuestionResponse(
         question_id=question_id,
         question_type=question_type,
@@ -284,7 +454,7 @@ def delete_question(question_type: QuestionType, question_id: int,
 
 
 @admin_router.post(path="/lesson/", response_model=LessonResponse)
-def create_lesson(details: AddLesson, user: Users = Depends(get_current_user), 
+def create_lesson(details: AddLesson, admin: Claims = Depends(require_admin), 
                   session: Session = Depends(db.get_session)) -> LessonResponse:
     """
     Create a new lesson
@@ -292,10 +462,8 @@ def create_lesson(details: AddLesson, user: Users = Depends(get_current_user),
     :return: A LessonResponse containing the details of the newly created lesson
     """
     
-    _check_is_admin(user=user)
-
-
     new_lesson = db.create_lesson(session=session, details=details)
+    audit_log.record(admin.user_id, "create", "Lessons", new_lesson.lesson_id, title=new_lesson.title)
     lesson = LessonModel(
         **new_lesson.model_dump(),
     )
@@ -304,7 +472,7 @@ def create_lesson(details: AddLesson, user: Users = Depends(get_current_user),
 
 
 @admin_router.delete(path="/lesson/{lesson_id}", response_model=LessonResponse)
-def delete_lesson(lesson_id: int, user: Users = Depends(get_current_user), 
+def delete_lesson(lesson_id: int, admin: Claims = Depends(require_admin), 
                   session: Session = Depends(db.get_session)) -> LessonResponse:
     """
     Delete a lesson by lesson id
@@ -312,10 +480,8 @@ def delete_lesson(lesson_id: int, user: Users = Depends(get_current_user),
     :return: A LessonResponse containing the details of the deleted lesson
     """
 
-    _check_is_admin(user=user)
-
-
     deleted_lesson = db.delete_lesson(session=session, lesson_id=lesson_id)
+    audit_log.record(admin.user_id, "delete", "Lessons", lesson_id, title=deleted_lesson.title)
     response = LessonModel(
         **deleted_lesson.model_dump(),
     )
@@ -324,7 +490,7 @@ def delete_lesson(lesson_id: int, user: Users = Depends(get_current_user),
 
 
 @admin_router.put(path="/lesson/question/", response_model=QuestionInLessonResponse)
-def add_question_to_lesson(details: UpdateQuestionInLesson, user: Users = Depends(get_current_user),
+def add_question_to_lesson(details: UpdateQuestionInLesson, admin: Claims = Depends(require_admin),
                            session: Session = Depends(db.get_session)) -> QuestionInLessonResponse:
     """
     Add a new question to an existing lesson
@@ -332,19 +498,17 @@ def add_question_to_lesson(details: UpdateQuestionInLesson, user: Users = Depend
     :return: The ids of the newly associated question and lesson
     """
     
-    _check_is_admin(user=user)
+    question_in_lesson = db.add_question_to_lesson(session=session, details=details)
+    audit_log.record(admin.user_id, "create", "QuestionsInLesson", details.lesson_id, **details.model_dump(mode="json"))
 
     return QuestionInLessonResponse(
         msg="added question",
-        details=db.add_question_to_lesson(
-            session=session, 
-            details=details
-        )
+        details=question_in_lesson
     )
 
 
 @admin_router.delete(path="/lesson/question/", response_model=QuestionInLessonResponse)
-def remove_question_from_lesson(details: UpdateQuestionInLesson, user: Users = Depends(get_current_user),
+def remove_question_from_lesson(details: UpdateQuestionInLesson, admin: Claims = Depends(require_admin),
                                 session: Session = Depends(db.get_session)) -> QuestionInLessonResponse:
     """
     Remove a question fram a lesson
@@ -352,19 +516,17 @@ def remove_question_from_lesson(details: UpdateQuestionInLesson, user: Users = D
     :return: The ids of the removed question and lesson
     """
 
-    _check_is_admin(user=user)
-    
+    question_in_lesson = db.remove_question_from_lesson(session=session, details=details)
+    audit_log.record(admin.user_id, "delete", "QuestionsInLesson", details.lesson_id, **details.model_dump(mode="json"))
+
     return QuestionInLessonResponse(
         msg="removed question",
-        details=db.remove_question_from_lesson(
-            session=session, 
-            details=details
-        )
+        details=question_in_lesson
     )
 
 
 @admin_router.post(path="/unit/", response_model=UnitResponse)
-def create_unit(details: AddUnit, user: Users = Depends(get_current_user),
+def create_unit(details: AddUnit, admin: Claims = Depends(require_admin),
                  session: Session = Depends(db.get_session)) -> UnitResponse:
     """
     Create a new unit
@@ -372,10 +534,8 @@ def create_unit(details: AddUnit, user: Users = Depends(get_current_user),
     :return: A UnitResopnse containing the details of the newly created unit
     """
 
-    _check_is_admin(user=user)
-
-
     new_unit = db.create_unit(session=session, details=details)
+    audit_log.record(admin.user_id, "create", "Units", new_unit.unit_id, title=new_unit.title)
 
     unit = UnitModel(
         **new_unit.model_dump(),
@@ -385,17 +545,15 @@ def create_unit(details: AddUnit, user: Users = Depends(get_current_user),
 
 
 @admin_router.delete(path="/unit/", response_model=UnitResponse)
-def delete_unit(unit_id: int, user: Users = Depends(get_current_user), 
+def delete_unit(unit_id: int, admin: Claims = Depends(require_admin), 
                 session: Session = Depends(db.get_session)) -> UnitResponse:
     """
     Delete a unit by unit id
 
     """
     
-    _check_is_admin(user=user)
-
-
     deleted_unit = db.delete_unit(session=session, unit_id=unit_id)
+    audit_log.record(admin.user_id, "delete", "Units", unit_id, title=deleted_unit.title)
     response = UnitModel(
         **deleted_unit.model_dump()
     )
@@ -403,8 +561,25 @@ def delete_unit(unit_id: int, user: Users = Depends(get_current_user),
     return UnitResponse(unit=response)
 
 
+@admin_router.put(path="/unit/{unit_id}/lessons", response_model=UnitLessonsResponse)
+def set_unit_lessons(unit_id: int, details: UpdateUnitLessons, admin: Claims = Depends(require_admin),
+                     session: Session = Depends(db.get_session)) -> UnitLessonsResponse:
+    """
+    Replace the lessons of a unit with a full ordered list of lesson ids
+
+    :return: The unit and the lessons in it with their new indices
+    """
+
+    unit, lessons = db.set_unit_lessons(session=session, unit_id=unit_id, details=details)
+    audit_log.record(admin.user_id, "update", "LessonsInUnit", unit_id, lesson_ids=details.lesson_ids)
+    return UnitLessonsResponse(
+        unit=UnitModel(**unit.model_dump()),
+        lessons=[LessonInUnitModel(**lesson.model_dump()) for lesson in lessons],
+    )
+
+
 @admin_router.put(path="/unit/lesson/", response_model=LessonInUnitResponse)
-def add_lesson_to_unit(details: UpdateLessonInUnit, user: Users = Depends(get_current_user),
+def add_lesson_to_unit(details: UpdateLessonInUnit, admin: Claims = Depends(require_admin),
                        session: Session = Depends(db.get_session)) -> LessonInUnitResponse:
     """
     Add a lesson to a unit
@@ -412,9 +587,8 @@ def add_lesson_to_unit(details: UpdateLessonInUnit, user: Users = Depends(get_cu
     :return: The ids of the newly associated lesson and unit, along with the index of the lesson in the unit
     """
 
-    _check_is_admin(user=user)
-
     new_lesson_in_unit = db.add_lesson_to_unit(session=session, details=details)
+    audit_log.record(admin.user_id, "create", "LessonsInUnit", details.unit_id, **details.model_dump())
     return LessonInUnitResponse(
         msg="added lesson",
         details=LessonInUnitModel(**new_lesson_in_unit.model_dump())
@@ -422,7 +596,7 @@ def add_lesson_to_unit(details: UpdateLessonInUnit, user: Users = Depends(get_cu
 
 
 @admin_router.delete(path="/unit/lesson/", response_model=LessonInUnitResponse)
-def remove_question_from_lesson(details: UpdateLessonInUnit, user: Users = Depends(get_current_user),
+def remove_question_from_lesson(details: UpdateLessonInUnit, admin: Claims = Depends(require_admin),
                        session: Session = Depends(db.get_session)) -> LessonInUnitResponse:
     """
     Remove a lesson from a unit
@@ -430,9 +604,8 @@ def remove_question_from_lesson(details: UpdateLessonInUnit, user: Users = Depen
     :return: The ids of the removed lesson and unit in the association, along with the index of the lesson in the unit
     """
 
-    _check_is_admin(user=user)
-
     removed_lesson = db.remove_lesson_from_unit(session=session, details=details)
+    audit_log.record(admin.user_id, "delete", "LessonsInUnit", details.unit_id, **removed_lesson.model_dump())
     return LessonInUnitResponse(
         msg="removed Lesson",
         details=LessonInUnitModel(**removed_lesson.model_dump()),
@@ -1,35 +1,57 @@
 import logging
 import os
 import jwt
-import random
 from pydantic import BaseModel
-from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from datetime import date, datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlmodel import Session
 from passlib.context import CryptContext
 from sqlmodel import Session, select
 
 import database as db
-from entities.database_entities import Users
-
-import smtplib
-from email.message import EmailMessage
-import ssl
+from entities.database_entities import ActivityType, Users
+from services import activity_feed
+from services.rate_limit import RateLimiter, TokenBucket
+from services.email_queue import email_queue
+from services.friend_suggestions import friend_graph
+from services.leaderboard import Period, leaderboards
+from services.otp import otp_store
+from services.streaks import project_streak
+from services.token_versions import token_versions
+from services.xp_buffer import xp_buffer
 
 import database as db
 from entities.user_entities import (
+    ActivityFeedResponse,
+    ActivityModel,
+    BulkFriendsResponse,
+    BulkFriendsUpdate,
     DateResponse,
+    LeaderboardEntry,
+    LeaderboardPositionResponse,
+    LeaderboardResponse,
+    OtpVerification,
     PermissionsResponse,
     ProgressResponse,
     ProgressUpdate,
+    StreakResponse,
     XpResponse,
     UserResponse,
     UserUpdate,
     FollowersResponse,
+    FriendOutcome,
+    FriendOutcomeModel,
+    FriendSuggestionModel,
+    FriendSuggestionsResponse,
     UserRegistration,
-    PasswordUpdate
+    UserSearchResponse,
+    UserSummaryModel,
+    PasswordUpdate,
+    ResetTokenResponse,
 )
+from entities.resource_entities import MessageResponse
 
 users_router = APIRouter(prefix="/users", tags=["Users"])
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -40,6 +62,23 @@ JWT_ALG = "HS256"
 
 LESSON_XP_AMOUNT = 10
 
+# Bursts of login and recovery attempts are throttled before any bcrypt or SMTP work is done
+login_limiter = RateLimiter(
+    name="login",
+    per_ip=TokenBucket(capacity=30, refill_rate=30 / 60),
+    per_username=TokenBucket(capacity=5, refill_rate=5 / 60),
+)
+recovery_limiter = RateLimiter(
+    name="recovery",
+    per_ip=TokenBucket(capacity=10, refill_rate=10 / 3600),
+    per_username=TokenBucket(capacity=3, refill_rate=3 / 3600),
+)
+otp_limiter = RateLimiter(
+    name="otp",
+    per_ip=TokenBucket(capacity=20, refill_rate=20 / 3600),
+    per_username=TokenBucket(capacity=10, refill_rate=10 / 3600),
+)
+
 
 # This silences a warning that will show up because of bcrypt/passlib versioning: https://github.com/pyca/bcrypt/issues/684
 logging.getLogger('passlib').setLevel(logging.ERROR)
@@ -76,7 +115,12 @@ class AccessToken(BaseModel):
 
 def _build_access_token(user: Users) -> AccessToken:
     expiration = int(datetime.now(timezone.utc).timestamp()) + access_token_duration
-    claims = Claims(sub=str(user.user_id), exp=expiration)
+    claims = Claims(
+        sub=str(user.user_id),
+        exp=expiration,
+        role="admin" if user.is_admin else "user",
+        ver=user.token_version,
+    )
     access_token = jwt.encode(claims.model_dump(), key=JWT_KEY, algorithm=JWT_ALG)
     user_id = user.user_id
     return AccessToken(
@@ -87,8 +131,32 @@ def _build_access_token(user: Users) -> AccessToken:
     )
 
 
+def limit_login_attempts(request: Request, form: OAuth2PasswordRequestForm = Depends()) -> None:
+    """
+    FastAPI dependency to throttle login attempts by client IP and username
+    """
+
+    login_limiter.check(request, username=form.username)
+
+
+def limit_recovery_requests(request: Request, username: str) -> None:
+    """
+    FastAPI dependency to throttle account recovery requests by client IP and username
+    """
+
+    recovery_limiter.check(request, username=username)
+
+
+def limit_otp_verifications(request: Request, username: str) -> None:
+    """
+    FastAPI dependency to throttle one time password guesses by client IP and username
+    """
+
+    otp_limiter.check(request, username=username)
+
+
 # Login route
-@users_router.post("/token", response_model=AccessToken)
+@users_router.post("/token", response_model=AccessToken, dependencies=[Depends(limit_login_attempts)])
 def get_access_token(
     form: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(db.get_session),
@@ -159,6 +227,9 @@ def get_user_xp(user: Users = Depends(get_current_user),
     Get a user's daily and total xp
     """
 
+    if xp_buffer.enabled:
+        return xp_buffer.get_user_xp(session=session, user=user)
+
     return db.get_user_xp(session=session, user=user)
 
 
@@ -169,7 +240,27 @@ def update_user_xp(amount: int, user: Users = Depends(get_current_user),
     Update a user's xp progress
     """
 
-    return db.update_user_xp(session=session, user=user, amount=amount)
+    return _record_xp(session=session, user=user, amount=amount)
+
+
+def _record_xp(session: Session, user: Users, amount: int) -> XpResponse:
+    """
+    Add xp to a user, through the write-behind buffer when it is enabled
+    """
+
+    if xp_buffer.enabled:
+        response = xp_buffer.add(session=session, user=user, amount=amount)
+    else:
+        response = db.update_user_xp(session=session, user=user, amount=amount)
+
+    leaderboards.record_xp(user_id=user.user_id, day=date.today(), amount=amount)
+
+    milestone = activity_feed.xp_milestone(total_xp=response.total_xp, amount=amount)
+    if milestone is not None:
+        activity_feed.publish(session=session, actor_id=user.user_id,
+                              activity_type=ActivityType.XP_MILESTONE, xp=milestone)
+
+    return response
 
 
 @users_router.get(path="/xp/week", response_model=DateResponse)
@@ -181,6 +272,107 @@ def get_dates_with_progress(user: Users = Depends(get_current_user), session: Se
     return DateResponse(dates=db.get_xp_dates(session=session, user=user, amt=7))
 
 
+@users_router.get(path="/streak", response_model=StreakResponse)
+def get_user_streak(user: Users = Depends(get_current_user)) -> StreakResponse:
+    """
+    Get a user's current and longest daily xp streak
+    """
+
+    pending_days = xp_buffer.pending_days(user_id=user.user_id) if xp_buffer.enabled else []
+    current_streak, longest_streak = project_streak(
+        user.current_streak, user.longest_streak, user.last_xp_day, pending_days, date.today()
+    )
+
+    return StreakResponse(
+        user_id=user.user_id,
+        current_streak=current_streak,
+        longest_streak=longest_streak,
+        last_active_day=max([user.last_xp_day, *pending_days], default=None, key=lambda day: day or date.min),
+    )
+
+
+@users_router.get(path="/leaderboard/{period}", response_model=LeaderboardResponse)
+def get_leaderboard(period: Period, offset: int = 0, limit: int = 50,
+                    session: Session = Depends(db.get_session)) -> LeaderboardResponse:
+    """
+    Get a page of the daily, weekly or all-time xp leaderboard
+
+    :param period: One of daily, weekly or all-time \n
+    :param offset: The number of top-ranked users to skip \n
+    :param limit: The maximum number of users to return \n
+    :return: A page of users in rank order
+    """
+
+    ranked = leaderboards.page(period=period, offset=offset, limit=min(limit, 100))
+    return _leaderboard_response(session=session, period=period, ranked=ranked)
+
+
+@users_router.get(path="/leaderboard/{period}/me", response_model=LeaderboardPositionResponse)
+def get_leaderboard_position(period: Period, user: Users = Depends(get_current_user)) -> LeaderboardPositionResponse:
+    """
+    Get the current user's position on the daily, weekly or all-time xp leaderboard
+    """
+
+    rank, xp = leaderboards.position(period=period, user_id=user.user_id)
+    return LeaderboardPositionResponse(period=period, user_id=user.user_id, rank=rank, xp=xp)
+
+
+@users_router.get(path="/leaderboard/{period}/friends", response_model=LeaderboardResponse)
+def get_friends_leaderboard(period: Period, user: Users = Depends(get_current_user),
+                            session: Session = Depends(db.get_session)) -> LeaderboardResponse:
+    """
+    Rank the current user and their friends against each other
+    """
+
+    friend_ids = db.get_friend_ids(session=session, user_id=user.user_id)
+    ranked = leaderboards.ranked_among(period=period, user_ids=[user.user_id, *friend_ids])
+    return _leaderboard_response(session=session, period=period, ranked=ranked)
+
+
+def _leaderboard_response(session: Session, period: Period, ranked: list[tuple[int, int, int]]) -> LeaderboardResponse:
+    usernames = db.get_usernames(session=session, user_ids=[user_id for _, user_id, _ in ranked])
+    entries = [
+        LeaderboardEntry(rank=rank, user_id=user_id, username=usernames[user_id], xp=xp)
+        for rank, user_id, xp in ranked
+        if user_id in usernames
+    ]
+
+    meta = {"count": len(entries)}
+    return LeaderboardResponse(meta=meta, period=period, entries=entries)
+
+
+@users_router.get(path="/feed", response_model=ActivityFeedResponse)
+def get_activity_feed(limit: int = 20, cursor: Optional[int] = None, user: Users = Depends(get_current_user),
+                      session: Session = Depends(db.get_session)) -> ActivityFeedResponse:
+    """
+    Get a page of what the current user's friends have been doing, newest first
+
+    :param limit: The maximum number of events to return \n
+    :param cursor: The next_cursor of the previous page \n
+    """
+
+    limit = max(1, min(limit, 100))
+    rows = activity_feed.get_feed(session=session, owner_id=user.user_id, before=cursor, limit=limit)
+
+    activities = [
+        ActivityModel(
+            feed_id=event.feed_id,
+            actor_id=event.actor_id,
+            actor_username=actor_username,
+            activity_type=event.activity_type.name,
+            created_at=event.created_at,
+            unit_id=event.unit_id,
+            lesson_index=event.lesson_index,
+            xp=event.xp,
+        )
+        for event, actor_username in rows
+    ]
+    next_cursor = activities[-1].feed_id if len(activities) == limit else None
+
+    meta = {"count": len(activities)}
+    return ActivityFeedResponse(meta=meta, activities=activities, next_cursor=next_cursor)
+
+
 @users_router.get("/{user_id}", response_model=UserResponse)
 def get_user(user_id: int, session: Session = Depends(db.get_session)) -> UserResponse:
     """
@@ -198,22 +390,65 @@ def update_user_porgress(details: ProgressUpdate, user: Users = Depends(get_curr
     """
     
     # Update a user's XP upon completing any lesson
-    db.update_user_xp(session=session, user=user, amount=LESSON_XP_AMOUNT)
-    
-    return ProgressResponse(success=db.update_user_progress(session=session, user=user, details=details))
+    _record_xp(session=session, user=user, amount=LESSON_XP_AMOUNT)
+
+    success = db.update_user_progress(session=session, user=user, details=details)
+    if success:
+        activity_feed.publish(session=session, actor_id=user.user_id, activity_type=ActivityType.LESSON_COMPLETED,
+                              unit_id=details.unit_progress, lesson_index=details.lesson_index)
+
+    return ProgressResponse(success=success)
 
 
-@users_router.get("/{user_id}/myfriends")
-def get_friends(user_id: int,
+@users_router.get("/{user_id}/myfriends", response_model=FollowersResponse)
+def get_friends(user_id: int, limit: int = 50, cursor: Optional[int] = None,
                 session: Session = Depends(db.get_session)) -> FollowersResponse:
     """
-    Retrieve a lits of a user's friends
+    Retrieve a page of a user's friends
+
+    :param limit: The maximum number of friends to return \n
+    :param cursor: The next_cursor of the previous page \n
     """
 
+    limit = max(1, min(limit, 100))
+    rows = db.get_followers_by_id(session=session, user_id=user_id, limit=limit, after=cursor)
+
+    friends = [
+        UserSummaryModel(user_id=user_id, username=username, first_name=first_name, last_name=last_name)
+        for user_id, username, first_name, last_name in rows
+    ]
+    next_cursor = friends[-1].user_id if len(friends) == limit else None
 
-    friends = db.get_followers_by_id(session=session, user_id=user_id)
     meta = {"count": len(friends)}
-    return FollowersResponse(meta=meta, followers=friends)
+    return FollowersResponse(meta=meta, followers=friends, next_cursor=next_cursor)
+
+
+@users_router.get("/{user_id}/suggestions", response_model=FriendSuggestionsResponse)
+def get_friend_suggestions(user_id: int, limit: int = 10,
+                           session: Session = Depends(db.get_session)) -> FriendSuggestionsResponse:
+    """
+    Suggest friends of a user's friends, ranked by the number of mutual friends
+
+    :param limit: The maximum number of suggestions to return \n
+    """
+
+    ranked = friend_graph.suggestions(user_id=user_id, limit=limit)
+    summaries = db.get_user_summaries(session=session, user_ids=[candidate for candidate, _ in ranked])
+
+    suggestions = [
+        FriendSuggestionModel(
+            user_id=candidate,
+            username=summaries[candidate][1],
+            first_name=summaries[candidate][2],
+            last_name=summaries[candidate][3],
+            mutual_friends=mutual_friends,
+        )
+        for candidate, mutual_friends in ranked
+        if candidate in summaries
+    ]
+
+    meta = {"count": len(suggestions)}
+    return FriendSuggestionsResponse(meta=meta, suggestions=suggestions)
 
 
 @users_router.get("/{user_id}/permissions")
@@ -226,14 +461,29 @@ def get_user_permissions(user_id: int, session: Session = Depends(db.get_session
     return PermissionsResponse(is_admin=user.is_admin)
 
 
-@users_router.get("/{user_id}/friends/")
-async def search_friends( user_id: int, search_query: str, session: Session = Depends(db.get_session),):
+@users_router.get("/{user_id}/friends/", response_model=UserSearchResponse)
+def search_friends(user_id: int, search_query: str, limit: int = 20, cursor: Optional[str] = None,
+                   session: Session = Depends(db.get_session)) -> UserSearchResponse:
     """
-    Search through a user's friends for a specific friend
+    Search for users to add as friends by username prefix. Existing friends are left out
+
+    :param search_query: The start of the username to search for \n
+    :param limit: The maximum number of users to return \n
+    :param cursor: The next_cursor of the previous page \n
+    :return: A page of users in username order
     """
 
-    new_friends = db.search_for_new_friends(user_id, search_query, session)
-    return new_friends
+    limit = max(1, min(limit, 50))
+    rows = db.search_for_new_friends(user_id, search_query, session, limit=limit, cursor=cursor)
+
+    users = [
+        UserSummaryModel(user_id=user_id, username=username, first_name=first_name, last_name=last_name)
+        for user_id, username, first_name, last_name in rows
+    ]
+    next_cursor = users[-1].username if len(users) == limit else None
+
+    meta = {"count": len(users)}
+    return UserSearchResponse(meta=meta, users=users, next_cursor=next_cursor)
 
 
 ##                  ##
@@ -246,15 +496,45 @@ def add_friend(user_id: int,
                session: Session = Depends(db.get_session)):
       """Add New Friend"""
       add_friend = db.add_friend(user_id, new_friend_id, session)
+      friend_graph.add_edge(follower_id=new_friend_id, followed_id=user_id)
       return UserResponse(user=add_friend)
 
 
+@users_router.post("/friends/bulk/{user_id}", response_model=BulkFriendsResponse)
+def update_friends(user_id: int, details: BulkFriendsUpdate, user: Users = Depends(get_current_user),
+                   session: Session = Depends(db.get_session)) -> BulkFriendsResponse:
+    """
+    Add and remove many friends in one transaction. Repeating a request is safe
+
+    :param details: Up to 500 user ids each to add and to remove \n
+    :return: The outcome for every requested id
+    :raises PermissionsException: The friend list is not the current user's
+    """
+
+    if user.user_id != user_id:
+        raise db.PermissionsException()
+
+    outcomes = db.update_friends(session=session, user_id=user_id, add_ids=details.add, remove_ids=details.remove)
+
+    for friend_id, outcome in outcomes.items():
+        if outcome == FriendOutcome.ADDED:
+            friend_graph.add_edge(follower_id=friend_id, followed_id=user_id)
+        elif outcome == FriendOutcome.REMOVED:
+            friend_graph.remove_edge(follower_id=friend_id, followed_id=user_id)
+
+    results = [FriendOutcomeModel(friend_id=friend_id, outcome=outcome) for friend_id, outcome in sorted(outcomes.items())]
+
+    meta = {"count": len(results)}
+    return BulkFriendsResponse(meta=meta, results=results)
+
+
 @users_router.delete("/friends/delete/{user_id}", response_model=UserResponse)
 def delete_friend(user_id: int, 
                old_friend_id: int, 
                session: Session = Depends(db.get_session)):
       """Add New Friend"""
       delete_friend = db.delete_friend(user_id, old_friend_id, session)
+      friend_graph.remove_edge(follower_id=old_friend_id, followed_id=user_id)
       return UserResponse(user=delete_friend)
        
 
@@ -272,7 +552,10 @@ def get_current_user(
 def update_user_password(password_update: PasswordUpdate,
                 session: Session = Depends(db.get_session)):
     
-    """Register New User"""
+    """Reset a password with the reset token from /users/verify-recovery"""
+    if not otp_store.consume_reset_token(session, password_update.reset_token, password_update.username):
+        raise InvalidResetToken()
+
     try:
         hashed_password = pwd_context.hash(password_update.password)
         user = db.reset_password(session, password_update.username, hashed_password)
@@ -281,40 +564,56 @@ def update_user_password(password_update: PasswordUpdate,
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@users_router.put("/request-recovery/{username}")
-def request_recovery(username: str, session: Session = Depends(db.get_session)):
+@users_router.put("/request-recovery/{username}", response_model=MessageResponse,
+                  dependencies=[Depends(limit_recovery_requests)])
+def request_recovery(username: str, session: Session = Depends(db.get_session)) -> MessageResponse:
+    """
+    Email a one time password to a user. The response is the same whether or not the user exists
+    """
+
+    # checked before the user is looked up, so it does not reveal which users exist
+    if not email_queue.enabled:
+        raise HTTPException(status_code=503, detail="Password recovery emails are not configured")
+
     user = None
     try:
         user = db.get_user_by_username(session, username)
     except:
         pass
 
-    otp = [random.randint(0, 9) for _ in range(5)]
-    otp = ''.join(map(str, otp))
-    send_otp_email(otp, user)
-    return {"otp": otp}
+    if user:
+        otp = otp_store.issue(session, user.username)
+        queue_otp_email(session, otp, user)
+    return MessageResponse(msg="If the account exists, a one time password has been emailed to it")
 
 
-def send_otp_email(otp: str, user: Users):
-    try:
-        if (user):
-            sender = "app@gmail.com"
-            password = "cabw cney iqnt souc"
-            message = f"If you didn't request to reset your password, please ignore this email. Here's your one time password: {otp}."
-
-            em = EmailMessage()
-            em['From'] = sender
-            em['To'] = user.email
-            em['Subject'] = "Confirm Your Identity: OTP Code for Password Reset"
-            em.set_content(message)
-
-            context = ssl.create_default_context()
-
-            with smtplib.SMTP_SSL("smtp.gmail.com", 465, context=context) as server:
-                server.login(sender, password)
-                server.sendmail(sender, user.email, em.as_string())
-    except:
-        pass
+@users_router.post("/verify-recovery/{username}", response_model=ResetTokenResponse,
+                   dependencies=[Depends(limit_otp_verifications)])
+def verify_recovery(username: str, verification: OtpVerification,
+                    session: Session = Depends(db.get_session)) -> ResetTokenResponse:
+    """
+    Exchange a user's one time password for a token to reset their password with
+    """
+
+    reset_token = otp_store.verify(session, username, verification.otp)
+    if reset_token is None:
+        raise InvalidOtp()
+
+    return ResetTokenResponse(reset_token=reset_token, expires_in=int(otp_store.reset_token_ttl))
+
+
+def queue_otp_email(session: Session, otp: str, user: Users):
+    """
+    Queue the email with a user's one time password. It is sent in the background
+    """
+
+    message = f"If you didn't request to reset your password, please ignore this email. Here's your one time password: {otp}."
+    email_queue.enqueue(
+        session=session,
+        recipient=user.email,
+        subject="Confirm Your Identity: OTP Code for Password Reset",
+        body=message,
+    )
 
 
     
@@ -323,6 +622,12 @@ class Claims(BaseModel):
 
     sub: str  # id of user
     exp: int  # unix timestamp
+    role: str = "user"  # "admin" or "user"
+    ver: int = 0  # the user's token_version when the token was issued
+
+    @property
+    def user_id(self) -> int:
+        return int(self.sub)
 
 
 class AuthException(HTTPException):
@@ -352,6 +657,22 @@ class InvalidToken(AuthException):
         )
 
 
+class InvalidOtp(AuthException):
+    def __init__(self):
+        super().__init__(
+            error="invalid_grant",
+            description="invalid or expired one time password",
+        )
+
+
+class InvalidResetToken(AuthException):
+    def __init__(self):
+        super().__init__(
+            error="invalid_grant",
+            description="invalid or expired reset token",
+        )
+
+
 class ExpiredToken(AuthException):
     def __init__(self):
         super().__init__(
@@ -360,19 +681,47 @@ class ExpiredToken(AuthException):
         )
 
 
-def _decode_access_token(session: Session, token: str) -> Users:
+def _decode_claims(token: str) -> Claims:
+    """
+    Verify a bearer token and read its claims, without touching the database
+    """
+
     try:
-        claims_dict = jwt.decode(token, key=JWT_KEY, algorithms=[JWT_ALG])
-        claims = Claims(**claims_dict)
-        user_id = claims.sub
-        user = session.get(Users, user_id)
+        claims = Claims(**jwt.decode(token, key=JWT_KEY, algorithms=[JWT_ALG]))
+        user_id = claims.user_id
+    except jwt.ExpiredSignatureError:
+        raise ExpiredToken()
+    except:
+        raise InvalidToken()
 
-        if user is None:
-            raise InvalidToken()
+    # the user's permissions changed after the token was issued
+    if not token_versions.is_current(user_id, claims.ver):
+        raise InvalidToken()
 
-        return user
-    
-    except:
+    return claims
+
+
+def _decode_access_token(session: Session, token: str) -> Users:
+    claims = _decode_claims(token)
+    user = session.get(Users, claims.user_id)
+
+    if user is None or claims.ver < user.token_version:
         raise InvalidToken()
+
+    return user
+
+
+def require_admin(token: str = Depends(oauth2_scheme)) -> Claims:
+    """
+    FastAPI dependency to authorize an admin from the claims of their bearer token alone
+
+    :raises PermissionsException: The token was not issued to an admin
+    """
+
+    claims = _decode_claims(token)
+    if claims.role != "admin":
+        raise db.PermissionsException()
+
+    return claims
     
     
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Friend activity feeds, fanned out on write
+
+When a user completes a lesson or passes an xp milestone, one row per recipient is written
+to activity_feed with a single INSERT ... SELECT over the friends table. The recipients are
+the users who have the actor as a friend. Reading a feed is then one range scan of the
+(owner_id, feed_id) index. Each feed keeps only its FEED_MAX_LENGTH newest rows, and older
+rows are trimmed in the same transaction as the fan-out.
+"""
+
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, delete, insert, literal
+from sqlmodel import Session, select
+
+from entities.database_entities import ActivityFeed, ActivityType, Friends, Users
+
+
+FEED_MAX_LENGTH = int(os.environ.get("FEED_MAX_LENGTH", 200))
+XP_MILESTONE_STEP = int(os.environ.get("XP_MILESTONE_STEP", 1000))
+
+
+def publish(session: Session, actor_id: int, activity_type: ActivityType, unit_id: Optional[int] = None,
+            lesson_index: Optional[int] = None, xp: Optional[int] = None) -> int:
+    """
+    Copy an event into the feed of every user who has the actor as a friend, and trim those feeds
+
+    :return: The number of feeds the event was written to
+    """
+
+    feed = ActivityFeed.__table__
+    friends = Friends.__table__
+
+    values = {
+        "actor_id": actor_id,
+        "activity_type": activity_type,
+        "created_at": datetime.now(),
+        "unit_id": unit_id,
+        "lesson_index": lesson_index,
+        "xp": xp,
+    }
+    recipients = select(friends.c.followed_id).where(friends.c.follower_id == actor_id)
+
+    fan_out = insert(feed).from_select(
+        ["owner_id", *values],
+        select(
+            friends.c.followed_id,
+            *(literal(value, type_=feed.c[column].type) for column, value in values.items()),
+        ).where(friends.c.follower_id == actor_id),
+    )
+
+    written = session.exec(fan_out).rowcount
+    if written:
+        _trim_feeds(session=session, owner_ids=recipients)
+    session.commit()
+
+    return written
+
+
+def _trim_feeds(session: Session, owner_ids) -> None:
+    """
+    Delete all but the FEED_MAX_LENGTH newest rows of the given feeds. Does not commit
+
+    :param owner_ids: A select of the owner ids of the feeds to trim
+    """
+
+    feed = ActivityFeed.__table__
+    owners = owner_ids.subquery()
+    owner_id = owners.c[0]
+
+    # the newest row past the cap of each feed, found by walking at most FEED_MAX_LENGTH
+    # entries of the (owner_id, feed_id) index. NULL for feeds that are not over the cap
+    newest_dropped = select(feed.c.feed_id) \
+    .where(feed.c.owner_id == owner_id) \
+    .order_by(feed.c.feed_id.desc()) \
+    .offset(FEED_MAX_LENGTH) \
+    .limit(1) \
+    .scalar_subquery()
+
+    thresholds = session.exec(select(owner_id, newest_dropped)).all()
+    overflowing = [{"b_owner_id": owner, "b_feed_id": feed_id} for owner, feed_id in thresholds if feed_id is not None]
+
+    if overflowing:
+        session.exec(
+            delete(feed)
+            .where(feed.c.owner_id == bindparam("b_owner_id"))
+            .where(feed.c.feed_id <= bindparam("b_feed_id")),
+            params=overflowing,
+        )
+
+
+def get_feed(session: Session, owner_id: int, before: Optional[int] = None, limit: int = 20) -> list[tuple]:
+    """
+    Get a page of a user's feed, newest first
+
+    :param before: The last feed id of the previous page
+    :return: (ActivityFeed, actor username) rows
+    """
+
+    query = select(ActivityFeed, Users.username) \
+    .join(Users, Users.user_id == ActivityFeed.actor_id) \
+    .where(ActivityFeed.owner_id == owner_id) \
+    .order_by(ActivityFeed.feed_id.desc()) \
+    .limit(limit)
+
+    if before is not None:
+        query = query.where(ActivityFeed.feed_id < before)
+
+    return session.exec(query).all()
+
+
+def xp_milestone(total_xp: int, amount: int) -> Optional[int]:
+    """
+    Get the highest xp milestone passed by adding amount to a total that now stands at total_xp,
+    or None if no milestone was passed
+    """
+
+    if amount <= 0:
+        return None
+
+    reached = total_xp // XP_MILESTONE_STEP
+    if reached > (total_xp - amount) // XP_MILESTONE_STEP:
+        return reached * XP_MILESTONE_STEP
+
+    return None
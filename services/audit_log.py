@@ -0,0 +1,166 @@
+"""
+Asynchronous audit log of admin changes
+
+Admin routes record an event for every change they make. Recording only puts the event on
+a bounded in-memory queue, so it adds no database work to the request. A background thread
+takes events off the queue and appends them to admin_audit_log in batches of up to
+AUDIT_BATCH_SIZE, and whatever is still queued is written when the app shuts down. If the
+database falls so far behind that AUDIT_QUEUE_SIZE events are waiting, new events are
+dropped and logged rather than slowing down admin requests.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from entities.database_entities import AdminAuditLog
+
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.environ.get("AUDIT_QUEUE_SIZE", 10000))
+AUDIT_BATCH_SIZE = int(os.environ.get("AUDIT_BATCH_SIZE", 500))
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1))  # seconds
+
+
+class AuditLog:
+    """
+    Queues admin audit events and writes them to the database from a background thread
+    """
+
+    def __init__(self, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_interval: float = AUDIT_FLUSH_INTERVAL) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+
+        self._queue: queue.Queue[dict] = queue.Queue(maxsize=queue_size)
+        self._engine = None
+
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def record(self, user_id: int, action: str, entity_type: str, entity_id: Any = None, **details) -> None:
+        """
+        Queue an event. Never blocks
+
+        :param action: create, update, delete or import
+        :param details: Anything else worth keeping about the change, must be JSON serializable
+        """
+
+        event = {
+            "created_at": datetime.now(),
+            "user_id": user_id,
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": None if entity_id is None else str(entity_id),
+            "details": json.dumps(details, default=str) if details else None,
+        }
+
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            logger.error("audit queue is full, dropped %s event for %s %s", action, entity_type, entity_id)
+
+    def start(self, engine) -> None:
+        """
+        Start the background thread that writes queued events
+        """
+
+        self._engine = engine
+        if self._worker is not None:
+            return
+
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background thread and write every event still queued
+        """
+
+        if self._worker is not None:
+            self._stopping.set()
+            self._worker.join()
+            self._worker = None
+
+        self.flush()
+
+    def flush(self) -> int:
+        """
+        Write every event queued so far
+
+        :return: The number of events written
+        """
+
+        written = 0
+        while batch := self._take(block=False):
+            written += self._write(batch)
+
+        return written
+
+    def _take(self, block: bool) -> list[dict]:
+        """
+        Take up to batch_size events off the queue, waiting up to flush_interval for the first if block
+        """
+
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=self.flush_interval if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        return batch
+
+    def _write(self, batch: list[dict]) -> int:
+        try:
+            with Session(self._engine) as session:
+                session.exec(insert(AdminAuditLog.__table__), params=batch)
+                session.commit()
+        except Exception:
+            logger.exception("failed to write %s audit events", len(batch))
+            return 0
+
+        return len(batch)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch)
+
+
+def get_events(session: Session, since: Optional[datetime] = None, until: Optional[datetime] = None,
+               before: Optional[int] = None, limit: int = 50) -> list[AdminAuditLog]:
+    """
+    Get a page of audit events in a time range, newest first
+
+    :param since: Only events at or after this time
+    :param until: Only events before this time
+    :param before: Only events with an audit_id below this, i.e. the last audit_id of the previous page
+    """
+
+    query = select(AdminAuditLog)
+    if since is not None:
+        query = query.where(AdminAuditLog.created_at >= since)
+    if until is not None:
+        query = query.where(AdminAuditLog.created_at < until)
+    if before is not None:
+        query = query.where(AdminAuditLog.audit_id < before)
+
+    query = query.order_by(AdminAuditLog.audit_id.desc()).limit(limit)
+    return session.exec(query).all()
+
+
+audit_log = AuditLog()
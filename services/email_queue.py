@@ -0,0 +1,299 @@
+"""
+Outbound email queue
+
+Emails are written to outbound_emails in the request that creates them and sent later by a
+background thread, so a request never waits on SMTP. The thread keeps one authenticated SMTP
+connection open between batches (closing it after SMTP_IDLE_TIMEOUT seconds unused), sends up
+to EMAIL_BATCH_SIZE emails per round trip to the database, and retries failed sends with
+exponential backoff until EMAIL_MAX_ATTEMPTS is reached. Once an email is sent or has failed
+for good its body is cleared, since bodies can hold one time passwords, and the row itself is
+deleted after EMAIL_RETENTION_DAYS.
+
+Credentials only come from the environment. Without SMTP_PASSWORD sending is disabled, unless
+SMTP_SECURITY=none points at a server that needs no login, and enqueue refuses new emails.
+
+Every worker process runs a sender. Each batch is claimed with a conditional UPDATE before
+it is sent, so two processes never send the same email. Point SMTP_HOST/SMTP_PORT at
+services/local_smtp.py with SMTP_SECURITY=none to send to a local stand-in server.
+"""
+
+import logging
+import os
+import smtplib
+import ssl
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Optional
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, select
+
+from entities.database_entities import EmailStatus, OutboundEmails
+
+
+logger = logging.getLogger(__name__)
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 465))
+SMTP_SECURITY = os.environ.get("SMTP_SECURITY", "ssl")  # ssl, starttls or none
+SMTP_USERNAME = os.environ.get("SMTP_USERNAME", "")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
+EMAIL_SENDER = os.environ.get("EMAIL_SENDER", SMTP_USERNAME or "noreply@localhost")
+
+EMAIL_BATCH_SIZE = int(os.environ.get("EMAIL_BATCH_SIZE", 50))
+EMAIL_POLL_INTERVAL = float(os.environ.get("EMAIL_POLL_INTERVAL", 5))  # seconds
+EMAIL_MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BACKOFF = float(os.environ.get("EMAIL_RETRY_BACKOFF", 30))  # seconds, doubled every attempt
+EMAIL_RETENTION_DAYS = int(os.environ.get("EMAIL_RETENTION_DAYS", 7))
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", 60))  # seconds
+
+EMAIL_ENABLED = bool(SMTP_PASSWORD) or SMTP_SECURITY == "none"
+
+# a claimed batch that was never finished (e.g. the process died) becomes due again after this
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def connect_smtp() -> smtplib.SMTP:
+    """
+    Open and authenticate a connection to the configured SMTP server
+    """
+
+    if SMTP_SECURITY == "ssl":
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, context=ssl.create_default_context(), timeout=30)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+        if SMTP_SECURITY == "starttls":
+            server.starttls(context=ssl.create_default_context())
+
+    if SMTP_PASSWORD:
+        server.login(SMTP_USERNAME, SMTP_PASSWORD)
+
+    return server
+
+
+class EmailDisabled(Exception):
+    """
+    Raised when an email is queued but sending is not configured
+    """
+    pass
+
+
+class EmailQueue:
+    """
+    Sends queued emails from a background thread over a reused SMTP connection
+    """
+
+    def __init__(self, batch_size: int = EMAIL_BATCH_SIZE, poll_interval: float = EMAIL_POLL_INTERVAL,
+                 max_attempts: int = EMAIL_MAX_ATTEMPTS, retry_backoff: float = EMAIL_RETRY_BACKOFF,
+                 idle_timeout: float = SMTP_IDLE_TIMEOUT, connect=connect_smtp,
+                 enabled: bool = EMAIL_ENABLED) -> None:
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.idle_timeout = idle_timeout
+
+        self._connect = connect
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_used_at = 0.0
+        self._purged_at = 0.0
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def enqueue(self, session: Session, recipient: str, subject: str, body: str) -> OutboundEmails:
+        """
+        Queue an email to be sent in the background. Commits
+
+        :raises EmailDisabled: If sending is not configured
+        """
+
+        if not self.enabled:
+            raise EmailDisabled("email sending is disabled, set SMTP_PASSWORD")
+
+        email = OutboundEmails(recipient=recipient, subject=subject, body=body)
+        session.add(email)
+        session.commit()
+        session.refresh(email)
+
+        self._wake.set()
+        return email
+
+    def start(self, engine) -> None:
+        """
+        Start the background thread that sends queued emails
+        """
+
+        if self._worker is not None:
+            return
+        if not self.enabled:
+            logger.error("email sending is disabled, set SMTP_PASSWORD to send emails")
+            return
+
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, args=(engine,), name="email-queue", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background thread. Emails still queued are sent by the next process to start
+        """
+
+        if self._worker is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._worker.join()
+            self._worker = None
+
+        self._disconnect()
+
+    def drain(self, engine) -> int:
+        """
+        Send every email that is due, a batch at a time
+
+        :return: The number of emails sent
+        """
+
+        sent = 0
+        while not self._stopping.is_set():
+            with Session(engine) as session:
+                emails = self._claim(session)
+                if not emails:
+                    break
+
+                for email in emails:
+                    self._send(email)
+                    sent += email.status == EmailStatus.SENT
+
+                session.commit()
+
+        return sent
+
+    def _claim(self, session: Session) -> list[OutboundEmails]:
+        """
+        Claim a batch of due emails for this process. Rows claimed by another process in the
+        meantime fail the conditional UPDATE and are left out
+        """
+
+        now = datetime.now()
+        due = OutboundEmails.status == EmailStatus.PENDING, OutboundEmails.next_attempt_at <= now
+
+        email_ids = session.exec(
+            select(OutboundEmails.email_id).where(*due).order_by(OutboundEmails.next_attempt_at).limit(self.batch_size)
+        ).all()
+        if not email_ids:
+            return []
+
+        token = uuid.uuid4().hex
+        session.exec(
+            update(OutboundEmails)
+            .where(OutboundEmails.email_id.in_(email_ids))
+            .where(*due)
+            .values(claim_token=token, next_attempt_at=now + CLAIM_LEASE)
+        )
+        session.commit()
+
+        return session.exec(
+            select(OutboundEmails)
+            .where(OutboundEmails.email_id.in_(email_ids))
+            .where(OutboundEmails.claim_token == token)
+        ).all()
+
+    def _send(self, email: OutboundEmails) -> None:
+        """
+        Send one claimed email and record the outcome on it. Does not commit
+        """
+
+        message = EmailMessage()
+        message["From"] = EMAIL_SENDER
+        message["To"] = email.recipient
+        message["Subject"] = email.subject
+        message.set_content(email.body)
+
+        email.attempts += 1
+        try:
+            try:
+                self._connection().send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # the server closed the reused connection, retry once on a new one
+                self._disconnect()
+                self._connection().send_message(message)
+
+            self._smtp_used_at = time.monotonic()
+            email.status = EmailStatus.SENT
+            email.sent_at = datetime.now()
+            email.last_error = None
+            email.body = ""
+
+        except Exception as e:
+            logger.warning("failed to send email %s (attempt %s): %s", email.email_id, email.attempts, e)
+            if isinstance(e, (OSError, smtplib.SMTPServerDisconnected)):
+                self._disconnect()
+
+            email.last_error = str(e)[:500]
+            if email.attempts >= self.max_attempts:
+                email.status = EmailStatus.FAILED
+                email.body = ""
+            else:
+                email.next_attempt_at = datetime.now() + timedelta(
+                    seconds=self.retry_backoff * 2 ** (email.attempts - 1)
+                )
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            self._smtp = self._connect()
+            self._smtp_used_at = time.monotonic()
+        return self._smtp
+
+    def _disconnect(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _purge(self, engine) -> None:
+        """
+        Delete sent and failed emails older than EMAIL_RETENTION_DAYS, at most once an hour
+        """
+
+        if time.monotonic() - self._purged_at < 3600:
+            return
+
+        cutoff = datetime.now() - timedelta(days=EMAIL_RETENTION_DAYS)
+        with Session(engine) as session:
+            session.exec(
+                delete(OutboundEmails)
+                .where(OutboundEmails.status == EmailStatus.SENT)
+                .where(OutboundEmails.sent_at < cutoff)
+            )
+            session.exec(
+                delete(OutboundEmails)
+                .where(OutboundEmails.status == EmailStatus.FAILED)
+                .where(OutboundEmails.created_at < cutoff)
+            )
+            session.commit()
+        self._purged_at = time.monotonic()
+
+    def _run(self, engine) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.drain(engine)
+                self._purge(engine)
+            except Exception:
+                logger.exception("failed to send queued emails")
+
+            if self._smtp is not None and time.monotonic() - self._smtp_used_at > self.idle_timeout:
+                self._disconnect()
+
+            self._wake.wait(timeout=self.poll_interval)
+            self._wake.clear()
+
+
+email_queue = EmailQueue()
@@ -0,0 +1,133 @@
+"""
+"People you may know" suggestions from the friends graph
+
+A user's friends are the users following them (friends.follower_id where friends.followed_id
+is the user). Candidates are friends of friends who are not already friends, ranked by how
+many of the user's friends they are friends with.
+
+The graph is loaded in bulk at startup, updated as friends are added and removed, and
+replaced by a fresh load every FRIEND_GRAPH_RELOAD_INTERVAL seconds. Suggestions are cached
+per user until the graph around that user changes.
+"""
+
+import heapq
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable
+
+from sqlmodel import Session, select
+
+from entities.database_entities import Friends
+from services.periodic import PeriodicReloader
+
+
+FRIEND_GRAPH_RELOAD_INTERVAL = float(os.environ.get("FRIEND_GRAPH_RELOAD_INTERVAL", 900))  # seconds
+SUGGESTION_CACHE_SIZE = int(os.environ.get("SUGGESTION_CACHE_SIZE", 10_000))
+MAX_SUGGESTIONS = 50
+
+
+class FriendGraph:
+    """
+    Adjacency sets of the friends graph with a per-user cache of ranked suggestions
+    """
+
+    def __init__(self, cache_size: int = SUGGESTION_CACHE_SIZE) -> None:
+        self._friends: dict[int, set[int]] = {}  # user -> their friends
+        self._friend_of: dict[int, set[int]] = {}  # user -> users they are a friend of
+        self._cache: OrderedDict[int, list[tuple[int, int]]] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+        self._reloader = PeriodicReloader(name="friend-graph", interval=FRIEND_GRAPH_RELOAD_INTERVAL, reload=self.reload)
+
+    def load(self, edges: Iterable[tuple[int, int]]) -> None:
+        """
+        Replace the whole graph
+
+        :param edges: (follower_id, followed_id) pairs from the friends table
+        """
+
+        friends, friend_of = {}, {}
+        for follower_id, followed_id in edges:
+            friends.setdefault(followed_id, set()).add(follower_id)
+            friend_of.setdefault(follower_id, set()).add(followed_id)
+
+        with self._lock:
+            self._friends, self._friend_of = friends, friend_of
+            self._cache.clear()
+
+    def add_edge(self, follower_id: int, followed_id: int) -> None:
+        with self._lock:
+            self._friends.setdefault(followed_id, set()).add(follower_id)
+            self._friend_of.setdefault(follower_id, set()).add(followed_id)
+            self._invalidate(followed_id)
+
+    def remove_edge(self, follower_id: int, followed_id: int) -> None:
+        with self._lock:
+            self._friends.get(followed_id, set()).discard(follower_id)
+            self._friend_of.get(follower_id, set()).discard(followed_id)
+            self._invalidate(followed_id)
+
+    def suggestions(self, user_id: int, limit: int = 10) -> list[tuple[int, int]]:
+        """
+        Get a user's friend-of-friend suggestions
+
+        :return: (user_id, mutual friend count) pairs, most mutual friends first
+        """
+
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None:
+                self._cache.move_to_end(user_id)
+                return cached[:limit]
+
+            friends = self._friends.get(user_id, set())
+            mutual_counts = Counter()
+            for friend_id in friends:
+                mutual_counts.update(self._friends.get(friend_id, ()))
+
+            for excluded in (user_id, *friends):
+                mutual_counts.pop(excluded, None)
+
+            ranked = heapq.nsmallest(MAX_SUGGESTIONS, mutual_counts.items(), key=lambda item: (-item[1], item[0]))
+
+            self._cache[user_id] = ranked
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return ranked[:limit]
+
+    def reload(self, session: Session) -> None:
+        """
+        Reload the graph from the friends table
+        """
+
+        edges = session.exec(
+            select(Friends.follower_id, Friends.followed_id).execution_options(yield_per=50_000)
+        )
+        self.load(edges)
+
+    def start(self, engine) -> None:
+        """
+        Load the graph and keep reloading it in the background
+        """
+
+        self._reloader.start(engine)
+
+    def stop(self) -> None:
+        self._reloader.stop()
+
+    def _invalidate(self, user_id: int) -> None:
+        """
+        Drop cached suggestions affected by a change to a user's friends. Caller must hold the lock
+        """
+
+        self._cache.pop(user_id, None)
+        for friend_of_id in self._friend_of.get(user_id, ()):
+            self._cache.pop(friend_of_id, None)
+
+
+friend_graph = FriendGraph()
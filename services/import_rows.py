@@ -0,0 +1,35 @@
+"""
+Streaming rows out of uploaded CSV and JSONL files for the bulk import paths
+"""
+
+import csv
+import json
+from typing import Iterator, Optional, TextIO
+
+
+# (line number, row, parse error)
+ImportRow = tuple[int, Optional[dict], Optional[str]]
+
+
+def read_rows(stream: TextIO, file_format: str) -> Iterator[ImportRow]:
+    """
+    Stream rows from a CSV file with a header line, or from a JSONL file with one object per line
+    """
+
+    if file_format == "csv":
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row, None
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except json.JSONDecodeError as e:
+            yield line, None, f"invalid JSON: {e.msg}"
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, "expected a JSON object"
@@ -0,0 +1,386 @@
+"""
+Daily, weekly and all-time xp leaderboards
+
+Rankings are kept in memory and updated on every xp write, so reading a page of a
+leaderboard or a user's position never scans user_xp. Each worker process rebuilds
+its boards from the database at startup and every LEADERBOARD_REBUILD_INTERVAL
+seconds, so xp earned through another worker appears after at most that long.
+"""
+
+import bisect
+import os
+import threading
+from datetime import date, timedelta
+from typing import Iterable, Literal, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from entities.database_entities import UserXP, Users
+from services.periodic import PeriodicReloader
+
+
+LEADERBOARD_REBUILD_INTERVAL = float(os.environ.get("LEADERBOARD_REBUILD_INTERVAL", 600))  # seconds
+
+Period = Literal["daily", "weekly", "all-time"]
+
+
+class SortedList:
+    """
+    A sorted list split into sublists of up to 2 * LOAD items, with a Fenwick tree over the
+    sublist lengths. Inserting or removing moves at most one sublist's items and finding
+    the position of a value is a pair of binary searches, so both stay cheap with millions
+    of items, where a single sorted list would move half of them on every change
+    """
+
+    LOAD = 500
+
+    def __init__(self, values: Iterable = ()) -> None:
+        values = sorted(values)
+        self._lists = [values[i:i + self.LOAD] for i in range(0, len(values), self.LOAD)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(values)
+        self._build_tree()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, value) -> None:
+        if not self._lists:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            self._build_tree()
+            return
+
+        i = min(bisect.bisect_left(self._maxes, value), len(self._lists) - 1)
+        sublist = self._lists[i]
+        bisect.insort(sublist, value)
+        self._maxes[i] = sublist[-1]
+        self._len += 1
+
+        if len(sublist) > 2 * self.LOAD:
+            self._lists[i:i + 1] = [sublist[:self.LOAD], sublist[self.LOAD:]]
+            self._maxes[i:i + 1] = [sublist[self.LOAD - 1], sublist[-1]]
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, value) -> None:
+        """
+        :raises ValueError: The value is not in the list
+        """
+
+        i = bisect.bisect_left(self._maxes, value)
+        if i == len(self._lists):
+            raise ValueError(f"{value!r} is not in the list")
+
+        sublist = self._lists[i]
+        j = bisect.bisect_left(sublist, value)
+        if sublist[j] != value:
+            raise ValueError(f"{value!r} is not in the list")
+
+        del sublist[j]
+        self._len -= 1
+
+        if sublist:
+            self._maxes[i] = sublist[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._build_tree()
+
+    def bisect_left(self, value) -> int:
+        """
+        The number of items less than value
+        """
+
+        i = bisect.bisect_left(self._maxes, value)
+        if i == len(self._lists):
+            return self._len
+        return self._prefix(i) + bisect.bisect_left(self._lists[i], value)
+
+    def slice(self, offset: int, limit: int) -> list:
+        """
+        The items at positions offset to offset + limit
+        """
+
+        if offset >= self._len or limit <= 0:
+            return []
+
+        i, j = self._locate(max(0, offset))
+        items = []
+        while i < len(self._lists) and len(items) < limit:
+            items.extend(self._lists[i][j:j + limit - len(items)])
+            i, j = i + 1, 0
+
+        return items
+
+    def _build_tree(self) -> None:
+        self._tree = [0] * (len(self._lists) + 1)
+        for i, sublist in enumerate(self._lists, start=1):
+            self._tree[i] += len(sublist)
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def _tree_add(self, i: int, delta: int) -> None:
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """
+        The number of items in the first i sublists
+        """
+
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, position: int) -> tuple[int, int]:
+        """
+        The sublist holding the item at position, and the item's index in it
+        """
+
+        i = 0
+        step = 1 << len(self._tree).bit_length()
+        while step:
+            if i + step < len(self._tree) and self._tree[i + step] <= position:
+                i += step
+                position -= self._tree[i]
+            step >>= 1
+        return i, position
+
+
+class RankedBoard:
+    """
+    User scores kept in rank order. Users tied on score share a rank
+    """
+
+    def __init__(self) -> None:
+        self._scores: dict[int, int] = {}
+        self._order = SortedList()  # (-score, user_id), ascending
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def load(self, scores: Iterable[tuple[int, int]]) -> None:
+        """
+        Replace every score on the board
+
+        :param scores: (user_id, score) pairs
+        """
+
+        self._scores = {user_id: score for user_id, score in scores if score > 0}
+        self._order = SortedList((-score, user_id) for user_id, score in self._scores.items())
+
+    def add(self, user_id: int, amount: int) -> int:
+        """
+        Add to a user's score
+
+        :return: The user's new score
+        """
+
+        old = self._scores.get(user_id)
+        new = (old or 0) + amount
+
+        if old is not None:
+            self._order.remove((-old, user_id))
+            del self._scores[user_id]
+
+        if new > 0:
+            self._order.add((-new, user_id))
+            self._scores[user_id] = new
+
+        return new
+
+    def score(self, user_id: int) -> int:
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """
+        Get a user's 1-based rank, or None if the user has no score on this board
+        """
+
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+
+        # number of users with a strictly higher score
+        return self._order.bisect_left((-score,)) + 1
+
+    def page(self, offset: int, limit: int) -> list[tuple[int, int, int]]:
+        """
+        Get a page of the board in rank order
+
+        :return: (rank, user_id, score) triples
+        """
+
+        return [
+            (self.rank(user_id), user_id, -negative_score)
+            for negative_score, user_id in self._order.slice(offset, limit)
+        ]
+
+
+class Leaderboards:
+    """
+    The daily, weekly and all-time boards, rolled over as the day and week change
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._day = date.today()
+        self._boards: dict[Period, RankedBoard] = {
+            "daily": RankedBoard(),
+            "weekly": RankedBoard(),
+            "all-time": RankedBoard(),
+        }
+
+        # xp recorded while a rebuild reads the database, replayed onto the rebuilt boards
+        self._recorded_during_rebuild: Optional[list[tuple[int, date, int]]] = None
+
+        self._reloader = PeriodicReloader(name="leaderboards", interval=LEADERBOARD_REBUILD_INTERVAL, reload=self.rebuild)
+
+    def record_xp(self, user_id: int, day: date, amount: int) -> None:
+        """
+        Add xp earned by a user on a given day to every board it counts towards
+        """
+
+        with self._lock:
+            if self._recorded_during_rebuild is not None:
+                self._recorded_during_rebuild.append((user_id, day, amount))
+            self._add(user_id, day, amount)
+
+    def _add(self, user_id: int, day: date, amount: int) -> None:
+        """
+        Caller must hold the lock
+        """
+
+        self._roll_over()
+        if day == self._day:
+            self._boards["daily"].add(user_id, amount)
+        if day >= week_start(self._day):
+            self._boards["weekly"].add(user_id, amount)
+        self._boards["all-time"].add(user_id, amount)
+
+    def page(self, period: Period, offset: int, limit: int) -> list[tuple[int, int, int]]:
+        """
+        Get a page of a leaderboard as (rank, user_id, xp) triples
+        """
+
+        with self._lock:
+            self._roll_over()
+            return self._boards[period].page(offset=offset, limit=limit)
+
+    def position(self, period: Period, user_id: int) -> tuple[Optional[int], int]:
+        """
+        Get a user's rank and xp on a leaderboard. The rank is None when the user has no xp
+        """
+
+        with self._lock:
+            self._roll_over()
+            board = self._boards[period]
+            return board.rank(user_id), board.score(user_id)
+
+    def ranked_among(self, period: Period, user_ids: Iterable[int]) -> list[tuple[int, int, int]]:
+        """
+        Rank a group of users (e.g. a user and their friends) against each other
+
+        :return: (rank, user_id, xp) triples for the users in the group with xp
+        """
+
+        with self._lock:
+            self._roll_over()
+            board = self._boards[period]
+            scores = sorted(((board.score(user_id), user_id) for user_id in set(user_ids)),
+                            key=lambda entry: (-entry[0], entry[1]))
+
+        ranked = []
+        for score, user_id in scores:
+            if score <= 0:
+                break
+            rank = ranked[-1][0] if ranked and ranked[-1][2] == score else len(ranked) + 1
+            ranked.append((rank, user_id, score))
+
+        return ranked
+
+    def rebuild(self, session: Session) -> None:
+        """
+        Reload every board from the database. Xp recorded while the database is read is
+        replayed onto the new boards rather than lost when they are swapped in. xp is recorded
+        just after it is committed, so only xp committed in that instant before the read
+        starts can be counted twice, until the next rebuild
+        """
+
+        with self._lock:
+            self._recorded_during_rebuild = []
+
+        try:
+            self._swap_in(*self._read_boards(session))
+        finally:
+            with self._lock:
+                self._recorded_during_rebuild = None
+
+    def _read_boards(self, session: Session) -> tuple[date, dict[Period, RankedBoard]]:
+        today = date.today()
+
+        all_time = session.exec(select(Users.user_id, Users.total_xp).where(Users.total_xp > 0)).all()
+        daily = session.exec(select(UserXP.user_id, UserXP.xp).where(UserXP.day == today)).all()
+        weekly = session.exec(
+            select(UserXP.user_id, func.sum(UserXP.xp))
+            .where(UserXP.day >= week_start(today))
+            .group_by(UserXP.user_id)
+        ).all()
+
+        boards = {"daily": RankedBoard(), "weekly": RankedBoard(), "all-time": RankedBoard()}
+        boards["daily"].load(daily)
+        boards["weekly"].load(weekly)
+        boards["all-time"].load(all_time)
+        return today, boards
+
+    def _swap_in(self, day: date, boards: dict[Period, RankedBoard]) -> None:
+        with self._lock:
+            self._day = day
+            self._boards = boards
+            for user_id, xp_day, amount in self._recorded_during_rebuild:
+                self._add(user_id, xp_day, amount)
+
+    def start(self, engine) -> None:
+        """
+        Build the boards and keep rebuilding them in the background
+        """
+
+        self._reloader.start(engine)
+
+    def stop(self) -> None:
+        self._reloader.stop()
+
+    def _roll_over(self) -> None:
+        """
+        Start new daily/weekly boards once the day/week has changed. Caller must hold the lock
+        """
+
+        today = date.today()
+        if today == self._day:
+            return
+
+        if week_start(today) != week_start(self._day):
+            self._boards["weekly"] = RankedBoard()
+        self._boards["daily"] = RankedBoard()
+        self._day = today
+
+
+def week_start(day: date) -> date:
+    """
+    Get the Monday of the week containing a given day
+    """
+
+    return day - timedelta(days=day.weekday())
+
+
+leaderboards = Leaderboards()
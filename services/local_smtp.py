@@ -0,0 +1,118 @@
+"""
+A minimal local stand-in SMTP server for development and testing
+
+It accepts any login, keeps every message it receives in memory and prints a line for each.
+Run it with `python -m services.local_smtp --port 1025` and start the API with
+SMTP_HOST=localhost SMTP_PORT=1025 SMTP_SECURITY=none.
+"""
+
+import argparse
+import socketserver
+import threading
+from email import message_from_bytes
+from email.message import Message
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        self._reply("220 local-smtp ready")
+        recipients = []
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            command, _, argument = line.decode().rstrip("\r\n").partition(" ")
+            command = command.upper()
+
+            if command == "EHLO":
+                self._reply("250-localhost", "250-AUTH PLAIN LOGIN", "250 8BITMIME")
+            elif command == "HELO":
+                self._reply("250 localhost")
+            elif command == "AUTH":
+                self._authenticate(argument)
+            elif command == "MAIL":
+                recipients = []
+                self._reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(argument.partition(":")[2].strip("<> "))
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.received(recipients, self._read_data())
+                self._reply("250 OK queued")
+            elif command in ("NOOP", "RSET"):
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+    def _authenticate(self, argument: str) -> None:
+        mechanism, _, initial_response = argument.partition(" ")
+        if mechanism.upper() == "LOGIN":
+            for prompt in ("334 VXNlcm5hbWU6", "334 UGFzc3dvcmQ6"):
+                self._reply(prompt)
+                self.rfile.readline()
+        elif not initial_response:
+            self._reply("334 ")
+            self.rfile.readline()
+        self._reply("235 Authentication successful")
+
+    def _read_data(self) -> bytes:
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if line in (b".\r\n", b".\n", b""):
+                return b"".join(lines)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+    def _reply(self, *lines: str) -> None:
+        self.wfile.write("".join(f"{line}\r\n" for line in lines).encode())
+
+
+class LocalSmtpServer(socketserver.ThreadingTCPServer):
+    """
+    Stand-in SMTP server. Received messages are kept in `messages`
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "localhost", port: int = 1025, verbose: bool = False) -> None:
+        super().__init__((host, port), _SmtpHandler)
+        self.messages: list[Message] = []
+        self.verbose = verbose
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def received(self, recipients: list[str], data: bytes) -> None:
+        message = message_from_bytes(data)
+        with self._lock:
+            self.messages.append(message)
+        if self.verbose:
+            print(f"to={','.join(recipients)} subject={message['Subject']!r}", flush=True)
+
+    def start(self) -> "LocalSmtpServer":
+        """
+        Serve from a background thread
+        """
+
+        threading.Thread(target=self.serve_forever, name="local-smtp", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+
+    with LocalSmtpServer(host=args.host, port=args.port, verbose=True) as server:
+        print(f"listening on {args.host}:{server.port}", flush=True)
+        server.serve_forever()
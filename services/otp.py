@@ -0,0 +1,135 @@
+"""
+One-time passwords for account recovery
+
+A recovery request stores a hash of a random OTP under the username in recovery_otps, valid
+for OTP_TTL seconds. Verifying it is a single conditional DELETE, so a correct OTP is
+consumed exactly once even when requests land on different worker processes, and it is
+exchanged for a reset token that /users/reset-password requires. A pending OTP is dropped
+after OTP_MAX_ATTEMPTS wrong guesses. Reset tokens are kept as hashes in
+password_reset_tokens, and expired rows of both tables are deleted whenever an OTP is issued.
+"""
+
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlmodel import Session
+
+from entities.database_entities import PasswordResetTokens, RecoveryOtps
+
+
+OTP_LENGTH = 5
+OTP_TTL = float(os.environ.get("OTP_TTL", 600))  # seconds
+OTP_MAX_ATTEMPTS = int(os.environ.get("OTP_MAX_ATTEMPTS", 5))
+RESET_TOKEN_TTL = float(os.environ.get("RESET_TOKEN_TTL", 600))  # seconds
+
+
+class OtpStore:
+    """
+    Issues and verifies one-time passwords and the reset tokens they are exchanged for
+    """
+
+    def __init__(self, ttl: float = OTP_TTL, max_attempts: int = OTP_MAX_ATTEMPTS,
+                 reset_token_ttl: float = RESET_TOKEN_TTL) -> None:
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.reset_token_ttl = reset_token_ttl
+
+    def issue(self, session: Session, username: str) -> str:
+        """
+        Create a new OTP for a user, replacing any pending one. Commits
+
+        :return: The OTP to send to the user
+        """
+
+        now = datetime.now()
+        session.exec(delete(RecoveryOtps).where(RecoveryOtps.expires_at <= now))
+        session.exec(delete(PasswordResetTokens).where(PasswordResetTokens.expires_at <= now))
+
+        otp = "".join(secrets.choice("0123456789") for _ in range(OTP_LENGTH))
+        session.exec(_otp_upsert(session), params=[{
+            "username": username,
+            "digest": _digest(otp),
+            "attempts": 0,
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }])
+        session.commit()
+        return otp
+
+    def verify(self, session: Session, username: str, otp: str) -> Optional[str]:
+        """
+        Check a user's OTP. A correct OTP can only be used once. Commits
+
+        :return: A reset token if the OTP was correct, otherwise None
+        """
+
+        now = datetime.now()
+        pending = RecoveryOtps.username == username, RecoveryOtps.expires_at > now
+
+        used = session.exec(delete(RecoveryOtps).where(*pending).where(RecoveryOtps.digest == _digest(otp)))
+        if used.rowcount != 1:
+            session.exec(update(RecoveryOtps).where(*pending).values(attempts=RecoveryOtps.attempts + 1))
+            session.exec(
+                delete(RecoveryOtps)
+                .where(RecoveryOtps.username == username)
+                .where(or_(RecoveryOtps.attempts >= self.max_attempts, RecoveryOtps.expires_at <= now))
+            )
+            session.commit()
+            return None
+
+        reset_token = secrets.token_urlsafe(32)
+        session.add(PasswordResetTokens(
+            digest=_digest(reset_token),
+            username=username,
+            expires_at=now + timedelta(seconds=self.reset_token_ttl),
+        ))
+        session.commit()
+        return reset_token
+
+    def consume_reset_token(self, session: Session, reset_token: str, username: str) -> bool:
+        """
+        Use up a reset token. Commits
+
+        :return: Whether the token was issued to the given user and not used before
+        """
+
+        used = session.exec(
+            delete(PasswordResetTokens)
+            .where(PasswordResetTokens.digest == _digest(reset_token))
+            .where(PasswordResetTokens.username == username)
+            .where(PasswordResetTokens.expires_at > datetime.now())
+        )
+        session.commit()
+        return used.rowcount == 1
+
+
+def _otp_upsert(session: Session):
+    """
+    INSERT into recovery_otps that replaces the user's pending OTP when there is one
+    """
+
+    dialect = session.get_bind().dialect.name
+    otps = RecoveryOtps.__table__
+    replaced = ["digest", "attempts", "expires_at"]
+
+    if dialect == "mysql":
+        upsert = mysql.insert(otps)
+        return upsert.on_duplicate_key_update({name: upsert.inserted[name] for name in replaced})
+
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    upsert = insert(otps)
+    return upsert.on_conflict_do_update(
+        index_elements=[otps.c.username],
+        set_={name: upsert.excluded[name] for name in replaced},
+    )
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+otp_store = OtpStore()
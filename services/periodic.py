@@ -0,0 +1,60 @@
+"""
+Background reloading of in-memory state from the database
+
+Each worker process keeps its own copy of some tables in memory (leaderboards, sign
+vocabulary, token versions, friend graph). A PeriodicReloader loads that copy at startup and
+then reloads it on a daemon thread every interval seconds, so changes written by other
+worker processes are picked up.
+"""
+
+import logging
+import threading
+from typing import Callable
+
+from sqlmodel import Session
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicReloader:
+    """
+    Calls reload with a new session at start and then every interval seconds until stopped
+    """
+
+    def __init__(self, name: str, interval: float, reload: Callable[[Session], None]) -> None:
+        self.name = name
+        self.interval = interval
+        self._reload = reload
+
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def start(self, engine) -> None:
+        """
+        Reload once and start the background thread. Errors from the first reload are raised
+        """
+
+        with Session(engine) as session:
+            self._reload(session)
+
+        if self._worker is not None:
+            return
+
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, args=(engine,), name=self.name, daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        if self._worker is not None:
+            self._stopping.set()
+            self._worker.join()
+            self._worker = None
+
+    def _run(self, engine) -> None:
+        while not self._stopping.wait(timeout=self.interval):
+            try:
+                with Session(engine) as session:
+                    self._reload(session)
+            except Exception:
+                logger.exception("periodic reload of %s failed", self.name)
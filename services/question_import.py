@@ -0,0 +1,210 @@
+"""
+Bulk import of questions of mixed types from CSV or JSONL
+
+Every row has a `type` (watch, camera, mc, fill or match, as in the /admin/question/ routes,
+or a QuestionType name), the fields of the matching Add*Question model and optionally a
+`lesson_id` to attach the question to. In CSV files the multiple choice options are given
+as option_1 to option_4.
+
+All signs referenced by the file are checked with one IN query and all lessons with another.
+The questions are then inserted per type with batched INSERTs, linked to their lessons and
+added to the search index and the sign usage index, all in one transaction.
+"""
+
+from typing import Iterable, NamedTuple, Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session, SQLModel, select
+
+import database as db
+from entities.database_entities import (
+    CameraQuestions,
+    FillInTheBlankQuestions,
+    Lessons,
+    MatchingQuestions,
+    MultipleChoiceQuestions,
+    QuestionType,
+    WatchToLearnQuestions,
+)
+from entities.lesson_entities import (
+    AddCameraQuestion,
+    AddFillInTheBlankQuestion,
+    AddMatchingQuestion,
+    AddMultipleChoicQuestion,
+    AddWatchQuestion,
+    ImportedQuestion,
+    QuestionImportError,
+    QuestionImportResponse,
+)
+from services import question_search, sign_usage
+from services.import_rows import ImportRow
+
+
+# row type -> (question type, request model)
+question_kinds: dict[str, tuple[QuestionType, type[BaseModel]]] = {
+    "watch": (QuestionType.WATCH_TO_LEARN, AddWatchQuestion),
+    "camera": (QuestionType.CAMERA, AddCameraQuestion),
+    "mc": (QuestionType.MULTIPLE_CHOICE, AddMultipleChoicQuestion),
+    "fill": (QuestionType.FILL_IN_THE_BLANK, AddFillInTheBlankQuestion),
+    "match": (QuestionType.MATCHING, AddMatchingQuestion),
+}
+question_kinds.update({kind[0].name.lower(): kind for kind in list(question_kinds.values())})
+
+
+class _ParsedRow(NamedTuple):
+    line: int
+    question: SQLModel
+    signs: list[str]
+    lesson_id: Optional[int]
+
+
+def import_questions(session: Session, rows: Iterable[ImportRow], partial: bool = False) -> QuestionImportResponse:
+    """
+    Create every question in a file in one transaction. Commits
+
+    :param rows: Rows from read_rows
+    :param partial: Import the valid rows even if some rows are invalid. Otherwise nothing is
+        imported when any row is invalid
+    :return: The ids of the created questions and the rejected rows
+    """
+
+    parsed: list[_ParsedRow] = []
+    errors: list[QuestionImportError] = []
+
+    for line, row, error in rows:
+        if error is None:
+            try:
+                parsed.append(_parse_row(line, row))
+                continue
+            except ValueError as e:
+                error = str(e)
+        errors.append(QuestionImportError(line=line, error=error))
+
+    # one query for every sign and one for every lesson in the file
+    missing_signs = db.find_missing_signs(session=session, signs=(sign for row in parsed for sign in row.signs))
+    lesson_ids = {row.lesson_id for row in parsed if row.lesson_id is not None}
+    found_lessons = set(session.exec(select(Lessons.lesson_id).where(Lessons.lesson_id.in_(lesson_ids))).all()) \
+        if lesson_ids else set()
+
+    valid = []
+    for row in parsed:
+        unknown = sorted({sign for sign in row.signs if sign in missing_signs})
+        if unknown:
+            errors.append(QuestionImportError(line=row.line, error=f"unknown signs: {', '.join(unknown)}"))
+        elif row.lesson_id is not None and row.lesson_id not in found_lessons:
+            errors.append(QuestionImportError(line=row.line, error=f"unknown lesson: {row.lesson_id}"))
+        else:
+            valid.append(row)
+
+    errors.sort(key=lambda error: error.line)
+    if errors and not partial:
+        return QuestionImportResponse(meta={"count": 0}, questions=[], errors=errors)
+
+    _insert_questions(session=session, rows=valid)
+    questions = [
+        ImportedQuestion(
+            line=row.line,
+            question_type=row.question.question_type,
+            question_id=row.question.question_id,
+            lesson_id=row.lesson_id,
+        )
+        for row in valid
+    ]
+    session.commit()
+
+    return QuestionImportResponse(meta={"count": len(questions)}, questions=questions, errors=errors)
+
+
+def _insert_questions(session: Session, rows: list[_ParsedRow]) -> None:
+    """
+    Insert the questions of every type, link them to their lessons and index them for search.
+    Sets the question_id of every question. Does not commit
+    """
+
+    questions = [row.question for row in rows]
+    dialect = session.get_bind().dialect
+
+    if dialect.insert_executemany_returning_sort_by_parameter_order:
+        by_model: dict[type[SQLModel], list[SQLModel]] = {}
+        for question in questions:
+            by_model.setdefault(type(question), []).append(question)
+
+        # one batched INSERT ... RETURNING per question type
+        for model, group in by_model.items():
+            table = model.__table__
+            question_ids = session.exec(
+                insert(table).returning(table.c.question_id, sort_by_parameter_order=True),
+                params=[question.model_dump(exclude={"question_id"}) for question in group],
+            ).scalars().all()
+            for question, question_id in zip(group, question_ids):
+                question.question_id = question_id
+    else:
+        session.add_all(questions)
+        session.flush()
+
+    links: dict[type[SQLModel], list[dict]] = {}
+    for row in rows:
+        if row.lesson_id is not None:
+            links.setdefault(db.question_tables[type(row.question)], []).append(
+                {"lesson_id": row.lesson_id, "question_id": row.question.question_id}
+            )
+
+    for link_table, params in links.items():
+        session.exec(insert(link_table.__table__), params=params)
+
+    question_search.index_new_questions(session=session, questions=questions)
+    sign_usage.index_questions(session=session, questions=questions)
+
+
+def _parse_row(line: int, row: dict) -> _ParsedRow:
+    """
+    Validate a row and build the question it describes
+
+    :raises ValueError: The row is not a valid question
+    """
+
+    # CSV rows have every column, empty ones are treated as absent
+    row = {key: value for key, value in row.items() if key is not None and value not in ("", None)}
+
+    kind = question_kinds.get(str(row.pop("type", "")).lower())
+    if kind is None:
+        raise ValueError(f"type must be one of {', '.join(sorted(question_kinds))}")
+    question_type, request_model = kind
+
+    lesson_id = row.pop("lesson_id", None)
+    if lesson_id is not None:
+        try:
+            lesson_id = int(lesson_id)
+        except (TypeError, ValueError):
+            raise ValueError("lesson_id must be an integer")
+
+    if request_model is AddMultipleChoicQuestion and "options" not in row:
+        row["options"] = [row.pop(f"option_{i}") for i in range(1, 5) if f"option_{i}" in row]
+
+    try:
+        details = request_model.model_validate(row)
+    except ValidationError as e:
+        raise ValueError("; ".join(f"{'.'.join(map(str, d['loc']))}: {d['msg']}" for d in e.errors()))
+
+    match details:
+        case AddWatchQuestion() | AddCameraQuestion():
+            model = WatchToLearnQuestions if question_type == QuestionType.WATCH_TO_LEARN else CameraQuestions
+            question = model(text=details.text, sign=details.sign, starting_position=details.starting_position,
+                             num_hands=details.num_hands, motion=details.motion)
+            signs = [details.sign, details.starting_position]
+        case AddMultipleChoicQuestion():
+            if len(details.options) != 4:
+                raise ValueError("options: multiple choice questions need 4 options")
+            question = MultipleChoiceQuestions(text=details.text, option_1=details.options[0],
+                                               option_2=details.options[1], option_3=details.options[2],
+                                               option_4=details.options[3], answer=details.answer)
+            signs = [*details.options, details.answer]
+        case AddFillInTheBlankQuestion():
+            question = FillInTheBlankQuestions(text=details.text, image_path=details.image_path, answer=details.answer)
+            signs = [details.answer]
+        case AddMatchingQuestion():
+            question = MatchingQuestions(text=details.text, pairs=details.pairs)
+            signs = []
+
+    return _ParsedRow(line=line, question=question, signs=signs, lesson_id=lesson_id)
@@ -0,0 +1,224 @@
+"""
+Full-text search over signs and question content for admins
+
+The text of every sign and question is kept in search_documents, which is written in the
+same transaction as the content it describes. The full-text index over it depends on the
+database: an FTS5 external-content table on SQLite, a GIN tsvector index on Postgres and
+a FULLTEXT index on MySQL. Other databases fall back to LIKE matching.
+"""
+
+import re
+from typing import Iterable
+
+from sqlalchemy import delete, func, insert, text
+from sqlmodel import Session, SQLModel, select
+
+from entities.database_entities import SearchDocuments, Signs
+from services.question_signs import question_models, question_signs
+
+
+SIGN_DOC_TYPE = "SIGN"
+
+_sqlite_fts = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        body, content='search_documents', content_rowid='doc_id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_index(rowid, body) VALUES (new.doc_id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_index(search_index, rowid, body) VALUES ('delete', old.doc_id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_index(search_index, rowid, body) VALUES ('delete', old.doc_id, old.body);
+        INSERT INTO search_index(rowid, body) VALUES (new.doc_id, new.body);
+    END
+    """,
+]
+
+_postgres_fts = [
+    """
+    CREATE INDEX IF NOT EXISTS search_documents_body_fts
+    ON search_documents USING GIN (to_tsvector('simple', body))
+    """,
+]
+
+
+def create_search_index(engine) -> None:
+    """
+    Create the full-text index over search_documents and fill it if it is empty
+    """
+
+    with engine.begin() as conn:
+        match engine.dialect.name:
+            case "sqlite":
+                for statement in _sqlite_fts:
+                    conn.execute(text(statement))
+            case "postgresql":
+                for statement in _postgres_fts:
+                    conn.execute(text(statement))
+            case "mysql":
+                indexes = conn.execute(text("SHOW INDEX FROM search_documents WHERE Key_name = 'search_documents_body_fts'"))
+                if not indexes.first():
+                    conn.execute(text("CREATE FULLTEXT INDEX search_documents_body_fts ON search_documents (body)"))
+
+    with Session(engine) as session:
+        if not session.exec(select(func.count(SearchDocuments.doc_id))).one():
+            rebuild_search_index(session)
+            session.commit()
+
+
+def rebuild_search_index(session: Session) -> None:
+    """
+    Rewrite every search document from the signs and question tables. Does not commit
+    """
+
+    session.exec(delete(SearchDocuments))
+
+    signs = session.exec(select(Signs)).all()
+    _insert_documents(session, [_sign_document(sign.sign) for sign in signs])
+
+    for model in question_models:
+        questions = session.exec(select(model)).all()
+        _insert_documents(session, [_question_document(question) for question in questions])
+
+
+def index_sign(session: Session, sign: str) -> None:
+    """
+    Add a sign to the search index. Does not commit
+    """
+
+    remove_sign(session, sign)
+    _insert_documents(session, [_sign_document(sign)])
+
+
+def remove_sign(session: Session, sign: str) -> None:
+    """
+    Remove a sign from the search index. Does not commit
+    """
+
+    _remove_document(session, SIGN_DOC_TYPE, sign)
+
+
+def index_question(session: Session, question: SQLModel) -> None:
+    """
+    Refresh the search document of an existing question after it changed. New questions go
+    through index_new_questions, which skips the delete. Does not commit
+    """
+
+    remove_questions(session, question.question_type, [question.question_id])
+    _insert_documents(session, [_question_document(question)])
+
+
+def index_new_questions(session: Session, questions: Iterable[SQLModel]) -> None:
+    """
+    Add many newly inserted questions to the search index with one batched insert. Does not commit
+    """
+
+    _insert_documents(session, [_question_document(question) for question in questions])
+
+
+def remove_questions(session: Session, question_type, question_ids: Iterable[int]) -> None:
+    """
+    Remove questions of one type from the search index. Does not commit
+    """
+
+    refs = [str(question_id) for question_id in question_ids]
+    if refs:
+        session.exec(
+            delete(SearchDocuments)
+            .where(SearchDocuments.doc_type == question_type.name)
+            .where(SearchDocuments.ref.in_(refs))
+        )
+
+
+def search(session: Session, query: str, offset: int = 0, limit: int = 20) -> list[tuple[str, str, str, float]]:
+    """
+    Search signs and questions, best matches first
+
+    :param query: Words to search for. Every word must match, the last word may be a prefix
+    :return: (doc_type, ref, body, score) rows. Higher scores are better matches
+    """
+
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+
+    params = {"offset": offset, "limit": limit}
+
+    match session.get_bind().dialect.name:
+        case "sqlite":
+            # quote every word so user input can't use FTS5 query syntax
+            params["match"] = " ".join(f'"{word}"' for word in words) + "*"
+            statement = """
+                SELECT d.doc_type, d.ref, d.body, -bm25(search_index) AS score
+                FROM search_index JOIN search_documents d ON d.doc_id = search_index.rowid
+                WHERE search_index MATCH :match
+                ORDER BY bm25(search_index)
+                LIMIT :limit OFFSET :offset
+            """
+        case "postgresql":
+            params["match"] = " & ".join(words) + ":*"
+            statement = """
+                SELECT doc_type, ref, body, ts_rank(to_tsvector('simple', body), to_tsquery('simple', :match)) AS score
+                FROM search_documents
+                WHERE to_tsvector('simple', body) @@ to_tsquery('simple', :match)
+                ORDER BY score DESC, doc_id
+                LIMIT :limit OFFSET :offset
+            """
+        case "mysql":
+            params["match"] = " ".join(f"+{word}" for word in words) + "*"
+            statement = """
+                SELECT doc_type, ref, body, MATCH (body) AGAINST (:match IN BOOLEAN MODE) AS score
+                FROM search_documents
+                WHERE MATCH (body) AGAINST (:match IN BOOLEAN MODE)
+                ORDER BY score DESC, doc_id
+                LIMIT :limit OFFSET :offset
+            """
+        case _:
+            conditions = []
+            for i, word in enumerate(words):
+                params[f"word_{i}"] = f"%{word}%"
+                conditions.append(f"body LIKE :word_{i}")
+            statement = f"""
+                SELECT doc_type, ref, body, 0 AS score
+                FROM search_documents
+                WHERE {" AND ".join(conditions)}
+                ORDER BY doc_id
+                LIMIT :limit OFFSET :offset
+            """
+
+    return [tuple(row) for row in session.exec(text(statement), params=params)]
+
+
+def _remove_document(session: Session, doc_type: str, ref: str) -> None:
+    session.exec(
+        delete(SearchDocuments)
+        .where(SearchDocuments.doc_type == doc_type)
+        .where(SearchDocuments.ref == ref)
+    )
+
+
+def _insert_documents(session: Session, documents: list[dict]) -> None:
+    if documents:
+        session.exec(insert(SearchDocuments.__table__), params=documents)
+
+
+def _sign_document(sign: str) -> dict:
+    return {"doc_type": SIGN_DOC_TYPE, "ref": sign, "body": sign}
+
+
+def _question_document(question: SQLModel) -> dict:
+    """
+    Searchable text of a question: its prompt plus every sign it uses
+    """
+
+    body = " ".join([question.text, *sorted(question_signs(question))])
+    return {"doc_type": question.question_type.name, "ref": str(question.question_id), "body": body}
@@ -0,0 +1,46 @@
+"""
+The question tables and the signs each kind of question uses
+
+Shared by the search index and the sign usage index, so both agree on which columns of a
+question hold signs.
+"""
+
+from sqlmodel import SQLModel
+
+from entities.database_entities import (
+    CameraQuestions,
+    FillInTheBlankQuestions,
+    MatchingQuestions,
+    MultipleChoiceQuestions,
+    WatchToLearnQuestions,
+)
+
+
+question_models = [
+    WatchToLearnQuestions,
+    CameraQuestions,
+    MultipleChoiceQuestions,
+    FillInTheBlankQuestions,
+    MatchingQuestions,
+]
+
+
+def question_signs(question: SQLModel) -> set[str]:
+    """
+    Every sign a question uses
+    """
+
+    match question:
+        case CameraQuestions() | WatchToLearnQuestions():
+            signs = [question.sign, question.starting_position]
+        case MultipleChoiceQuestions():
+            signs = [question.option_1, question.option_2, question.option_3, question.option_4, question.answer]
+        case FillInTheBlankQuestions():
+            signs = [question.answer]
+        case MatchingQuestions():
+            # pairs are stored as ".A.B.C.D."
+            signs = question.pairs.split(".")
+        case _:
+            signs = []
+
+    return {sign for sign in signs if sign}
@@ -0,0 +1,160 @@
+"""
+Token-bucket rate limiting for the authentication routes
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+from services.shared_store import get_store
+
+
+logger = logging.getLogger(__name__)
+
+# Only trust X-Forwarded-For when the app is deployed behind a proxy that sets it
+TRUST_PROXY_HEADERS = os.environ.get("TRUST_PROXY_HEADERS", "").lower() in {"1", "true", "yes"}
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, retry_after: float):
+        seconds = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=429,
+            detail={
+                "error": "too_many_requests",
+                "error_description": f"too many attempts, retry in {seconds} seconds",
+            },
+            headers={"Retry-After": str(seconds)},
+        )
+
+
+class TokenBucket:
+    """
+    A bucket holding up to `capacity` tokens, refilled continuously at `refill_rate` tokens per second.
+    Each request takes one token.
+    """
+
+    def __init__(self, capacity: int, refill_rate: float) -> None:
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+    @property
+    def ttl(self) -> float:
+        """
+        Seconds after which an untouched bucket is full again and no longer needs to be stored
+        """
+
+        return self.capacity / self.refill_rate
+
+    def take(self, state: Optional[list], now: float) -> list:
+        """
+        Take a token from the bucket described by `state`
+
+        :param state: [tokens, updated_at, retry_after] or None for a full bucket
+        :return: The new state. retry_after is 0 when a token was taken
+        """
+
+        if state is None:
+            tokens, updated_at = float(self.capacity), now
+        else:
+            tokens, updated_at = state[0], state[1]
+
+        tokens = min(float(self.capacity), tokens + (now - updated_at) * self.refill_rate)
+
+        if tokens >= 1:
+            return [tokens - 1, now, 0.0]
+
+        return [tokens, now, (1 - tokens) / self.refill_rate]
+
+
+class RateLimitMetrics:
+    """
+    Per-process counters of allowed and rejected requests for each limiter
+    """
+
+    def __init__(self) -> None:
+        self._allowed = Counter()
+        self._rejected = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, limiter: str, rejected_by: Optional[str]) -> None:
+        with self._lock:
+            if rejected_by is None:
+                self._allowed[limiter] += 1
+            else:
+                self._rejected[(limiter, rejected_by)] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            limiters = set(self._allowed) | {limiter for limiter, _ in self._rejected}
+            return {
+                limiter: {
+                    "allowed": self._allowed[limiter],
+                    "rejected_by_ip": self._rejected[(limiter, "ip")],
+                    "rejected_by_username": self._rejected[(limiter, "username")],
+                }
+                for limiter in sorted(limiters)
+            }
+
+
+metrics = RateLimitMetrics()
+
+
+class RateLimiter:
+    """
+    Limits requests to a route by client IP and by the username being acted on.
+    A request is rejected when either bucket is empty.
+    """
+
+    def __init__(self, name: str, per_ip: TokenBucket, per_username: TokenBucket, store=None) -> None:
+        self.name = name
+        self.per_ip = per_ip
+        self.per_username = per_username
+        self._store = store
+
+    @property
+    def store(self):
+        return self._store if self._store is not None else get_store()
+
+    def check(self, request: Request, username: str) -> None:
+        """
+        Take a token for the requesting IP and for the username
+
+        :raises RateLimitExceeded: Either bucket is empty
+        """
+
+        ip = client_ip(request)
+
+        for kind, bucket, key in (("ip", self.per_ip, ip),
+                                  ("username", self.per_username, username.casefold())):
+            retry_after = self._take(bucket, f"ratelimit:{self.name}:{kind}:{key}")
+            if retry_after:
+                metrics.record(self.name, rejected_by=kind)
+                logger.warning("rate limit [%s] rejected %s=%s", self.name, kind, key)
+                raise RateLimitExceeded(retry_after)
+
+        metrics.record(self.name, rejected_by=None)
+
+    def _take(self, bucket: TokenBucket, key: str) -> float:
+        now = time.time()
+        state = self.store.update(key, lambda state: bucket.take(state, now), ttl=bucket.ttl)
+        return state[2]
+
+
+def client_ip(request: Request) -> str:
+    """
+    Get the address of the client making a request
+    """
+
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # the proxy appends the address it saw, anything before it came from the client
+            return forwarded.split(",")[-1].strip()
+
+    return request.client.host if request.client else "unknown"
@@ -0,0 +1,229 @@
+"""
+The testing_data.json layout, shared by init_database.py and the exporter
+
+The file is one JSON object with a section per table, each mapping an arbitrary row key to
+a row: {"users": {"1227": {"user_id": 1227, ...}, ...}, "xp": {...}, ...}. seed_tables maps
+section names to tables in dependency order. read_sections walks a file section by section
+and row by row with a bounded buffer, so files of any size can be read in constant memory.
+
+Snapshots can also be written as JSON lines, one {"section": ..., "key": ..., "row": ...}
+object per line with the rows of a section next to each other, which read_jsonl_sections
+walks the same way.
+"""
+
+import json
+import re
+from datetime import date, datetime
+from itertools import groupby
+from typing import IO, Any, Iterator
+
+from sqlalchemy import Date, DateTime, Enum
+from sqlmodel import SQLModel
+
+from entities.database_entities import (
+    CameraQuestions,
+    CameraQuestionsInLesson,
+    FillInTheBlankQuestions,
+    FillInTheBlankQuestionsInLesson,
+    Friends,
+    Lessons,
+    LessonsInUnit,
+    MatchingQuestions,
+    MatchingQuestionsInLesson,
+    MultipleChoiceQuestions,
+    MultipleChoiceQuestionsInLesson,
+    Signs,
+    Units,
+    UserXP,
+    Users,
+    WatchToLearnQuestions,
+    WatchToLearnQuestionsInLesson,
+)
+
+
+# section name -> table, every table after the tables it references
+seed_tables: dict[str, type[SQLModel]] = {
+    "users": Users,
+    "xp": UserXP,
+    "friends": Friends,
+    "signs": Signs,
+    "units": Units,
+    "lessons": Lessons,
+    "lessons_in_unit": LessonsInUnit,
+    "watch_to_learn_questions": WatchToLearnQuestions,
+    "camera_questions": CameraQuestions,
+    "multiple_choice_questions": MultipleChoiceQuestions,
+    "fill_in_the_blank_questions": FillInTheBlankQuestions,
+    "matching_questions": MatchingQuestions,
+    "watch_to_learn_questions_in_lesson": WatchToLearnQuestionsInLesson,
+    "camera_questions_in_lesson": CameraQuestionsInLesson,
+    "multiple_choice_questions_in_lesson": MultipleChoiceQuestionsInLesson,
+    "fill_in_the_blank_questions_in_lesson": FillInTheBlankQuestionsInLesson,
+    "matching_questions_in_lesson": MatchingQuestionsInLesson,
+}
+
+
+def from_json(model: type[SQLModel], data: dict) -> dict:
+    """
+    Turn a row of the file into insert parameters for a table. Every column of the table is
+    given a value, its scalar default when the row leaves it out, so rows can be inserted
+    together with executemany
+    """
+
+    row = {}
+    for column in model.__table__.columns:
+        if column.name in data:
+            value = data[column.name]
+            if isinstance(value, str) and isinstance(column.type, DateTime):
+                value = datetime.fromisoformat(value)
+            elif isinstance(value, str) and isinstance(column.type, Date):
+                value = date.fromisoformat(value)
+        elif column.default is not None and column.default.is_scalar:
+            value = column.default.arg
+        else:
+            value = None
+        row[column.name] = value
+
+    return row
+
+
+def to_json(model: type[SQLModel], row: dict) -> dict:
+    """
+    Turn a row of a table into a row of the file
+    """
+
+    data = {}
+    for column in model.__table__.columns:
+        value = row[column.name]
+        if isinstance(value, (date, datetime)):
+            value = value.isoformat()
+        elif isinstance(column.type, Enum) and value is not None:
+            value = value.name
+        data[column.name] = value
+
+    return data
+
+
+def row_key(model: type[SQLModel], data: dict) -> str:
+    """
+    The key of a row in the file: its primary key, joined with - when it has several columns
+
+    :param data: The row as returned by to_json
+    """
+
+    return "-".join(str(data[column.name]) for column in model.__table__.primary_key.columns)
+
+
+def read_sections(stream: IO[str]) -> Iterator[tuple[str, Iterator[tuple[str, dict]]]]:
+    """
+    Walk a file in the testing_data.json layout
+
+    :return: (section name, rows) pairs in file order, where rows yields (row key, row) pairs.
+        The rows of a section must be used before moving on to the next section
+    """
+
+    reader = _Reader(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+
+    while True:
+        name = reader.string()
+        reader.expect(":")
+
+        rows = _read_rows(reader)
+        yield name, rows
+        for _ in rows:
+            pass # skip what the caller did not read
+
+        if reader.expect(",}") == "}":
+            return
+
+
+def read_jsonl_sections(stream: IO[str]) -> Iterator[tuple[str, Iterator[tuple[str, dict]]]]:
+    """
+    Walk a JSON lines snapshot, see read_sections
+    """
+
+    lines = (json.loads(line) for line in stream if line.strip())
+    for name, records in groupby(lines, key=lambda record: record["section"]):
+        yield name, ((record["key"], record["row"]) for record in records)
+
+
+def _read_rows(reader: "_Reader") -> Iterator[tuple[str, dict]]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.expect("}")
+        return
+
+    while True:
+        key = reader.string()
+        reader.expect(":")
+        yield key, reader.object()
+
+        if reader.expect(",}") == "}":
+            return
+
+
+class _Reader:
+    """
+    Reads JSON tokens from a stream through a buffer that only holds the current value
+    """
+
+    _whitespace = re.compile(r"\s*")
+
+    def __init__(self, stream: IO[str], chunk_size: int = 1 << 16) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+
+    def peek(self) -> str:
+        """
+        The next character that is not whitespace
+        """
+
+        while True:
+            self._pos = self._whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("unexpected end of file")
+
+    def expect(self, allowed: str) -> str:
+        char = self.peek()
+        if char not in allowed:
+            raise ValueError(f"expected one of {allowed!r} but found {char!r}")
+        self._pos += 1
+        return char
+
+    def string(self) -> str:
+        if self.peek() != '"':
+            raise ValueError(f"expected a string but found {self.peek()!r}")
+        return self._value()
+
+    def object(self) -> dict:
+        if self.peek() != "{":
+            raise ValueError(f"expected an object but found {self.peek()!r}")
+        return self._value()
+
+    def _value(self) -> Any:
+        # only strings and objects are decoded here, which cannot be cut short by the end
+        # of the buffer the way a number can, so a failed decode means more data is needed
+        while True:
+            try:
+                value, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+                return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def _fill(self) -> bool:
+        data = self._stream.read(self._chunk_size)
+        if not data:
+            return False
+
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return True
@@ -0,0 +1,171 @@
+"""
+Key/value state for the in-memory subsystems (rate limiting)
+
+Every worker process keeps its own LocalStore by default. Setting SHARED_STORE_URL to a
+redis url makes all workers share one store instead. redis is an optional dependency and
+is only imported when a shared store is configured.
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class LocalStore:
+    """
+    Thread-safe, in-process key/value store with per-key expiry.
+
+    Stands in for the shared backend in development, testing and single-worker deployments.
+    Expired keys are swept automatically as the store is written to.
+    """
+
+    def __init__(self, sweep_interval: float = 30.0) -> None:
+        self._data: dict[str, tuple[Any, Optional[float]]] = {}
+        self._expiry: list[tuple[float, str]] = []  # min-heap of (expires_at, key)
+        self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            return self._get(key, time.monotonic(), default)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._set(key, value, ttl, time.monotonic())
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Atomically replace the value at key with fn(current value) and return the new value.
+        fn receives None when the key is missing or expired.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            value = fn(self._get(key, now, None))
+            self._set(key, value, ttl, now)
+            return value
+
+    def sweep(self) -> int:
+        """
+        Remove every expired key
+
+        :return: The number of keys removed
+        """
+
+        with self._lock:
+            return self._sweep(time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, key: str, now: float, default: Any) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return default
+
+        return value
+
+    def _set(self, key: str, value: Any, ttl: Optional[float], now: float) -> None:
+        expires_at = None if ttl is None else now + ttl
+        self._data[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiry, (expires_at, key))
+
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+
+            # the key may have been overwritten with a later expiry since this entry was pushed
+            if entry is not None and entry[1] == expires_at:
+                del self._data[key]
+                removed += 1
+
+        self._next_sweep = now + self._sweep_interval
+        return removed
+
+
+class RedisStore:
+    """
+    Store shared between worker processes, backed by redis. Values are stored as JSON,
+    so tuples come back as lists.
+    """
+
+    def __init__(self, url: str) -> None:
+        import redis  # optional dependency, only needed for a shared store
+
+        self._redis = redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raw = self._client.get(key)
+        return default if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._client.set(key, json.dumps(value), px=_ttl_ms(ttl))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """
+        Atomically replace the value at key with fn(current value) and return the new value.
+        Uses an optimistic WATCH/MULTI transaction that is retried on conflict.
+        """
+
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    value = fn(None if raw is None else json.loads(raw))
+                    pipe.multi()
+                    pipe.set(key, json.dumps(value), px=_ttl_ms(ttl))
+                    pipe.execute()
+                    return value
+                except self._redis.WatchError:
+                    continue
+
+    def sweep(self) -> int:
+        # redis expires keys on its own
+        return 0
+
+
+def _ttl_ms(ttl: Optional[float]) -> Optional[int]:
+    return None if ttl is None else max(1, int(ttl * 1000))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Get the process-wide store. A RedisStore when SHARED_STORE_URL is set, otherwise a LocalStore
+    """
+
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            url = os.environ.get("SHARED_STORE_URL")
+            _store = RedisStore(url) if url else LocalStore()
+
+    return _store
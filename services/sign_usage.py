@@ -0,0 +1,91 @@
+"""
+Index of which questions use which signs
+
+Every sign a question uses, as listed by question_signs.question_signs, is kept in
+sign_usage, written in the same transaction as the question. The table is keyed by (sign, question_type, question_id), so
+finding where a sign is used, across every question type, is a range scan of its primary key.
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert
+from sqlmodel import Session, SQLModel, select
+
+from entities.database_entities import QuestionType, SignUsage
+from services.question_signs import question_models, question_signs
+
+
+def create_sign_usage_index(engine) -> None:
+    """
+    Fill sign_usage from the question tables if it is empty, e.g. when it was just created
+    """
+
+    with Session(engine) as session:
+        if not session.exec(select(func.count()).select_from(SignUsage)).one():
+            rebuild_sign_usage(session)
+            session.commit()
+
+
+def rebuild_sign_usage(session: Session) -> None:
+    """
+    Rewrite sign_usage from the question tables. Does not commit
+    """
+
+    session.exec(delete(SignUsage))
+
+    for model in question_models:
+        index_questions(session, session.exec(select(model)).all())
+
+
+def index_questions(session: Session, questions: Iterable[SQLModel]) -> None:
+    """
+    Record the signs used by newly inserted questions with one batched insert. The questions
+    must have ids. Does not commit
+    """
+
+    rows = [
+        {"sign": sign, "question_type": question.question_type, "question_id": question.question_id}
+        for question in questions
+        for sign in question_signs(question)
+    ]
+    if rows:
+        session.exec(insert(SignUsage.__table__), params=rows)
+
+
+def remove_questions(session: Session, question_type: QuestionType, question_ids: Iterable[int]) -> None:
+    """
+    Forget the signs used by questions of one type. Does not commit
+    """
+
+    question_ids = list(question_ids)
+    if question_ids:
+        session.exec(
+            delete(SignUsage)
+            .where(SignUsage.question_type == question_type)
+            .where(SignUsage.question_id.in_(question_ids))
+        )
+
+
+def find_usage(session: Session, sign: str, question_type: Optional[QuestionType] = None,
+               offset: int = 0, limit: int = 20) -> list[tuple[QuestionType, int]]:
+    """
+    Get the questions that use a sign, ordered by question type and id
+
+    :param question_type: Only return questions of this type
+    :return: (question type, question id) pairs
+    """
+
+    query = select(SignUsage.question_type, SignUsage.question_id).where(SignUsage.sign == sign)
+    if question_type is not None:
+        query = query.where(SignUsage.question_type == question_type)
+
+    query = query.order_by(SignUsage.question_type, SignUsage.question_id).offset(offset).limit(limit)
+    return session.exec(query).all()
+
+
+def count_usage(session: Session, sign: str) -> int:
+    """
+    Count the questions that use a sign
+    """
+
+    return session.exec(select(func.count()).select_from(SignUsage).where(SignUsage.sign == sign)).one()
@@ -0,0 +1,76 @@
+"""
+In-memory vocabulary of signs and their image paths
+
+Loaded at startup and kept up to date by create_sign, update_sign and delete_sign, so looking
+up a sign's image path is a dictionary operation. Checks that the signs of a new question
+exist always go to the database, since another worker process may have created or deleted
+them, and correct the vocabulary from what they find. Changes made through another worker are
+otherwise picked up at the next reload, every SIGN_VOCABULARY_RELOAD_INTERVAL seconds.
+"""
+
+import os
+import threading
+from typing import Optional
+
+from sqlmodel import Session, select
+
+from entities.database_entities import Signs
+from services.periodic import PeriodicReloader
+
+
+SIGN_VOCABULARY_RELOAD_INTERVAL = float(os.environ.get("SIGN_VOCABULARY_RELOAD_INTERVAL", 300))  # seconds
+
+
+class SignVocabulary:
+    """
+    Every known sign mapped to its image path
+    """
+
+    def __init__(self) -> None:
+        self._image_paths: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+        self._reloader = PeriodicReloader(name="sign-vocabulary", interval=SIGN_VOCABULARY_RELOAD_INTERVAL, reload=self.reload)
+
+    def __contains__(self, sign: str) -> bool:
+        return sign in self._image_paths
+
+    def __len__(self) -> int:
+        return len(self._image_paths)
+
+    def image_path(self, sign: str) -> Optional[str]:
+        """
+        Get the image path of a sign, or None if the sign is not in the vocabulary
+        """
+
+        return self._image_paths.get(sign)
+
+    def put(self, sign: str, image_path: str) -> None:
+        with self._lock:
+            self._image_paths[sign] = image_path
+
+    def remove(self, sign: str) -> None:
+        with self._lock:
+            self._image_paths.pop(sign, None)
+
+    def reload(self, session: Session) -> None:
+        """
+        Replace the vocabulary with the signs table
+        """
+
+        image_paths = dict(session.exec(select(Signs.sign, Signs.image_path)).all())
+        with self._lock:
+            self._image_paths = image_paths
+
+    def start(self, engine) -> None:
+        """
+        Load the vocabulary and keep reloading it in the background
+        """
+
+        self._reloader.start(engine)
+
+    def stop(self) -> None:
+        self._reloader.stop()
+
+
+sign_vocabulary = SignVocabulary()
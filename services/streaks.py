@@ -0,0 +1,50 @@
+"""
+Daily xp streaks
+
+A user's streak is the number of consecutive days, ending today or yesterday, on which they
+earned xp. users.current_streak, users.longest_streak and users.last_xp_day are advanced
+on every xp write, so streaks are read from the user row rather than computed from user_xp.
+"""
+
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+
+def advance_streak(current: int, longest: int, last_day: Optional[date], day: date) -> tuple[int, int]:
+    """
+    Advance a streak for xp earned on a given day
+
+    :return: The new current and longest streak
+    """
+
+    if last_day is not None and day <= last_day:
+        return current, longest
+
+    current = current + 1 if last_day == day - timedelta(days=1) else 1
+    return current, max(longest, current)
+
+
+def active_streak(current: int, last_day: Optional[date], today: date) -> int:
+    """
+    Get the current streak as of today. A streak is broken once a whole day passes without xp
+    """
+
+    if last_day is None or last_day < today - timedelta(days=1):
+        return 0
+
+    return current
+
+
+def project_streak(current: int, longest: int, last_day: Optional[date],
+                   pending_days: Iterable[date], today: date) -> tuple[int, int]:
+    """
+    Get a user's current and longest streak as of today, including days with xp
+    that have not been written to the database yet
+    """
+
+    for day in sorted(pending_days):
+        if last_day is None or day > last_day:
+            current, longest = advance_streak(current, longest, last_day, day)
+            last_day = day
+
+    return active_streak(current, last_day, today), longest
@@ -0,0 +1,66 @@
+"""
+Token versions of users whose permissions have changed
+
+Access tokens carry the user's token_version from when they were issued. Changing a
+user's permissions bumps Users.token_version, and tokens with an older version are
+rejected. Only users whose version has ever been bumped are kept in memory, so checking a
+token is a dictionary lookup with no database work. The map is updated immediately in
+the worker that made the change, and other workers see it within
+TOKEN_VERSION_RELOAD_INTERVAL seconds.
+"""
+
+import os
+import threading
+
+from sqlmodel import Session, select
+
+from entities.database_entities import Users
+from services.periodic import PeriodicReloader
+
+
+TOKEN_VERSION_RELOAD_INTERVAL = float(os.environ.get("TOKEN_VERSION_RELOAD_INTERVAL", 30))  # seconds
+
+
+class TokenVersions:
+    """
+    The current token version of every user whose version is above 0
+    """
+
+    def __init__(self) -> None:
+        self._versions: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+        self._reloader = PeriodicReloader(name="token-versions", interval=TOKEN_VERSION_RELOAD_INTERVAL, reload=self.reload)
+
+    def is_current(self, user_id: int, version: int) -> bool:
+        """
+        Check that a token version is not older than the user's current version
+        """
+
+        return version >= self._versions.get(user_id, 0)
+
+    def set(self, user_id: int, version: int) -> None:
+        with self._lock:
+            self._versions[user_id] = max(version, self._versions.get(user_id, 0))
+
+    def reload(self, session: Session) -> None:
+        """
+        Replace the map with the users table
+        """
+
+        versions = dict(session.exec(select(Users.user_id, Users.token_version).where(Users.token_version > 0)).all())
+        with self._lock:
+            self._versions = versions
+
+    def start(self, engine) -> None:
+        """
+        Load the token versions and keep reloading them in the background
+        """
+
+        self._reloader.start(engine)
+
+    def stop(self) -> None:
+        self._reloader.stop()
+
+
+token_versions = TokenVersions()
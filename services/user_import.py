@@ -0,0 +1,230 @@
+"""
+Bulk registration of users from CSV or JSONL
+
+Used by POST /admin/users/import and by import_users.py. Rows are streamed from the file
+and handled in chunks of USER_IMPORT_CHUNK_SIZE: usernames and emails are checked against
+the database with one query each per chunk, passwords are hashed by password_hasher, and
+each chunk is inserted with one executemany INSERT in its own transaction. A bad row is
+reported with its line number and does not stop the import.
+
+password_hasher spreads bcrypt across a pool of USER_IMPORT_WORKERS processes. The pool is
+created by the first import and then shared by every later import in the process, so
+server workers that never run an import never start it.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterable
+
+from passlib.hash import bcrypt
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from entities.database_entities import Users
+from entities.user_entities import UserImportError, UserImportResponse, UserRegistration
+from services.import_rows import ImportRow
+
+
+logger = logging.getLogger(__name__)
+
+# This silences a warning that will show up because of bcrypt/passlib versioning: https://github.com/pyca/bcrypt/issues/684
+logging.getLogger('passlib').setLevel(logging.ERROR)
+
+USER_IMPORT_CHUNK_SIZE = int(os.environ.get("USER_IMPORT_CHUNK_SIZE", 500))
+USER_IMPORT_WORKERS = int(os.environ.get("USER_IMPORT_WORKERS", os.cpu_count() or 1))
+
+
+class PasswordHasher:
+    """
+    Hashes passwords with bcrypt across a process pool that is created on first use
+    """
+
+    def __init__(self) -> None:
+        self._executor = None
+        self._workers = 1
+        self._lock = threading.Lock()
+
+    def start(self, workers: int = USER_IMPORT_WORKERS) -> None:
+        """
+        Create the pool now rather than on first use, e.g. to choose its size
+        """
+
+        self._pool(workers)
+
+    def stop(self) -> None:
+        """
+        Shut the pool down if it was ever created
+        """
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def hash_all(self, passwords: list[str]) -> list[str]:
+        executor = self._pool()
+        return list(executor.map(_hash_password, passwords, chunksize=max(1, len(passwords) // (self._workers * 4))))
+
+    def _pool(self, workers: int = USER_IMPORT_WORKERS) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork, the server process has threads running
+                self._executor = ProcessPoolExecutor(max_workers=workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+                self._workers = workers
+            return self._executor
+
+
+def import_users(engine, rows: Iterable[ImportRow], chunk_size: int = USER_IMPORT_CHUNK_SIZE) -> UserImportResponse:
+    """
+    Register every valid row as a new user
+
+    :param rows: Rows from read_rows
+    :return: The number of users created, the rows that were rejected and the throughput
+    """
+
+    started = time.perf_counter()
+    created = 0
+    errors: list[UserImportError] = []
+    seen_usernames, seen_emails = set(), set()
+
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        with Session(engine) as session:
+            registrations = _validate_chunk(session, chunk, seen_usernames, seen_emails, errors)
+            if not registrations:
+                continue
+
+            hashes = password_hasher.hash_all([registration.password for _, registration in registrations])
+            values = [
+                {
+                    "username": registration.username,
+                    "email": registration.email,
+                    "first_name": registration.first_name,
+                    "last_name": registration.last_name,
+                    "password": password_hash,
+                    "created_at": datetime.today(),
+                }
+                for (_, registration), password_hash in zip(registrations, hashes)
+            ]
+
+            created += _insert_chunk(session, registrations, values, errors)
+
+        elapsed = time.perf_counter() - started
+        logger.info("imported %s users in %.1fs (%.1f users/sec)", created, elapsed, created / elapsed)
+
+    seconds = time.perf_counter() - started
+    errors.sort(key=lambda error: error.line)
+    return UserImportResponse(
+        created=created,
+        errors=errors,
+        seconds=round(seconds, 3),
+        users_per_second=round(created / seconds, 1) if seconds else 0.0,
+    )
+
+
+def _validate_chunk(session: Session, chunk: list[ImportRow], seen_usernames: set, seen_emails: set,
+                    errors: list[UserImportError]) -> list[tuple[int, UserRegistration]]:
+    """
+    Validate a chunk of rows, checking usernames and emails against the database with one query each
+
+    :return: (line number, registration) pairs of the valid rows
+    """
+
+    valid = []
+    for line, row, error in chunk:
+        if error is not None:
+            errors.append(UserImportError(line=line, error=error))
+            continue
+
+        try:
+            registration = UserRegistration.model_validate({"first_name": "", "last_name": "", **row})
+        except ValidationError as e:
+            errors.append(UserImportError(line=line, username=row.get("username"), error=_describe(e)))
+            continue
+
+        missing = [field for field in ("username", "email", "password") if not getattr(registration, field)]
+        if missing:
+            errors.append(UserImportError(line=line, username=registration.username,
+                                          error=f"missing {', '.join(missing)}"))
+        elif registration.username in seen_usernames:
+            errors.append(UserImportError(line=line, username=registration.username, error="duplicate username in file"))
+        elif registration.email in seen_emails:
+            errors.append(UserImportError(line=line, username=registration.username, error="duplicate email in file"))
+        else:
+            seen_usernames.add(registration.username)
+            seen_emails.add(registration.email)
+            valid.append((line, registration))
+
+    if not valid:
+        return []
+
+    taken_usernames = set(session.exec(
+        select(Users.username).where(Users.username.in_([registration.username for _, registration in valid]))
+    ).all())
+    taken_emails = set(session.exec(
+        select(Users.email).where(Users.email.in_([registration.email for _, registration in valid]))
+    ).all())
+
+    available = []
+    for line, registration in valid:
+        if registration.username in taken_usernames:
+            errors.append(UserImportError(line=line, username=registration.username, error="username already exists"))
+        elif registration.email in taken_emails:
+            errors.append(UserImportError(line=line, username=registration.username, error="email already exists"))
+        else:
+            available.append((line, registration))
+
+    return available
+
+
+def _insert_chunk(session: Session, registrations: list[tuple[int, UserRegistration]], values: list[dict],
+                  errors: list[UserImportError]) -> int:
+    """
+    Insert a chunk of users in one transaction
+
+    :return: The number of users inserted
+    """
+
+    users = Users.__table__
+
+    try:
+        session.exec(insert(users), params=values)
+        session.commit()
+        return len(values)
+    except IntegrityError:
+        session.rollback()
+
+    # a user signed up with one of these usernames or emails since the chunk was checked,
+    # so fall back to one transaction per row to find which
+    inserted = 0
+    for (line, registration), row in zip(registrations, values):
+        try:
+            session.exec(insert(users), params=[row])
+            session.commit()
+            inserted += 1
+        except IntegrityError:
+            session.rollback()
+            errors.append(UserImportError(line=line, username=registration.username,
+                                          error="username or email already exists"))
+
+    return inserted
+
+
+def _hash_password(password: str) -> str:
+    return bcrypt.hash(password)
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors())
+
+
+password_hasher = PasswordHasher()
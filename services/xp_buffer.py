@@ -0,0 +1,213 @@
+"""
+Write-behind buffering of user xp
+
+When XP_WRITE_BEHIND is set to 1, true or yes, xp increments are coalesced in memory per (user_id, day) and
+written to the database in batches, either every XP_FLUSH_INTERVAL seconds or once
+XP_FLUSH_THRESHOLD distinct (user_id, day) pairs are pending. Reads add the pending
+increments to the stored values, so a user always sees their own xp.
+
+Buffers are per worker process. Pending xp is only visible to the worker that received it
+until the next flush, and is lost if the process is killed without shutting down cleanly.
+"""
+
+import logging
+import os
+import threading
+from datetime import date
+
+from sqlmodel import Session
+
+import database as db
+from entities.database_entities import Users
+from entities.user_entities import XpResponse
+from services.streaks import project_streak
+
+
+logger = logging.getLogger(__name__)
+
+XP_WRITE_BEHIND = os.environ.get("XP_WRITE_BEHIND", "").lower() in {"1", "true", "yes"}
+XP_FLUSH_INTERVAL = float(os.environ.get("XP_FLUSH_INTERVAL", 5))  # seconds
+XP_FLUSH_THRESHOLD = int(os.environ.get("XP_FLUSH_THRESHOLD", 1000))
+
+
+class XpBuffer:
+    """
+    Coalesces xp increments in memory and flushes them to the database in batches
+    """
+
+    def __init__(self, flush_interval: float, flush_threshold: int, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        # user_id -> day -> xp
+        self._pending: dict[int, dict[date, int]] = {}
+        self._in_flight: dict[int, dict[date, int]] = {}
+        self._pending_rows = 0
+
+        # Held while pending xp is read or a flush is committed, so a read never
+        # sees a flushed increment both in the database and in memory
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def start(self) -> None:
+        """
+        Start the background thread that flushes the buffer
+        """
+
+        if self._worker is not None:
+            return
+
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, name="xp-buffer", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background thread and flush everything still pending
+        """
+
+        if self._worker is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._worker.join()
+            self._worker = None
+
+        self.flush()
+
+    def add(self, session: Session, user: Users, amount: int) -> XpResponse:
+        """
+        Buffer an xp increment for today
+
+        :return: The user's daily and total xp including the buffered increment
+        """
+
+        db.get_user_by_id(session=session, user_id=user.user_id)
+
+        with self._lock:
+            if self._add_pending(user_id=user.user_id, day=date.today(), amount=amount) >= self.flush_threshold:
+                self._wake.set()
+
+        return self.get_user_xp(session=session, user=user)
+
+    def get_user_xp(self, session: Session, user: Users) -> XpResponse:
+        """
+        Get a user's daily and total xp and streak, stored plus pending
+        """
+
+        today = date.today()
+
+        with self._lock:
+            # the row loaded when the request was authenticated may predate a flush that has
+            # since cleared its increments from memory, so read it again under the lock
+            user = db.get_user_by_id(session=session, user_id=user.user_id)
+            session.refresh(user)
+            stored = db.get_user_xp(session=session, user=user)
+            daily_xp, total_xp = self.pending_xp(user_id=user.user_id, day=today)
+            pending_days = self.pending_days(user_id=user.user_id)
+
+        current_streak, longest_streak = project_streak(
+            user.current_streak, user.longest_streak, user.last_xp_day, pending_days, today
+        )
+
+        return XpResponse(
+            user_id=stored.user_id,
+            daily_xp=stored.daily_xp + daily_xp,
+            total_xp=stored.total_xp + total_xp,
+            current_streak=current_streak,
+            longest_streak=longest_streak,
+        )
+
+    def pending_xp(self, user_id: int, day: date) -> tuple[int, int]:
+        """
+        Get the xp not yet written to the database for a user
+
+        :return: The pending xp for the given day and the pending xp across all days
+        """
+
+        with self._lock:
+            daily_xp, total_xp = 0, 0
+            for pending in (self._pending, self._in_flight):
+                user_pending = pending.get(user_id, {})
+                total_xp += sum(user_pending.values())
+                daily_xp += user_pending.get(day, 0)
+
+            return daily_xp, total_xp
+
+    def pending_days(self, user_id: int) -> list[date]:
+        """
+        Get the days with xp for a user that have not been written to the database yet
+        """
+
+        with self._lock:
+            return sorted(set(self._pending.get(user_id, {})) | set(self._in_flight.get(user_id, {})))
+
+    def flush(self) -> int:
+        """
+        Write all pending xp to the database in a single transaction
+
+        :return: The number of (user_id, day) rows written
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._in_flight, self._pending = self._pending, {}
+                self._pending_rows = 0
+
+            increments = {
+                (user_id, day): amount
+                for user_id, days in self._in_flight.items()
+                for day, amount in days.items()
+            }
+
+            try:
+                with Session(db.engine) as session:
+                    db.add_xp_batch(session=session, increments=increments)
+
+                    with self._lock:
+                        session.commit()
+                        self._in_flight = {}
+
+                return len(increments)
+
+            except Exception:
+                logger.exception("failed to flush buffered xp, will retry")
+                with self._lock:
+                    for (user_id, day), amount in increments.items():
+                        self._add_pending(user_id=user_id, day=day, amount=amount)
+                    self._in_flight = {}
+                return 0
+
+    def _add_pending(self, user_id: int, day: date, amount: int) -> int:
+        """
+        Add to the pending xp of a (user_id, day) pair. Caller must hold the lock
+
+        :return: The number of pending (user_id, day) pairs
+        """
+
+        user_pending = self._pending.setdefault(user_id, {})
+        if day not in user_pending:
+            user_pending[day] = 0
+            self._pending_rows += 1
+
+        user_pending[day] += amount
+        return self._pending_rows
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+xp_buffer = XpBuffer(
+    flush_interval=XP_FLUSH_INTERVAL,
+    flush_threshold=XP_FLUSH_THRESHOLD,
+    enabled=XP_WRITE_BEHIND,
+)
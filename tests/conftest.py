@@ -0,0 +1,25 @@
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+import database as db
+from entities.database_entities import Users
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """
+    A fresh sqlite database with one user, user_id 1, used in place of the app's database
+    """
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Users(user_id=1, username="learner", email="learner@example.com", password=""))
+        session.commit()
+
+    monkeypatch.setattr(db, "engine", engine)
+    yield engine
+    engine.dispose()
@@ -0,0 +1,43 @@
+"""
+Fan-out of friend activity and trimming of feeds
+"""
+
+from sqlmodel import Session, select
+
+from entities.database_entities import ActivityFeed, ActivityType, Friends, Users
+from services import activity_feed
+
+
+def test_feeds_keep_only_their_newest_rows(engine, monkeypatch):
+    monkeypatch.setattr(activity_feed, "FEED_MAX_LENGTH", 5)
+
+    with Session(engine) as session:
+        for user_id in (2, 3):
+            session.add(Users(user_id=user_id, username=f"friend{user_id}", email=f"{user_id}@example.com", password=""))
+        # user 3's feed already has two rows from user 2
+        for xp in (100, 101):
+            session.add(ActivityFeed(owner_id=3, actor_id=2, activity_type=ActivityType.XP_MILESTONE, xp=xp))
+        # user 2 has user 1 as a friend, so user 1's activity goes to user 2's feed
+        session.add(Friends(follower_id=1, followed_id=2))
+        session.commit()
+
+        published = [
+            activity_feed.publish(session=session, actor_id=1, activity_type=ActivityType.XP_MILESTONE, xp=xp)
+            for xp in range(1, 8)
+        ]
+
+        # user 3 adds user 1 late, so the last publish reaches a feed that is still short of the cap
+        session.add(Friends(follower_id=1, followed_id=3))
+        session.commit()
+        published.append(activity_feed.publish(session=session, actor_id=1, activity_type=ActivityType.XP_MILESTONE, xp=8))
+
+        feeds = {
+            owner_id: [row.xp for row, _ in activity_feed.get_feed(session=session, owner_id=owner_id, limit=50)]
+            for owner_id in (2, 3)
+        }
+        remaining = session.exec(select(ActivityFeed)).all()
+
+    assert published == [1] * 7 + [2]
+    assert feeds[2] == [8, 7, 6, 5, 4]
+    assert feeds[3] == [8, 101, 100]
+    assert len(remaining) == 8
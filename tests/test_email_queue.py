@@ -0,0 +1,89 @@
+"""
+Queued emails are sent to a local stand-in SMTP server, retried after a refused
+connection, and their bodies are cleared once sent or failed for good
+"""
+
+import socket
+from datetime import datetime
+
+import pytest
+from sqlmodel import Session
+
+from entities.database_entities import EmailStatus, OutboundEmails
+from services import email_queue as email_queue_module
+from services.email_queue import EmailQueue
+from services.local_smtp import LocalSmtpServer
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    with LocalSmtpServer(host="localhost", port=0) as server:
+        server.start()
+        monkeypatch.setattr(email_queue_module, "SMTP_HOST", "localhost")
+        monkeypatch.setattr(email_queue_module, "SMTP_PORT", server.port)
+        monkeypatch.setattr(email_queue_module, "SMTP_SECURITY", "none")
+        monkeypatch.setattr(email_queue_module, "SMTP_PASSWORD", "")
+        yield server
+        server.shutdown()
+
+
+def closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def test_send_after_a_refused_connection(engine, smtp_server, monkeypatch):
+    queue = EmailQueue(retry_backoff=60, enabled=True)
+
+    with Session(engine) as session:
+        email_id = queue.enqueue(session=session, recipient="learner@example.com", subject="Your code",
+                                 body="Your one time password is 12345").email_id
+
+    monkeypatch.setattr(email_queue_module, "SMTP_PORT", closed_port())
+    assert queue.drain(engine) == 0
+
+    with Session(engine) as session:
+        email = session.get(OutboundEmails, email_id)
+        assert email.status == EmailStatus.PENDING
+        assert email.attempts == 1
+        assert email.last_error
+        assert email.body == "Your one time password is 12345"
+        assert email.next_attempt_at > datetime.now()
+
+        # the backoff has passed and the server is reachable again
+        email.next_attempt_at = datetime.now()
+        session.commit()
+
+    monkeypatch.setattr(email_queue_module, "SMTP_PORT", smtp_server.port)
+    assert queue.drain(engine) == 1
+    queue.stop()
+
+    [message] = smtp_server.messages
+    assert message["To"] == "learner@example.com"
+    assert message["Subject"] == "Your code"
+    assert "12345" in message.get_payload()
+
+    with Session(engine) as session:
+        email = session.get(OutboundEmails, email_id)
+        assert email.status == EmailStatus.SENT
+        assert email.attempts == 2
+        assert email.body == ""
+
+
+def test_body_is_cleared_when_sending_fails_for_good(engine, smtp_server, monkeypatch):
+    queue = EmailQueue(max_attempts=2, retry_backoff=0, enabled=True)
+    monkeypatch.setattr(email_queue_module, "SMTP_PORT", closed_port())
+
+    with Session(engine) as session:
+        email_id = queue.enqueue(session=session, recipient="learner@example.com", subject="Your code",
+                                 body="Your one time password is 12345").email_id
+
+    assert queue.drain(engine) == 0
+
+    with Session(engine) as session:
+        email = session.get(OutboundEmails, email_id)
+        assert email.status == EmailStatus.FAILED
+        assert email.attempts == 2
+        assert email.body == ""
+    assert smtp_server.messages == []
@@ -0,0 +1,65 @@
+"""
+Leaderboard ranking and rebuilds
+"""
+
+import bisect
+import random
+from datetime import date
+
+from sqlmodel import Session
+
+import database as db
+from services.leaderboard import Leaderboards, RankedBoard, SortedList
+
+
+def test_sorted_list_matches_a_sorted_python_list(monkeypatch):
+    # small sublists so splits and merges happen often
+    monkeypatch.setattr(SortedList, "LOAD", 3)
+    rng = random.Random(7)
+    expected = sorted(rng.sample(range(1000), 200))
+    values = SortedList(expected)
+
+    for _ in range(3000):
+        if expected and rng.random() < 0.45:
+            value = rng.choice(expected)
+            values.remove(value)
+            expected.remove(value)
+        else:
+            value = rng.randrange(1000) + rng.random()
+            values.add(value)
+            bisect.insort(expected, value)
+
+        probe = rng.randrange(-10, 1010)
+        offset, limit = rng.randrange(len(expected) + 2), rng.randrange(20)
+        assert values.bisect_left(probe) == bisect.bisect_left(expected, probe)
+        assert values.slice(offset, limit) == expected[offset:offset + limit]
+        assert len(values) == len(expected)
+
+
+def test_ties_share_a_rank():
+    board = RankedBoard()
+    board.load([(1, 30), (2, 50), (3, 30), (4, 10)])
+    board.add(4, 40)
+
+    assert board.page(offset=0, limit=10) == [(1, 2, 50), (1, 4, 50), (3, 1, 30), (3, 3, 30)]
+    assert board.rank(3) == 3
+
+
+def test_xp_recorded_during_a_rebuild_is_kept(engine, monkeypatch):
+    leaderboards = Leaderboards()
+    with Session(engine) as session:
+        db.update_user_xp(session=session, user=session.get(db.Users, 1), amount=10)
+
+    read_boards = leaderboards._read_boards
+
+    def read_while_xp_is_recorded(session):
+        boards = read_boards(session)
+        leaderboards.record_xp(user_id=1, day=date.today(), amount=5)
+        return boards
+
+    monkeypatch.setattr(leaderboards, "_read_boards", read_while_xp_is_recorded)
+    with Session(engine) as session:
+        leaderboards.rebuild(session)
+
+    assert leaderboards.position("all-time", user_id=1) == (1, 15)
+    assert leaderboards.position("daily", user_id=1) == (1, 15)
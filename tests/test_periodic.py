@@ -0,0 +1,31 @@
+"""
+The periodic reloader loads once on start, keeps reloading after errors and stops cleanly
+"""
+
+import threading
+import time
+
+from services.periodic import PeriodicReloader
+
+
+def test_reloads_until_stopped(engine):
+    reloads = []
+    reloaded_three_times = threading.Event()
+
+    def reload(session):
+        reloads.append(session)
+        if len(reloads) == 2:
+            raise RuntimeError("database unavailable")
+        if len(reloads) == 3:
+            reloaded_three_times.set()
+
+    reloader = PeriodicReloader(name="test-reloader", interval=0.01, reload=reload)
+    reloader.start(engine)
+    assert len(reloads) >= 1
+
+    assert reloaded_three_times.wait(timeout=5)
+    reloader.stop()
+
+    stopped_at = len(reloads)
+    time.sleep(0.05)
+    assert len(reloads) == stopped_at
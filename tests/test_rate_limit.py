@@ -0,0 +1,40 @@
+"""
+The client address used for rate limiting must not be spoofable
+"""
+
+import importlib
+
+import pytest
+from starlette.requests import Request
+
+from services import rate_limit
+
+
+def request_from(host: str, forwarded_for: str) -> Request:
+    return Request({
+        "type": "http",
+        "headers": [(b"x-forwarded-for", forwarded_for.encode())],
+        "client": (host, 12345),
+    })
+
+
+@pytest.mark.parametrize("value", ["", "0", "false", "no"])
+def test_proxy_headers_are_not_trusted_unless_enabled(monkeypatch, value):
+    monkeypatch.setenv("TRUST_PROXY_HEADERS", value)
+    importlib.reload(rate_limit)
+
+    assert rate_limit.client_ip(request_from("10.0.0.1", "1.2.3.4")) == "10.0.0.1"
+
+
+def test_trusted_proxy_header_uses_the_address_the_proxy_saw(monkeypatch):
+    monkeypatch.setenv("TRUST_PROXY_HEADERS", "true")
+    importlib.reload(rate_limit)
+
+    assert rate_limit.client_ip(request_from("10.0.0.1", "1.2.3.4, 5.6.7.8")) == "5.6.7.8"
+
+
+@pytest.fixture(autouse=True)
+def reload_rate_limit(monkeypatch):
+    yield
+    monkeypatch.undo()
+    importlib.reload(rate_limit)
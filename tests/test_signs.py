@@ -0,0 +1,30 @@
+"""
+Sign checks must not trust signs another worker has deleted
+"""
+
+import pytest
+from sqlmodel import Session
+
+import database as db
+from entities.database_entities import Signs
+from services.sign_vocabulary import SignVocabulary
+
+
+def test_deleted_sign_in_the_vocabulary_is_reported_missing(engine, monkeypatch):
+    vocabulary = SignVocabulary()
+    monkeypatch.setattr(db, "sign_vocabulary", vocabulary)
+
+    with Session(engine) as session:
+        session.add(Signs(sign="hello", image_path="hello.png"))
+        session.commit()
+        vocabulary.reload(session)
+
+        # deleted through another worker, so this worker's vocabulary still has it
+        vocabulary.put("goodbye", "goodbye.png")
+
+        assert db.find_missing_signs(session=session, signs=["hello", "goodbye", None]) == {"goodbye"}
+        with pytest.raises(db.EntityNotFoundException):
+            db._check_signs(session=session, signs=["hello", "goodbye"])
+
+    assert "hello" in vocabulary
+    assert "goodbye" not in vocabulary
@@ -0,0 +1,70 @@
+"""
+Concurrent xp updates for the same user and day must all be counted
+"""
+
+import threading
+from datetime import date, timedelta
+
+from sqlmodel import Session, select
+
+import database as db
+from entities.database_entities import UserXP, Users
+
+
+THREADS = 8
+UPDATES_PER_THREAD = 25
+AMOUNT = 10
+
+
+def test_concurrent_updates_are_not_lost(engine):
+    start = threading.Barrier(THREADS)
+    errors = []
+
+    def add_xp() -> None:
+        try:
+            with Session(engine) as session:
+                user = session.get(Users, 1)
+                start.wait()
+                for _ in range(UPDATES_PER_THREAD):
+                    db.update_user_xp(session=session, user=user, amount=AMOUNT)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add_xp) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+    expected = THREADS * UPDATES_PER_THREAD * AMOUNT
+    with Session(engine) as session:
+        user = session.get(Users, 1)
+        daily_xp = session.exec(select(UserXP.xp).where(UserXP.user_id == 1).where(UserXP.day == date.today())).one()
+
+    assert user.total_xp == expected
+    assert daily_xp == expected
+    assert user.days_logged == 1
+    assert user.current_streak == 1
+
+
+def test_late_batch_for_an_earlier_day_keeps_last_xp_day(engine):
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+
+    with Session(engine) as session:
+        db.add_xp_batch(session, {(1, today): AMOUNT})
+        session.commit()
+        db.add_xp_batch(session, {(1, yesterday): AMOUNT})
+        session.commit()
+        db.add_xp_batch(session, {(1, today): AMOUNT})
+        session.commit()
+
+        user = session.get(Users, 1)
+        session.refresh(user)
+
+    assert user.last_xp_day == today
+    assert user.total_xp == 3 * AMOUNT
+    assert user.days_logged == 1
+    assert user.current_streak == 1
@@ -0,0 +1,25 @@
+"""
+Reads through the write-behind xp buffer must count every increment exactly once
+"""
+
+from sqlmodel import Session
+
+from entities.database_entities import Users
+from services.xp_buffer import XpBuffer
+
+
+def test_read_after_flush_with_a_stale_user_row(engine):
+    xp_buffer = XpBuffer(flush_interval=60, flush_threshold=1000)
+
+    with Session(engine) as session:
+        xp_buffer.add(session=session, user=session.get(Users, 1), amount=10)
+
+    with Session(engine) as session:
+        # loaded before the flush, as get_current_user does at the start of a request
+        user = session.get(Users, 1)
+        assert xp_buffer.flush() == 1
+
+        response = xp_buffer.get_user_xp(session=session, user=user)
+
+    assert response.total_xp == 10
+    assert response.daily_xp == 10